@@ -1,174 +1,395 @@
-import wave
-import struct
-import os
-import glob
-import zlib
-from PIL import Image
-
-# ---------- CONFIG ----------
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-OUT_FOLDER = os.path.join(SCRIPT_DIR, "wav_output")
-
-# QUALITY SETTINGS - Choose one:
-QUALITY_MODE = "HIGH"  # Options: "LOW" (256), "MEDIUM" (512), "HIGH" (1024), "MAX" (2048), "ORIGINAL" (no resize)
-
-QUALITY_SETTINGS = {
-    "LOW": 256,
-    "MEDIUM": 512,
-    "HIGH": 1024,
-    "MAX": 2048,
-    "ORIGINAL": None  # No resizing
-}
-
-MAX_SIZE = QUALITY_SETTINGS[QUALITY_MODE]
-
-# COMPRESSION SETTINGS
-ENABLE_COMPRESSION = True  # Set to False to disable compression
-COMPRESSION_LEVEL = 9  # 0-9, where 9 is maximum compression (slower but smallest)
-
-SAMPLE_RATE = 44100
-CHANNELS = 1
-SAMPLE_WIDTH = 2
-
-# Supported image extensions (PIL can open these)
-SUPPORTED_EXTENSIONS = [
-    '*.png', '*.jpg', '*.jpeg', '*.bmp', '*.gif', 
-    '*.tiff', '*.tif', '*.webp', '*.ico', '*.ppm',
-    '*.pgm', '*.pbm', '*.pnm', '*.dib', '*.eps',
-    '*.im', '*.msp', '*.pcx', '*.sgi', '*.tga',
-    '*.xbm'
-]
-
-os.makedirs(OUT_FOLDER, exist_ok=True)
-
-# ---------- ENCODING ----------
-def encode_header(width, height, original_width, original_height, is_compressed, uncompressed_size):
-    """
-    Encode header with metadata
-    Format: 4 uint16 (dimensions) + 1 byte (compression flag) + 1 uint32 (uncompressed size) = 13 bytes
-    """
-    header = struct.pack('<HHHH', width, height, original_width, original_height)
-    header += struct.pack('B', 1 if is_compressed else 0)
-    header += struct.pack('<I', uncompressed_size)
-    return header
-
-# ---------- FIND IMAGE FILES ----------
-image_files = []
-for ext in SUPPORTED_EXTENSIONS:
-    pattern = os.path.join(SCRIPT_DIR, ext)
-    image_files.extend(glob.glob(pattern))
-    # Also check uppercase extensions
-    pattern_upper = os.path.join(SCRIPT_DIR, ext.upper())
-    image_files.extend(glob.glob(pattern_upper))
-
-# Remove duplicates
-image_files = list(set(image_files))
-
-if not image_files:
-    print(f"No supported image files found in: {SCRIPT_DIR}")
-    print(f"Supported formats: {', '.join([ext.replace('*.', '').upper() for ext in SUPPORTED_EXTENSIONS[:10]])}...")
-    exit()
-
-print(f"Found {len(image_files)} image file(s)")
-print(f"Quality Mode: {QUALITY_MODE}")
-print(f"Compression: {'ENABLED (level ' + str(COMPRESSION_LEVEL) + ')' if ENABLE_COMPRESSION else 'DISABLED'}")
-print("-" * 50)
-
-# ---------- ENCODE EACH IMAGE ----------
-successful = 0
-failed = 0
-
-for image_file in image_files:
-    print(f"\nEncoding: {os.path.basename(image_file)}")
-    
-    try:
-        # Load image and convert to RGB (handles all formats including RGBA, grayscale, etc.)
-        img = Image.open(image_file)
-        
-        # Handle transparency/alpha channels
-        if img.mode in ('RGBA', 'LA', 'P'):
-            # Create white background
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        else:
-            img = img.convert("RGB")
-        
-        original_w, original_h = img.size
-        
-        print(f"  Original size: {original_w}x{original_h} pixels")
-        
-        # Resize if needed
-        if MAX_SIZE is not None:
-            img.thumbnail((MAX_SIZE, MAX_SIZE), Image.Resampling.LANCZOS)
-            w, h = img.size
-            print(f"  Encoded size: {w}x{h} pixels")
-        else:
-            w, h = original_w, original_h
-            print(f"  Encoded size: ORIGINAL (no resize)")
-        
-        # Build pixel data
-        pixel_data = bytearray()
-        pixel_count = 0
-        
-        for y in range(h):
-            for x in range(w):
-                r, g, b = img.getpixel((x, y))
-                pixel_data.extend(struct.pack('BBB', r, g, b))
-                pixel_count += 1
-        
-        uncompressed_size = len(pixel_data)
-        
-        # Compress pixel data if enabled
-        if ENABLE_COMPRESSION:
-            compressed_data = zlib.compress(bytes(pixel_data), level=COMPRESSION_LEVEL)
-            compression_ratio = (len(compressed_data) / uncompressed_size) * 100
-            print(f"  ✓ Compressed: {uncompressed_size:,} → {len(compressed_data):,} bytes ({compression_ratio:.1f}%)")
-            final_data = compressed_data
-        else:
-            final_data = pixel_data
-        
-        # Create WAV file
-        base_name = os.path.splitext(os.path.basename(image_file))[0]
-        out_file = os.path.join(OUT_FOLDER, f"{base_name}_encoded.wav")
-        
-        with wave.open(out_file, 'wb') as wav:
-            wav.setnchannels(CHANNELS)
-            wav.setsampwidth(SAMPLE_WIDTH)
-            wav.setframerate(SAMPLE_RATE)
-            
-            # Build audio data: header + compressed/uncompressed pixel data
-            audio_data = bytearray()
-            audio_data.extend(encode_header(w, h, original_w, original_h, ENABLE_COMPRESSION, uncompressed_size))
-            audio_data.extend(final_data)
-            
-            # Pad to even length if needed
-            if len(audio_data) % 2 != 0:
-                audio_data.append(0)
-            
-            # Write to WAV
-            wav.writeframes(bytes(audio_data))
-        
-        # Stats
-        file_size = os.path.getsize(out_file)
-        original_size = original_w * original_h * 3
-        
-        print(f"  ✓ Encoded {pixel_count:,} pixels")
-        print(f"  ✓ File size: {file_size:,} bytes ({file_size/1024:.1f} KB)")
-        if ENABLE_COMPRESSION:
-            savings = ((original_size - file_size) / original_size) * 100
-            print(f"  ✓ Space saved vs uncompressed: {savings:.1f}%")
-        print(f"  ✓ Saved: {out_file}")
-        
-        successful += 1
-        
-    except Exception as e:
-        print(f"  ✗ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        failed += 1
-
-print("\n" + "=" * 50)
-print(f"Encoding complete! Success: {successful} | Failed: {failed}")
\ No newline at end of file
+import argparse
+import contextlib
+import dataclasses
+import os
+import sys
+from archive import ArchiveWriter, remove_entries
+from batch import run_batch
+from manifest import Manifest, archive_output
+from profiling import RunStats, cprofile_to
+from animation import FRAME_DELTAS
+from compression import AUTO, AUTO_TIME_BUDGET, codec_names, parse_level_target
+from discovery import IMAGE_EXTENSIONS, iter_files
+from filters import FILTER_NAMES
+from palette import PALETTE_OPTIONS
+from wav_codec import (QUALITY_SETTINGS, RESIZE_MODES, EncodeOptions, encode_image_bytes, encode_image_file,
+                       encode_image_payload)
+from wav_stream import stream_encode_image_file
+
+# ---------- CONFIG ----------
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+OUT_FOLDER = os.path.join(SCRIPT_DIR, "wav_output")
+
+# QUALITY SETTINGS - Choose one:
+QUALITY_MODE = "HIGH"  # Options: "LOW" (256), "MEDIUM" (512), "HIGH" (1024), "MAX" (2048), "ORIGINAL" (no resize)
+
+MAX_SIZE = QUALITY_SETTINGS[QUALITY_MODE]
+
+# RESIZE - how sources are shrunk to MAX_SIZE:
+# "exact" = decode at full resolution, then Lanczos (reference output)
+# "fast"  = JPEGs decode at 1/2-1/8 scale, whole factors are averaged away with
+#           reduce(), and Lanczos only runs on the last step. Much faster on
+#           large camera JPEGs and nearly identical; compare with
+#           benchmark.py --resize-check
+RESIZE_MODE = "exact"
+
+# COMPRESSION SETTINGS
+ENABLE_COMPRESSION = True  # Set to False to disable compression
+COMPRESSION_LEVEL = 9  # 0-9, where 9 is maximum compression (slower but smallest), or "auto"
+# With "auto" a few sampled strips are compressed at several levels to pick one per image:
+# "gain:N" = a higher level must save N bytes per extra CPU millisecond,
+# "speed:N" = smallest output at N MB/s or faster, "ratio:N" = fastest level reaching N x input size
+LEVEL_TARGET = "gain:256"
+COMPRESSION_CODEC = "zlib"  # "zlib", "bz2", "lzma", "none" (+ "zstd"/"brotli" if installed) or "auto"
+AUTO_BUDGET = AUTO_TIME_BUDGET  # Seconds per image "auto" may spend compressing
+
+# FILTERING - PNG-style row prediction before compression (needs NumPy).
+# "adaptive" picks Sub/Up/Average/Paeth per row; with it level 6 usually beats
+# unfiltered level 9 in both size and speed. PLANAR stores R, G and B separately.
+FILTER = "none"  # "none", "adaptive", "sub", "up", "average", "paeth"
+PLANAR = False
+
+# PIXEL MODE - grayscale and alpha images are stored natively as L, LA or RGBA
+# (1 to 4 bytes per pixel). FLATTEN = True composites everything onto white and
+# stores RGB, as older releases did.
+FLATTEN = False
+
+# PALETTE - images with at most 256 colors (screenshots, diagrams, masks) are
+# stored as a color table plus 1/2/4/8-bit indices, several times smaller before
+# compression. "quantize" reduces every image to 256 colors first (lossy).
+PALETTE = "auto"  # "off", "auto", "quantize"
+
+# ANIMATION - animated GIF/WebP/PNG and multi-page TIFF keep every frame and its
+# duration. Frames between keyframes are stored as a XOR ("xor") or byte-wise
+# difference ("sub") against the previous frame, so only what moves costs space;
+# a keyframe every KEYFRAME_INTERVAL frames keeps single-frame extraction quick.
+ENABLE_ANIMATION = True  # False stores only the first frame
+FRAME_DELTA = "xor"  # "xor", "sub"
+KEYFRAME_INTERVAL = 30
+
+# PREVIEW PYRAMID - embed small downscaled copies ahead of the full image so
+# decode_to_image.py --preview only reads the first few KB of each file
+ENABLE_PYRAMID = False
+
+# STREAMING - encode in row strips with bounded memory (same output file format)
+ENABLE_STREAMING = QUALITY_MODE == "ORIGINAL"
+
+# LAYOUT - store rows in independently compressed strips (versioned format) for
+# parallel and region decoding, e.g. 64. None stores the whole image as one strip.
+STRIP_ROWS = None
+
+# ARCHIVE - append every image to this single WAV in OUT_FOLDER (e.g. "images.wav")
+# instead of writing one <name>_encoded.wav each; entries are indexed by file name.
+# Archive entries always use the in-memory encoder. With INCREMENTAL, entries of
+# deleted images are dropped from the index (their bytes are not reclaimed).
+ARCHIVE_NAME = None
+
+# PARALLELISM - worker processes for batch encoding (0 = one per CPU core)
+JOBS = 1
+# Threads compressing one image (its strips, or blocks of one large zlib strip)
+THREADS = 1
+
+# INCREMENTAL - skip images already encoded with the same settings (tracked in a
+# manifest in OUT_FOLDER) and delete outputs of images that no longer exist
+INCREMENTAL = True
+
+# PROFILING - print per-stage timings (open, convert, resize, pack, compress, write, ...)
+PROFILE = False
+
+# Supported image extensions (PIL can open these), matched case-insensitively
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS
+
+# ---------- FIND IMAGE FILES ----------
+def find_image_files(paths=(SCRIPT_DIR,), recursive=False, include=(), exclude=()):
+    """
+    Yield (path, subfolder) for every supported image under paths, in one scandir pass per folder
+    """
+    return iter_files(paths, SUPPORTED_EXTENSIONS, include, exclude, recursive)
+
+# ---------- REPORT ----------
+def print_result(result, max_size=MAX_SIZE):
+    original_w, original_h = result.original_size
+    w, h = result.encoded_size
+    
+    print(f"  Original size: {original_w}x{original_h} pixels")
+    if max_size is not None:
+        print(f"  Encoded size: {w}x{h} pixels")
+    else:
+        print(f"  Encoded size: ORIGINAL (no resize)")
+    
+    print(f"  ✓ Pixel mode: {result.mode}")
+    if result.palette_colors is not None:
+        print(f"  ✓ Palette: {result.palette_colors} colors, {result.index_bits}-bit indices")
+    if result.frame_count > 1:
+        print(f"  ✓ Animation: {result.frame_count} frames ({result.keyframe_count} keyframe(s))")
+    if result.codec_auto:
+        print(f"  ✓ Codec: {result.codec} (auto)")
+    if result.filter != "none":
+        print(f"  ✓ Filter: {result.filter}")
+    if result.level_auto and result.level is not None:
+        print(f"  ✓ Level: {result.level} (auto)")
+    if result.compressed_size is not None:
+        compression_ratio = (result.compressed_size / result.uncompressed_size) * 100
+        print(f"  ✓ Compressed ({result.codec}): {result.uncompressed_size:,} → {result.compressed_size:,} bytes ({compression_ratio:.1f}%)")
+    
+    # Stats
+    file_size = result.file_size
+    original_size = original_w * original_h * len(result.mode) * result.frame_count
+    
+    print(f"  ✓ Encoded {result.pixel_count:,} pixels")
+    print(f"  ✓ File size: {file_size:,} bytes ({file_size/1024:.1f} KB)")
+    if result.compressed_size is not None:
+        savings = ((original_size - file_size) / original_size) * 100
+        print(f"  ✓ Space saved vs uncompressed: {savings:.1f}%")
+    print(f"  ✓ Saved: {result.out_file}")
+
+def parse_level(value):
+    return value if value == AUTO else int(value)
+
+def encode_settings(options, streaming, archive=None):
+    """
+    Settings recorded in the manifest; a change in any of them re-encodes an image
+    """
+    # Threads may split zlib blocks differently but never change the decoded
+    # pixels, so they don't invalidate earlier results
+    settings = dataclasses.asdict(options)
+    settings.pop("threads")
+    settings["streaming"] = streaming
+    settings["archive"] = archive
+    return settings
+
+# ---------- BATCH ----------
+def make_options(args):
+    return EncodeOptions(
+        max_size=QUALITY_SETTINGS[args.quality],
+        resize=args.resize,
+        enable_compression=args.compression,
+        compression_level=args.level,
+        level_target=args.level_target,
+        codec=args.codec,
+        time_budget=args.time_budget,
+        strip_rows=args.strip_rows,
+        threads=args.threads,
+        filter=args.filter,
+        planar=args.planar,
+        pyramid=args.pyramid,
+        flatten=args.flatten,
+        palette=args.palette,
+        animation=args.animation,
+        frame_delta=args.frame_delta,
+        keyframe_interval=args.keyframe_interval,
+    )
+
+def default_args(**overrides):
+    """
+    Encoder arguments as given by an empty command line (the CONFIG section), with overrides applied
+    Returns: argparse.Namespace for make_options
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    add_encode_arguments(parser)
+    args = parser.parse_args([])
+    for name, value in overrides.items():
+        if not hasattr(args, name):
+            raise TypeError(f"unknown encoder argument {name!r}")
+        setattr(args, name, value)
+    return args
+
+def encode_into(item, out_root, encode, options):
+    """
+    Encode one (path, subfolder) item into the same subfolder of out_root (batch worker)
+    """
+    image_file, subfolder = item
+    out_dir = os.path.join(out_root, subfolder)
+    os.makedirs(out_dir, exist_ok=True)
+    return encode(image_file, out_dir, options)
+
+def encode_payload(item, options):
+    return encode_image_payload(item[0], options)
+
+def entry_name(item):
+    image_file, subfolder = item
+    return "/".join(subfolder.split(os.sep) + [os.path.basename(image_file)]) if subfolder else os.path.basename(image_file)
+
+def encode_files(items, out_folder, args):
+    """
+    Encode (path, subfolder) items into out_folder as they arrive
+    items may be a lazy discovery generator: encoding starts with the first
+    file found. Returns: (successful, skipped, failed)
+    """
+    os.makedirs(out_folder, exist_ok=True)
+    
+    manifest = Manifest(out_folder)
+    # Archive entries of deleted images leave the index; the archive itself stays
+    pruned = manifest.prune(remove_entries)
+    for out_file in pruned:
+        print(f"Pruned: {os.path.relpath(out_file, out_folder)} (source deleted)")
+    manifest.save()
+    
+    streaming = args.streaming and not args.archive
+    print(f"Quality Mode: {args.quality}{' (' + args.resize + ' resize)' if QUALITY_SETTINGS[args.quality] else ''}")
+    print(f"Compression: {'ENABLED (' + args.codec + ', level ' + str(args.level) + ')' if args.compression else 'DISABLED'}")
+    print(f"Filter: {args.filter}{' (planar)' if args.planar else ''}")
+    print(f"Pixel mode: {'RGB (flattened)' if args.flatten else 'native (L/LA/RGB/RGBA)'}")
+    print(f"Palette: {args.palette}")
+    print(f"Animation: {'ENABLED (' + args.frame_delta + ' deltas, keyframe every ' + str(args.keyframe_interval) + ')' if args.animation else 'DISABLED (first frame only)'}")
+    print(f"Preview pyramid: {'ENABLED' if args.pyramid else 'DISABLED'}")
+    print(f"Streaming: {'ENABLED' if streaming else 'DISABLED'}")
+    if args.archive:
+        print(f"Archive: {args.archive}")
+    print(f"Layout: {str(args.strip_rows) + '-row strips' if args.strip_rows else 'single stream'}")
+    print("-" * 50)
+    
+    # ---------- ENCODE EACH IMAGE ----------
+    successful = 0
+    skipped = 0
+    failed = 0
+    
+    options = make_options(args)
+    encode = stream_encode_image_file if streaming else encode_image_file
+    settings = encode_settings(options, streaming, args.archive)
+    
+    def pending():
+        # Runs lazily inside the batch, so unchanged files are skipped as they are found
+        nonlocal skipped
+        for item in items:
+            if not args.force and manifest.is_current(item[0], settings):
+                skipped += 1
+                continue
+            yield item
+    
+    if args.archive:
+        # Workers return payloads; only this process writes to the archive
+        archive_file = os.path.join(out_folder, args.archive)
+        results = run_batch(encode_payload, pending(), args.jobs, options)
+        writer = ArchiveWriter(archive_file)
+    else:
+        results = run_batch(encode_into, pending(), args.jobs, out_folder, encode, options)
+        writer = contextlib.nullcontext()
+    stats = RunStats()
+    profiler = cprofile_to(args.cprofile) if args.cprofile else contextlib.nullcontext()
+    
+    # Results arrive in completion order
+    try:
+        with profiler, writer:
+            for item, result, error in results:
+                image_file = item[0]
+                print(f"\nEncoding: {os.path.basename(image_file)}")
+                
+                if error is None and args.archive:
+                    payload, result = result
+                    writer.add(entry_name(item), payload, result)
+                    result.out_file = f"{archive_file}:{entry_name(item)}"
+                
+                if error is None:
+                    print_result(result, options.max_size)
+                    if args.archive:
+                        manifest.record(image_file, [archive_output(archive_file, entry_name(item))], settings,
+                                        archive_file)
+                    else:
+                        manifest.record(image_file, [result.out_file], settings)
+                    stats.add(image_file, result.timings)
+                    successful += 1
+                else:
+                    print(f"  ✗ Error: {error.strip().splitlines()[-1]}")
+                    print(error, end="")
+                    manifest.forget(image_file)
+                    failed += 1
+    finally:
+        manifest.save()
+    
+    if successful + skipped + failed == 0:
+        print("No supported image files found")
+        print(f"Supported formats: {', '.join(ext[1:].upper() for ext in SUPPORTED_EXTENSIONS[:10])}...")
+        return successful, skipped, failed
+    
+    print("\n" + "=" * 50)
+    print(f"Encoding complete! Success: {successful} | Skipped: {skipped} | Failed: {failed}")
+    if pruned:
+        print(f"Pruned {len(pruned)} output(s) of deleted images")
+    
+    if args.profile:
+        print(f"\nStage timings ({len(stats.files)} file(s)):")
+        for line in stats.format_summary():
+            print(f"  {line}")
+    if args.profile_out:
+        stats.export(args.profile_out)
+        print(f"✓ Stage timings saved: {args.profile_out}")
+    return successful, skipped, failed
+
+# ---------- PIPES ----------
+def encode_pipe(source, dest, args, name="<stdin>"):
+    """
+    Encode one image read from a binary file (e.g. stdin) into a WAV written to dest (e.g. stdout)
+    The report goes to stderr, so dest can be piped on.
+    """
+    data, result = encode_image_bytes(source, make_options(args), name)
+    dest.write(data)
+    dest.flush()
+    result.out_file = getattr(dest, "name", "<stdout>")
+    with contextlib.redirect_stdout(sys.stderr):
+        print(f"Encoding: {name}")
+        print_result(result, QUALITY_SETTINGS[args.quality])
+    return result
+
+# ---------- MAIN ----------
+def add_encode_arguments(parser):
+    """
+    Encoder options shared with sonicraster.py (defaults from the CONFIG section above)
+    """
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS,
+                        help="worker processes to use (0 = one per CPU core, default: %(default)s)")
+    parser.add_argument("--quality", choices=QUALITY_SETTINGS, default=QUALITY_MODE,
+                        help="longest side of the stored image (default: %(default)s)")
+    parser.add_argument("--resize", choices=RESIZE_MODES, default=RESIZE_MODE,
+                        help="exact: full decode + Lanczos; fast: JPEG draft + reduce() first (default: %(default)s)")
+    parser.add_argument("--strip-rows", type=int, default=STRIP_ROWS,
+                        help="store independently compressed strips of N rows (versioned format)")
+    parser.add_argument("--threads", type=int, default=THREADS,
+                        help="threads compressing one image: its strips, or blocks of a single large strip (zlib) (default: %(default)s)")
+    parser.add_argument("--codec", choices=codec_names() + [AUTO], default=COMPRESSION_CODEC,
+                        help="compression backend (default: %(default)s)")
+    parser.add_argument("--level", type=parse_level, default=COMPRESSION_LEVEL,
+                        help="compression level, or \"auto\" to tune it per image (default: %(default)s)")
+    parser.add_argument("--level-target", type=parse_level_target, default=LEVEL_TARGET,
+                        help="auto level goal: gain:BYTES_PER_MS, speed:MB_PER_S or ratio:FRACTION (default: %(default)s)")
+    parser.add_argument("--time-budget", type=float, default=AUTO_BUDGET,
+                        help="seconds per image the auto codec may spend compressing (default: %(default)s)")
+    parser.add_argument("--no-compression", dest="compression", action="store_false", default=ENABLE_COMPRESSION,
+                        help="store pixels uncompressed")
+    parser.add_argument("--filter", choices=FILTER_NAMES, default=FILTER,
+                        help="row prediction filter applied before compression (default: %(default)s)")
+    parser.add_argument("--planar", action="store_true", default=PLANAR,
+                        help="store the R, G and B planes separately")
+    parser.add_argument("--flatten", action="store_true", default=FLATTEN,
+                        help="store RGB composited onto white instead of the native pixel mode")
+    parser.add_argument("--palette", choices=PALETTE_OPTIONS, default=PALETTE,
+                        help="store low-color images as palette indices; quantize reduces all images to 256 colors (default: %(default)s)")
+    parser.add_argument("--animation", action=argparse.BooleanOptionalAction, default=ENABLE_ANIMATION,
+                        help="store every frame of animated images (default: %(default)s)")
+    parser.add_argument("--frame-delta", choices=FRAME_DELTAS, default=FRAME_DELTA,
+                        help="how frames between keyframes are stored (default: %(default)s)")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL, metavar="N",
+                        help="store a full keyframe every N frames (default: %(default)s)")
+    parser.add_argument("--pyramid", action="store_true", default=ENABLE_PYRAMID,
+                        help="embed downscaled preview levels for fast thumbnail decoding")
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=ENABLE_STREAMING,
+                        help="encode in row strips with bounded memory (default: %(default)s)")
+    parser.add_argument("--archive", metavar="NAME", default=ARCHIVE_NAME,
+                        help="append all images to one archive WAV in the output folder")
+    parser.add_argument("--force", action="store_true", default=not INCREMENTAL,
+                        help="re-encode every image even if it is unchanged")
+    parser.add_argument("--profile", action="store_true", default=PROFILE,
+                        help="print a per-stage timing summary at the end")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="export per-file stage timings to FILE (.json or .csv)")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="run under cProfile and save the stats to FILE (use with -j 1)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode images into WAV files")
+    add_encode_arguments(parser)
+    args = parser.parse_args()
+    encode_files(find_image_files(), OUT_FOLDER, args)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
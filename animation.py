@@ -0,0 +1,126 @@
+"""
+Multi-frame (animated) payloads
+
+The first frame of an animation is stored exactly like a still image, in
+the payload's strips, so every single-image reader (previews, regions, the
+streaming decoder, the catalog) sees it. The other frames follow the strips
+as one compressed block each. A keyframe block holds the frame's packed
+(and row-filtered) pixels; every other block holds the frame XORed with, or
+subtracted byte-wise from, the previous frame, which turns everything that
+did not move into runs of zeros before compression.
+
+A keyframe every KEYFRAME_INTERVAL frames bounds the work needed to reach
+any frame: decoding starts at the nearest keyframe at or before it.
+"""
+import struct
+from dataclasses import dataclass
+from typing import List
+
+from PIL import Image, ImageChops
+
+# ---------- CONFIG ----------
+KEYFRAME_INTERVAL = 30  # Frames between keyframes (1 = every frame is a keyframe)
+DEFAULT_DURATION = 100  # Milliseconds, for frames that don't say
+
+KEY = 0
+XOR = 1
+SUB = 2
+FRAME_DELTAS = {"xor": XOR, "sub": SUB}
+FRAME_KIND_NAMES = {KEY: "key", XOR: "xor", SUB: "sub"}
+
+FRAME_TABLE = struct.Struct('<HI')  # loop count (0 = forever), frame count (one FRAME_ENTRY per frame follows)
+FRAME_ENTRY = struct.Struct('<IBI')  # duration in ms, kind, stored length (0 for the first frame, kept in the strips)
+
+
+@dataclass
+class FrameSequence:
+    """
+    Decoded frames of an animated source, all the same size and mode
+    """
+    images: list
+    durations: List[int]
+    loop: int = 0
+
+
+@dataclass
+class FrameInfo:
+    duration: int
+    kind: int
+    offset: int = 0
+    length: int = 0
+
+    @property
+    def is_key(self):
+        return self.kind == KEY
+
+
+def frame_kinds(count, interval=KEYFRAME_INTERVAL, delta="xor"):
+    """
+    Kind of every frame: a keyframe every `interval` frames, deltas in between
+    """
+    interval = max(interval, 1)
+    return [KEY if i % interval == 0 else FRAME_DELTAS[delta] for i in range(count)]
+
+
+def encode_frame_table(loop, frames):
+    """
+    Encode the frame record from (duration, kind, stored length) tuples
+    """
+    return FRAME_TABLE.pack(loop, len(frames)) + b''.join(FRAME_ENTRY.pack(*frame) for frame in frames)
+
+
+def decode_frame_table(data, offset):
+    """
+    Parse the frame record; offset is where the block of the second frame starts
+    Returns: (loop, list of FrameInfo)
+    """
+    loop, count = FRAME_TABLE.unpack_from(data)
+    frames = []
+    for i in range(count):
+        duration, kind, length = FRAME_ENTRY.unpack_from(data, FRAME_TABLE.size + i * FRAME_ENTRY.size)
+        if kind not in FRAME_KIND_NAMES:
+            raise ValueError(f"Unsupported frame kind: {kind}")
+        if i == 0:
+            frames.append(FrameInfo(duration, KEY))
+            continue
+        frames.append(FrameInfo(duration, kind, offset, length))
+        offset += length
+    return loop, frames
+
+
+def keyframe_before(frames, index):
+    return next(i for i in range(index, -1, -1) if frames[i].is_key)
+
+
+# ---------- DELTAS ----------
+def _as_image(data, row_bytes):
+    return Image.frombuffer("L", (row_bytes, len(data) // row_bytes), bytes(data), 'raw', "L", 0, 1)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def delta_encode(data, previous, kind, row_bytes):
+    """
+    Express one frame's packed rows relative to the previous frame's
+    """
+    if kind == XOR:
+        np = _numpy()
+        if np is None:
+            return (int.from_bytes(data, 'little') ^ int.from_bytes(previous, 'little')).to_bytes(len(data), 'little')
+        return np.bitwise_xor(np.frombuffer(data, np.uint8), np.frombuffer(previous, np.uint8)).tobytes()
+    return ImageChops.subtract_modulo(_as_image(data, row_bytes), _as_image(previous, row_bytes)).tobytes()
+
+
+def delta_decode(data, previous, kind, row_bytes):
+    """
+    Rebuild a frame's packed rows from its delta and the previous frame's rows
+    """
+    if kind == XOR:
+        return delta_encode(data, previous, XOR, row_bytes)
+    return ImageChops.add_modulo(_as_image(data, row_bytes), _as_image(previous, row_bytes)).tobytes()
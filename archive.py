@@ -0,0 +1,275 @@
+"""
+Multi-image archive WAV: many encoded images in one data chunk
+
+The data chunk starts with a small archive header, followed by the payload
+of every entry back to back (each exactly what <name>_encoded.wav would
+hold), then the index and a fixed-size footer that points at it. Listing an
+archive reads only the footer and the index; extracting an entry touches
+only its own byte range.
+
+Appending writes the new payloads, a new index and a new footer after the
+current end of the data chunk and only then grows the RIFF sizes, so an
+interrupted append leaves the previous archive readable.
+"""
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+
+import compression
+from output import OutputProfile
+from profiling import StageTimer
+from wav_codec import (
+    WavPayload, find_data_chunk, write_wav, decoded_output_name, _decode_payload_to_file,
+)
+
+ARCHIVE_MAGIC = b'SRWA'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('<4sB3x')  # magic, version
+ARCHIVE_FOOTER = struct.Struct('<QI4s')  # index offset, index length, magic; always the last bytes of the data
+INDEX_COUNT = struct.Struct('<I')
+# offset, length, width, height, original width, original height, codec id, name length (UTF-8 name follows)
+INDEX_ENTRY = struct.Struct('<QIHHHHBH')
+
+RIFF_LIMIT = 0xFFFFFFFF
+
+
+@dataclass
+class ArchiveEntry:
+    """
+    One image in an archive; offset is relative to the start of the data chunk
+    """
+    name: str
+    offset: int
+    length: int
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    codec: int
+
+    @property
+    def codec_name(self):
+        return compression.get_codec(self.codec).name
+
+
+# ---------- INDEX ----------
+def encode_index(entries):
+    parts = [INDEX_COUNT.pack(len(entries))]
+    for entry in entries:
+        name = entry.name.encode('utf-8')
+        parts.append(INDEX_ENTRY.pack(entry.offset, entry.length, entry.width, entry.height,
+                                      entry.original_width, entry.original_height, entry.codec, len(name)))
+        parts.append(name)
+    return b''.join(parts)
+
+
+def decode_index(data):
+    (count,) = INDEX_COUNT.unpack_from(data)
+    pos = INDEX_COUNT.size
+    entries = []
+    for _ in range(count):
+        offset, length, w, h, original_w, original_h, codec, name_length = INDEX_ENTRY.unpack_from(data, pos)
+        pos += INDEX_ENTRY.size
+        name = bytes(data[pos:pos + name_length]).decode('utf-8')
+        pos += name_length
+        entries.append(ArchiveEntry(name, offset, length, w, h, original_w, original_h, codec))
+    return entries
+
+
+def is_archive(data):
+    return len(data) >= ARCHIVE_HEADER.size + ARCHIVE_FOOTER.size and bytes(data[:4]) == ARCHIVE_MAGIC
+
+
+def read_index(data):
+    """
+    Parse the index of an archive data chunk
+    Returns: (entries, index offset)
+    """
+    if not is_archive(data):
+        raise ValueError("not a SonicRaster archive")
+    _, version = ARCHIVE_HEADER.unpack_from(data)
+    if version != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive version: {version}")
+
+    index_offset, index_length, magic = ARCHIVE_FOOTER.unpack_from(data, len(data) - ARCHIVE_FOOTER.size)
+    if magic != ARCHIVE_MAGIC or index_offset + index_length > len(data) - ARCHIVE_FOOTER.size:
+        raise ValueError("archive footer is damaged")
+    return decode_index(data[index_offset:index_offset + index_length]), index_offset
+
+
+# ---------- READING ----------
+class Archive:
+    """
+    Read-only view of an archive WAV (memory-mapped like WavPayload)
+    Use as a context manager and drop any views from payload() before it exits.
+    """
+
+    def __init__(self, archive_file):
+        self.archive_file = archive_file
+        self._payload = WavPayload(archive_file)
+        try:
+            entries, _ = read_index(self._payload.data)
+        except BaseException:
+            self._payload.close()
+            raise
+        # A name appended again replaces the earlier entry
+        self.entries = {entry.name: entry for entry in entries}
+
+    def payload(self, name):
+        try:
+            entry = self.entries[name]
+        except KeyError:
+            raise KeyError(f"{name!r} is not in {os.path.basename(self.archive_file)}") from None
+        return self._payload.data[entry.offset:entry.offset + entry.length]
+
+    def close(self):
+        self._payload.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def list_archive(archive_file):
+    """
+    Returns: list of ArchiveEntry, without decompressing anything
+    """
+    with Archive(archive_file) as archive:
+        return list(archive.entries.values())
+
+
+def entry_output_name(name, region=None, preview=False, ext="png", frame=None):
+    """
+    File an archive entry decodes to, relative to the output folder
+    The entry's extension stays part of the name (photo.jpg -> photo_jpg_decoded.png),
+    so entries that differ only in extension get different files, and the
+    subfolders of names like "sub/dir/file.ext" are kept.
+    """
+    *folders, file_name = name.split("/")
+    if any(folder in ("", ".", "..") for folder in folders) or file_name in ("", ".", ".."):
+        raise ValueError(f"Archive entry name {name!r} would leave the output folder")
+    stem, extension = os.path.splitext(file_name)
+    return os.path.join(*folders, decoded_output_name(f"{stem}_{extension[1:]}" if extension else stem,
+                                                      region, preview, ext, frame))
+
+
+def output_clashes(names, region=None, preview=False, ext="png", frame=None):
+    """
+    Groups of entry names that would decode to the same file
+    """
+    outputs = {}
+    for name in names:
+        outputs.setdefault(entry_output_name(name, region, preview, ext, frame), []).append(name)
+    return [group for group in outputs.values() if len(group) > 1]
+
+
+def extract_entry(name, archive_file, out_dir, region=None, threads=1, preview=None, profile=OutputProfile(),
+                  frame=None):
+    """
+    Decode one archive entry into <out_dir>/<name>_<ext>_decoded.png (same options as decode_wav_file)
+    Subfolders in the entry name are created under out_dir.
+    """
+    out_file = os.path.join(out_dir, entry_output_name(name, region, preview is not None, profile.extension, frame))
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    timer = StageTimer()
+
+    with timer.stage("read"):
+        archive = Archive(archive_file)
+    with archive:
+        return _decode_payload_to_file(archive.payload(name), f"{archive_file}:{name}", out_file,
+                                       region, threads, preview, timer, profile, frame)
+
+
+# ---------- WRITING ----------
+class ArchiveWriter:
+    """
+    Appends images to an archive WAV, creating it if needed
+    Entries are written as they are added; the index is written on close().
+    """
+
+    def __init__(self, archive_file):
+        self.archive_file = archive_file
+        if not os.path.exists(archive_file):
+            write_wav(archive_file, ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION)
+                      + encode_index([]) + ARCHIVE_FOOTER.pack(ARCHIVE_HEADER.size, INDEX_COUNT.size, ARCHIVE_MAGIC))
+
+        with open(archive_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            self.data_offset, data_length = find_data_chunk(buf)
+            with memoryview(buf) as view:
+                entries, _ = read_index(view[self.data_offset:self.data_offset + data_length])
+            data_end = self.data_offset + data_length
+            # Bytes past the data chunk that the RIFF size doesn't cover are what an
+            # interrupted append wrote before close() could commit it; anything the
+            # RIFF size does cover is a real chunk we can't append around
+            self.discarded = len(buf) - data_end
+            if self.discarded and struct.unpack_from('<I', buf, 4)[0] + 8 > data_end:
+                raise ValueError("archive data chunk must be the last chunk of the file")
+
+        self.entries = {entry.name: entry for entry in entries}
+        self.data_length = data_length
+        self.added = 0
+        self._file = open(archive_file, 'r+b')
+        if self.discarded:
+            self._file.truncate(data_end)
+        self._file.seek(data_end)
+
+    def add(self, name, payload, result):
+        """
+        Append one payload described by its EncodeResult under name
+        """
+        if self.data_offset + self.data_length + len(payload) > RIFF_LIMIT - (1 << 20):
+            raise ValueError("archive would exceed the 4 GiB WAV size limit")
+        w, h = result.encoded_size
+        original_w, original_h = result.original_size
+        self._file.write(payload)
+        self.entries.pop(name, None)
+        self.entries[name] = ArchiveEntry(name, self.data_length, len(payload), w, h, original_w, original_h,
+                                          compression.get_codec(result.codec).codec_id)
+        self.data_length += len(payload)
+        self.added += 1
+
+    def remove(self, name):
+        """
+        Drop an entry from the index; its bytes stay in the file
+        """
+        self.entries.pop(name, None)
+
+    def close(self):
+        if self._file is None:
+            return
+        try:
+            index = encode_index(list(self.entries.values()))
+            index_offset = self.data_length
+            self._file.seek(self.data_offset + index_offset)
+            # Keep the data chunk a whole number of 16-bit frames with the footer last
+            pad = b'\x00' * ((index_offset + len(index)) & 1)
+            self._file.write(index + pad + ARCHIVE_FOOTER.pack(index_offset, len(index), ARCHIVE_MAGIC))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            data_length = index_offset + len(index) + len(pad) + ARCHIVE_FOOTER.size
+            self._file.seek(self.data_offset - 4)
+            self._file.write(struct.pack('<I', data_length))
+            self._file.seek(4)
+            self._file.write(struct.pack('<I', self.data_offset + data_length - 8))
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def remove_entries(archive_file, names):
+    """
+    Drop entries from an archive's index (their payload bytes are not reclaimed)
+    """
+    with ArchiveWriter(archive_file) as writer:
+        for name in names:
+            writer.remove(name)
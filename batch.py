@@ -0,0 +1,79 @@
+"""
+Process-pool batch runner shared by the command-line scripts
+
+Results are yielded in completion order as (item, result, error) tuples where
+error is None on success or the formatted traceback of the failure.
+"""
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+def resolve_jobs(jobs):
+    """
+    Map a --jobs value to a worker count (0 or less = one per CPU core)
+    """
+    if jobs is None or jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def _call(func, item, args, kwargs):
+    try:
+        return func(item, *args, **kwargs), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def run_batch(func, items, jobs=1, *args, **kwargs):
+    """
+    Run func(item, *args, **kwargs) for every item and yield (item, result, error)
+    A failing item never affects the others. With jobs == 1 everything runs
+    in-process; otherwise a process pool is used and at most a few tasks per
+    worker are queued at once so huge batches don't pile up in memory.
+    """
+    jobs = resolve_jobs(jobs)
+
+    if jobs == 1:
+        for item in items:
+            result, error = _call(func, item, args, kwargs)
+            yield item, result, error
+        return
+
+    pending_items = iter(items)
+    max_in_flight = jobs * 4
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    in_flight = {}
+
+    def submit_more():
+        while len(in_flight) < max_in_flight:
+            item = next(pending_items, None)
+            if item is None:
+                return
+            in_flight[executor.submit(_call, func, item, args, kwargs)] = item
+
+    try:
+        submit_more()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result, error = future.result()
+                except BrokenProcessPool:
+                    # A worker died outright (e.g. out of memory); only the
+                    # files that were running in the dead pool are lost
+                    result, error = None, "Worker process terminated abruptly"
+                    broken = True
+                yield item, result, error
+            if broken:
+                for future, item in in_flight.items():
+                    yield item, None, "Worker process terminated abruptly"
+                in_flight.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=jobs)
+            submit_more()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,385 @@
+"""
+Reproducible encode/decode benchmark
+
+Generates a fixed set of synthetic images (plus any real images given with
+--images-dir), runs them through the same encode path as UniversalWAVNG.py
+and decode path as decode_to_image.py at every quality setting, and writes
+latency percentiles, throughput, peak memory and compression ratio to JSON.
+With --compare the results are checked against a saved baseline.
+"""
+import argparse
+import dataclasses
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import PIL
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+
+import UniversalWAVNG
+import decode_to_image
+from compression import AUTO, codec_names
+from filters import FILTER_NAMES
+from profiling import StageTimer, percentile
+from wav_codec import QUALITY_SETTINGS, RESIZE_MODES, encode_image_file, decode_wav_file, load_image
+from wav_stream import stream_encode_image_file, stream_decode_wav_file
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ---------- CONFIG ----------
+IMAGE_SIZE = (1600, 1200)
+REPEAT = 5
+WARMUP = 1
+SEED = 1234
+THRESHOLD = 0.10  # Relative slowdown (or growth) flagged as a regression
+RATIO_THRESHOLD = 0.01  # Compression ratio may grow by this much before it is flagged
+
+SYNTHETIC_IMAGES = ("gradient", "noise", "flat", "photo", "rgba", "palette", "jpeg")
+
+
+# ---------- SYNTHETIC IMAGES ----------
+def _noise(size, rng, mode='RGB'):
+    channels = len(mode)
+    return Image.frombytes(mode, size, rng.randbytes(size[0] * size[1] * channels))
+
+
+def _photo(size, rng):
+    # Smooth structure + fine sensor-like noise, roughly like a camera photo
+    w, h = size
+    base = Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 80)
+    base = Image.merge('RGB', (base, base.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                               Image.linear_gradient('L').resize(size)))
+    base = base.filter(ImageFilter.GaussianBlur(max(1, w // 400)))
+    return Image.blend(base, _noise(size, rng), 0.06)
+
+
+def make_image(kind, size, seed=SEED):
+    """
+    Build one deterministic synthetic test image
+    """
+    rng = random.Random(f"{seed}:{kind}")
+    w, h = size
+    if kind == "gradient":
+        ramp = Image.linear_gradient('L')
+        return Image.merge('RGB', (ramp.resize(size), ramp.rotate(90).resize(size),
+                                   ramp.rotate(45).resize(size)))
+    if kind == "noise":
+        return _noise(size, rng)
+    if kind == "flat":
+        img = Image.new('RGB', size, (240, 240, 240))
+        draw = ImageDraw.Draw(img)
+        for _ in range(60):
+            x0, y0 = rng.randrange(w), rng.randrange(h)
+            box = (x0, y0, x0 + rng.randrange(20, w // 3), y0 + rng.randrange(20, h // 3))
+            color = tuple(rng.randrange(256) for _ in range(3))
+            (draw.rectangle if rng.random() < 0.5 else draw.ellipse)(box, fill=color)
+        return img
+    if kind == "photo":
+        return _photo(size, rng)
+    if kind == "rgba":
+        img = _photo(size, rng).convert('RGBA')
+        img.putalpha(Image.linear_gradient('L').rotate(90).resize(size))
+        return img
+    if kind == "palette":
+        return make_image("flat", size, seed).quantize(64)
+    if kind == "jpeg":
+        return _photo(size, rng)  # Saved as a JPEG, the case draft decoding speeds up
+    raise ValueError(f"Unknown synthetic image {kind!r}")
+
+
+def prepare_images(work_dir, kinds, size, images_dir=None):
+    """
+    Write the synthetic images (and collect real ones) into work_dir
+    Returns: list of (name, path)
+    """
+    images = []
+    for kind in kinds:
+        if kind == "jpeg":
+            path = os.path.join(work_dir, f"{kind}.jpg")
+            make_image(kind, size).save(path, quality=92)
+        else:
+            path = os.path.join(work_dir, f"{kind}.png")
+            make_image(kind, size).save(path, compress_level=1)
+        images.append((kind, path))
+    if images_dir:
+        for name in sorted(os.listdir(images_dir)):
+            path = os.path.join(images_dir, name)
+            try:
+                with Image.open(path):
+                    pass
+            except Exception:
+                continue
+            images.append((name, path))
+    return images
+
+
+# ---------- MEASUREMENT ----------
+def _peak_rss():
+    # High-water mark of this process in bytes (None where unsupported)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _run_op(task):
+    # Runs in a fresh child process so its peak memory belongs to this case alone
+    op, path, out_dir, options, streaming, repeat, warmup = task
+    baseline = _peak_rss()
+    times = []
+    result = None
+    for i in range(warmup + repeat):
+        start = time.perf_counter()
+        if op == "encode":
+            encode = stream_encode_image_file if streaming else encode_image_file
+            result = encode(path, out_dir, options)
+        else:
+            decode = stream_decode_wav_file if streaming else decode_wav_file
+            result = decode(path, out_dir)
+        if i >= warmup:
+            times.append(time.perf_counter() - start)
+    peak = _peak_rss()
+    return times, result, (peak - baseline if peak is not None else None)
+
+
+def run_isolated(task):
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(_run_op, (task,))
+
+
+def summarize(times, megapixels):
+    p50 = percentile(times, 0.5)
+    return {
+        "runs": len(times),
+        "mean_s": statistics.fmean(times),
+        "p50_s": p50,
+        "p90_s": percentile(times, 0.9),
+        "p99_s": percentile(times, 0.99),
+        "min_s": min(times),
+        "mp_per_s": megapixels / p50 if p50 > 0 else None,
+    }
+
+
+# ---------- BENCHMARK ----------
+def run_benchmark(images, qualities, options, encode_streaming, decode_streaming, repeat, warmup, work_dir):
+    """
+    Encode and decode every image at every quality setting
+    Returns: list of result dicts, one per (image, quality, operation)
+    """
+    results = []
+    for name, path in images:
+        with Image.open(path) as img:
+            source_mode = img.mode
+            source_mp = img.width * img.height / 1e6
+
+        for quality in qualities:
+            case_options = dataclasses.replace(options, max_size=QUALITY_SETTINGS[quality])
+            out_dir = os.path.join(work_dir, quality)
+            os.makedirs(out_dir, exist_ok=True)
+            case = {"image": name, "mode": source_mode, "quality": quality, "codec": options.codec,
+                    "filter": options.filter, "resize": options.resize}
+
+            times, enc, peak = run_isolated(("encode", path, out_dir, case_options, encode_streaming,
+                                             repeat, warmup))
+            results.append({**case, "op": "encode", "megapixels": source_mp, **summarize(times, source_mp),
+                            "peak_mb": peak / 2 ** 20 if peak is not None else None,
+                            "encoded_size": list(enc.encoded_size), "codec_used": enc.codec,
+                            "file_size": enc.file_size,
+                            "ratio": enc.file_size / max(1, enc.uncompressed_size)})
+
+            times, dec, peak = run_isolated(("decode", enc.out_file, out_dir, None, decode_streaming,
+                                             repeat, warmup))
+            output_mp = dec.original_size[0] * dec.original_size[1] / 1e6
+            results.append({**case, "op": "decode", "megapixels": output_mp, **summarize(times, output_mp),
+                            "peak_mb": peak / 2 ** 20 if peak is not None else None})
+
+            print(f"  {name:<16} {quality:<9} encode {results[-2]['p50_s'] * 1000:8.1f} ms "
+                  f"({results[-2]['mp_per_s'] or 0:6.1f} MP/s, ratio {results[-2]['ratio']:.3f})   "
+                  f"decode {results[-1]['p50_s'] * 1000:8.1f} ms ({results[-1]['mp_per_s'] or 0:6.1f} MP/s)")
+    return results
+
+
+def image_difference(a, b):
+    """
+    Returns: (PSNR in dB, largest per-channel difference) between two same-sized images
+    Images with alpha are compared premultiplied: the color of an almost
+    transparent pixel is not visible, and resamplers don't preserve it.
+    """
+    premultiplied = {"RGBA": "RGBa", "LA": "La"}
+    a, b = (img.convert(premultiplied.get(img.mode, img.mode)) for img in (a, b))
+    diff = ImageChops.difference(a, b)
+    rms = math.sqrt(statistics.fmean(value ** 2 for value in ImageStat.Stat(diff).rms))
+    largest = max(high for _, high in diff.getextrema()) if len(diff.getbands()) > 1 else diff.getextrema()[1]
+    return (20 * math.log10(255 / rms) if rms else math.inf), largest
+
+
+def run_resize_check(images, qualities, options, repeat, warmup):
+    """
+    Time loading + resizing in "fast" against "exact" mode and measure how far the outputs differ
+    Returns: list of result dicts, one per (image, quality) that is actually shrunk
+    """
+    results = []
+    for name, path in images:
+        for quality in qualities:
+            max_size = QUALITY_SETTINGS[quality]
+            if max_size is None:
+                continue
+            outputs = {}
+            times = {}
+            for mode in RESIZE_MODES:
+                case_options = dataclasses.replace(options, max_size=max_size, resize=mode, palette="off")
+                runs = []
+                for i in range(warmup + repeat):
+                    start = time.perf_counter()
+                    img, _, _ = load_image(path, case_options, StageTimer())
+                    if i >= warmup:
+                        runs.append(time.perf_counter() - start)
+                outputs[mode], times[mode] = img, percentile(runs, 0.5)
+            psnr, largest = image_difference(outputs["fast"], outputs["exact"])
+            results.append({"image": name, "quality": quality, "exact_s": times["exact"], "fast_s": times["fast"],
+                            "speedup": times["exact"] / times["fast"] if times["fast"] else None,
+                            "psnr_db": psnr if math.isfinite(psnr) else None, "max_diff": largest})
+            print(f"  {name:<16} {quality:<9} exact {times['exact'] * 1000:8.1f} ms   fast {times['fast'] * 1000:8.1f} ms "
+                  f"({results[-1]['speedup'] or 0:5.1f}x)   PSNR {psnr:6.1f} dB, max diff {largest}")
+    return results
+
+
+# ---------- COMPARE ----------
+def case_key(result):
+    return (result["image"], result["quality"], result["op"], result["codec"], result.get("filter", "none"),
+            result.get("resize", "exact"))
+
+
+def compare(results, baseline, threshold=THRESHOLD, ratio_threshold=RATIO_THRESHOLD):
+    """
+    Compare results with a baseline run
+    Returns: list of (key, metric, old, new, change) regressions
+    """
+    old_cases = {case_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = old_cases.get(case_key(result))
+        if old is None:
+            continue
+        checks = [("p50_s", threshold), ("peak_mb", threshold)]
+        if result["op"] == "encode":
+            checks.append(("ratio", ratio_threshold))
+        for metric, limit in checks:
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            if change > limit:
+                regressions.append((case_key(result), metric, before, after, change))
+    return regressions
+
+
+# ---------- MAIN ----------
+def parse_size(text):
+    try:
+        w, h = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("size must be WIDTHxHEIGHT")
+    return w, h
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image <-> WAV encoding and decoding")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON results file (default: %(default)s)")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a saved results file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="relative slowdown / memory growth counted as a regression (default: %(default)s)")
+    parser.add_argument("--size", type=parse_size, default=IMAGE_SIZE, metavar="WxH",
+                        help="synthetic image size (default: %(default)s)")
+    parser.add_argument("--images", default=",".join(SYNTHETIC_IMAGES),
+                        help="synthetic images to generate (default: %(default)s)")
+    parser.add_argument("--images-dir", help="also benchmark every image in this folder")
+    parser.add_argument("--quality", default=",".join(QUALITY_SETTINGS),
+                        help="quality modes to run (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs per case (default: %(default)s)")
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="untimed runs per case (default: %(default)s)")
+    parser.add_argument("--codec", choices=codec_names() + [AUTO], default=UniversalWAVNG.COMPRESSION_CODEC)
+    parser.add_argument("--level", type=UniversalWAVNG.parse_level, default=UniversalWAVNG.COMPRESSION_LEVEL)
+    parser.add_argument("--filter", choices=FILTER_NAMES, default=UniversalWAVNG.FILTER)
+    parser.add_argument("--streaming", action="store_true",
+                        help="use the streaming encoder and decoder for every case")
+    parser.add_argument("--resize", choices=RESIZE_MODES, default=UniversalWAVNG.RESIZE_MODE,
+                        help="resize mode for the encode cases (default: %(default)s)")
+    parser.add_argument("--resize-check", action="store_true",
+                        help="only compare fast against exact resizing: load + resize time and PSNR")
+    args = parser.parse_args()
+
+    kinds = [k for k in args.images.split(",") if k]
+    qualities = [q for q in args.quality.split(",") if q]
+    for quality in qualities:
+        if quality not in QUALITY_SETTINGS:
+            parser.error(f"unknown quality mode {quality!r}")
+
+    # Same settings UniversalWAVNG.py would use, apart from the overrides above
+    defaults = UniversalWAVNG.default_args(resize=args.resize, level=args.level, codec=args.codec, filter=args.filter)
+    options = UniversalWAVNG.make_options(defaults)
+    encode_streaming = args.streaming or defaults.streaming
+    decode_streaming = args.streaming or decode_to_image.ENABLE_STREAMING
+
+    print(f"Benchmark: {len(kinds)} synthetic image(s) at {args.size[0]}x{args.size[1]}, "
+          f"qualities {', '.join(qualities)}, {args.repeat} run(s) each")
+    print("-" * 50)
+
+    with tempfile.TemporaryDirectory(prefix="sonicraster-bench-") as work_dir:
+        images = prepare_images(work_dir, kinds, args.size, args.images_dir)
+        if args.resize_check:
+            resize_results = run_resize_check(images, qualities, options, args.repeat, args.warmup)
+            results = []
+        else:
+            resize_results = None
+            results = run_benchmark(images, qualities, options, encode_streaming, decode_streaming,
+                                    args.repeat, args.warmup, work_dir)
+
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "size": list(args.size),
+            "repeat": args.repeat,
+            "seed": SEED,
+            "streaming": [encode_streaming, decode_streaming],
+        },
+        "results": results,
+    }
+    if resize_results is not None:
+        report["resize_check"] = resize_results
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print("-" * 50)
+    print(f"✓ Results saved: {args.out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if not regressions:
+            print(f"✓ No regressions against {args.compare}")
+            return 0
+        print(f"✗ {len(regressions)} regression(s) against {args.compare}:")
+        for key, metric, before, after, change in regressions:
+            print(f"  {'/'.join(str(k) for k in key)}: {metric} {before:.4g} → {after:.4g} (+{change * 100:.1f}%)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
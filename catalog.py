@@ -0,0 +1,433 @@
+"""
+Catalog and integrity check for folders of encoded WAVs
+
+"inspect" lists what every WAV in a store holds (dimensions, mode, codec,
+layout, sizes) from the first few KB of each file, without reading or
+decompressing any pixel data. "verify" streams every stored block through
+CRC32 in fixed-size reads and compares it with the checksums in the header;
+files written before checksums existed are verified by decompressing them
+instead, also in bounded memory.
+
+Files are recognised by their content (the SRWV / SRWA magic, or a
+plausible 13-byte legacy header), not by their name. Both commands scan
+folders recursively with os.scandir and hand the files to a process pool in
+chunks, so parsing a 100k-file store is spread over every core.
+"""
+import argparse
+import csv
+import json
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import compression
+from archive import ARCHIVE_FOOTER, ARCHIVE_MAGIC, decode_index
+from batch import resolve_jobs
+from discovery import WAV_EXTENSIONS, iter_files
+from wav_codec import HEADER_V2, MAGIC, find_data_chunk, is_versioned, read_payload_info
+
+# ---------- CONFIG ----------
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WAV_FOLDER = os.path.join(SCRIPT_DIR, "wav_output")
+
+# PARALLELISM - worker processes (0 = one per CPU core); each gets files in chunks of SCAN_CHUNK
+JOBS = 0
+SCAN_CHUNK = 256
+
+HEAD_BYTES = 4096  # First read of every file: RIFF header, payload header and a strip table of ~900 strips
+MAX_HEAD_BYTES = 1 << 20  # Give up looking for the data chunk after this much
+READ_CHUNK = 1 << 20  # Verification reads
+
+SORT_KEYS = ("name", "size", "pixels", "width", "height", "ratio", "codec", "mode", "kind")
+
+
+@dataclass
+class CatalogEntry:
+    path: str
+    file_size: int
+    kind: str  # "image", "legacy" (13-byte header, no magic), "archive" or "damaged"
+    width: int = 0
+    height: int = 0
+    original_width: int = 0
+    original_height: int = 0
+    codec: str = ""
+    mode: str = ""
+    filter: str = "none"
+    palette_colors: Optional[int] = None
+    strips: int = 0
+    frames: int = 1
+    stored_size: int = 0
+    uncompressed_size: int = 0
+    checksum: bool = False
+    entries: int = 0  # Archives only
+    error: Optional[str] = None
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+    @property
+    def ratio(self):
+        return self.stored_size / self.uncompressed_size if self.uncompressed_size else 0.0
+
+
+@dataclass
+class VerifyResult:
+    path: str
+    ok: bool
+    method: str = ""  # "crc" or "decompress" (no checksums in the file)
+    blocks: int = 0
+    checked_bytes: int = 0
+    error: Optional[str] = None
+
+
+# ---------- SCANNING ----------
+def iter_wav_files(paths):
+    """
+    Yield every .wav file under paths (files or folders, searched recursively) as it is found
+    """
+    return (path for path, _ in iter_files(paths, WAV_EXTENSIONS))
+
+
+def scan(paths, func, jobs=JOBS):
+    """
+    Run func on every WAV under paths, on a process pool unless jobs resolves to 1
+    Results arrive in scan order.
+    """
+    jobs = resolve_jobs(jobs)
+    if jobs == 1:
+        yield from map(func, iter_wav_files(paths))
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(func, iter_wav_files(paths), chunksize=SCAN_CHUNK)
+
+
+# ---------- READING ----------
+def read_at(f, offset, size):
+    f.seek(offset)
+    return f.read(size)
+
+
+def locate_data(f, file_size):
+    """
+    Find the data chunk of an open WAV from its first bytes
+    Returns: (data offset, data length, first bytes of the file)
+    """
+    head_size = HEAD_BYTES
+    while True:
+        head = read_at(f, 0, head_size)
+        try:
+            offset, length = find_data_chunk(head, file_size)
+            return offset, length, head
+        except ValueError as e:
+            # Only a data chunk past the bytes read so far is worth another, larger read
+            if str(e) != "no data chunk" or head_size >= min(file_size, MAX_HEAD_BYTES):
+                raise
+            head_size *= 4
+
+
+def read_header(f, offset, length, head=b'', head_offset=0):
+    """
+    Parse the payload header at offset, reusing already read bytes where possible
+    Returns: PayloadInfo
+    """
+    start = offset - head_offset
+    data = head[start:start + length] if 0 <= start < len(head) else b''
+    if len(data) < HEADER_V2.size:
+        data = read_at(f, offset, min(length, HEAD_BYTES))
+    if is_versioned(data):
+        header_size = HEADER_V2.unpack_from(data)[-1]
+        if header_size > len(data):
+            data = read_at(f, offset, header_size)
+        if len(data) < header_size:
+            raise ValueError("file is truncated")
+    return read_payload_info(data, length)
+
+
+def looks_legacy(info, length):
+    """
+    Whether a header without magic is plausibly a legacy 13-byte payload header
+    """
+    return (info.version == 1 and info.width > 0 and info.height > 0
+            and info.original_width >= info.width and info.original_height >= info.height
+            and info.codec in compression.LEGACY_CODECS
+            and info.uncompressed_size == info.width * info.height * 3
+            and (info.is_compressed or length >= info.uncompressed_size))
+
+
+def read_archive_index(f, data_offset, data_length):
+    footer = read_at(f, data_offset + data_length - ARCHIVE_FOOTER.size, ARCHIVE_FOOTER.size)
+    if len(footer) < ARCHIVE_FOOTER.size:
+        raise ValueError("file is truncated")
+    index_offset, index_length, magic = ARCHIVE_FOOTER.unpack(footer)
+    if magic != ARCHIVE_MAGIC or index_offset + index_length > data_length - ARCHIVE_FOOTER.size:
+        raise ValueError("archive footer is damaged")
+    return decode_index(read_at(f, data_offset + index_offset, index_length))
+
+
+# ---------- INSPECT ----------
+def inspect_file(path):
+    """
+    Describe one WAV from its headers alone
+    Returns: CatalogEntry, or None if the file is not an encoded image or archive
+    """
+    try:
+        with open(path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            try:
+                data_offset, data_length, head = locate_data(f, file_size)
+            except ValueError:
+                return None  # Not a RIFF/WAVE file the encoders could have written
+            magic = bytes(head[data_offset:data_offset + 4])
+            try:
+                if magic == ARCHIVE_MAGIC:
+                    entries = read_archive_index(f, data_offset, data_length)
+                    return CatalogEntry(path, file_size, "archive", stored_size=data_length, entries=len(entries))
+                info = read_header(f, data_offset, data_length, head)
+            except (ValueError, struct.error) as e:
+                if magic in (MAGIC, ARCHIVE_MAGIC):
+                    return CatalogEntry(path, file_size, "damaged", error=str(e) or "header is damaged")
+                return None
+    except OSError as e:
+        return CatalogEntry(path, 0, "damaged", error=str(e))
+
+    if magic != MAGIC and not looks_legacy(info, data_length):
+        return None
+    return CatalogEntry(
+        path=path,
+        file_size=file_size,
+        kind="image" if info.version >= 2 else "legacy",
+        width=info.width,
+        height=info.height,
+        original_width=info.original_width,
+        original_height=info.original_height,
+        codec=info.codec_name,
+        mode=info.mode,
+        filter=info.filter.name,
+        palette_colors=info.palette.count if info.palette else None,
+        strips=info.strip_count,
+        frames=info.frame_count,
+        stored_size=info.stored_size + info.frames_size,
+        uncompressed_size=info.uncompressed_size * info.frame_count,
+        checksum=info.block_crcs is not None,
+    )
+
+
+def sort_catalog(entries, key="name", reverse=False):
+    getters = {
+        "name": lambda e: e.path.lower(),
+        "size": lambda e: e.file_size,
+        "pixels": lambda e: e.pixels,
+        "width": lambda e: e.width,
+        "height": lambda e: e.height,
+        "ratio": lambda e: e.ratio,
+        "codec": lambda e: (e.codec, e.path.lower()),
+        "mode": lambda e: (e.mode, e.path.lower()),
+        "kind": lambda e: (e.kind, e.path.lower()),
+    }
+    return sorted(entries, key=getters[key], reverse=reverse)
+
+
+# ---------- VERIFY ----------
+def iter_range(f, offset, length, buffer):
+    """
+    Yield views of bytes [offset, offset + length) of f, read into buffer a chunk at a time
+    """
+    f.seek(offset)
+    view = memoryview(buffer)
+    while length > 0:
+        count = f.readinto(view[:min(len(buffer), length)])
+        if not count:
+            raise ValueError("file is truncated")
+        length -= count
+        yield view[:count]
+
+
+def block_names(info):
+    return ([f"preview level {i}" for i in range(len(info.pyramid))]
+            + [f"strip {i}" for i in range(info.strip_count)]
+            + [f"frame {i}" for i in range(1, info.frame_count)])
+
+
+def expected_sizes(info):
+    """
+    Decompressed size of every stored block
+    """
+    sizes = [level.width * level.height * info.channels for level in info.pyramid]
+    filter_width, channels = info.filter_layout
+    for index in range(info.strip_count):
+        rows = min(info.strip_rows, info.height - index * info.strip_rows)
+        if info.filter.active:
+            sizes.append(info.filter.stored_size(filter_width, rows, channels))
+        else:
+            sizes.append(rows * info.row_bytes)
+    for frame in info.frames[1:]:
+        if frame.is_key and info.filter.active:
+            sizes.append(info.filter.stored_size(filter_width, info.height, channels))
+        else:
+            sizes.append(info.height * info.row_bytes)
+    return sizes
+
+
+def verify_payload(f, offset, length, buffer, head=b'', head_offset=0):
+    """
+    Check one payload: block CRCs if the header has them, otherwise a full streaming decompression
+    Returns: (method, block count, bytes checked); raises ValueError on the first problem
+    """
+    info = read_header(f, offset, length, head, head_offset)
+    blocks = info.blocks
+    names = block_names(info)
+    checked = 0
+
+    if info.block_crcs is not None:
+        if len(info.block_crcs) != len(blocks):
+            raise ValueError("checksum table does not match the block layout")
+        for name, (block_offset, block_length), expected in zip(names, blocks, info.block_crcs):
+            crc = 0
+            for chunk in iter_range(f, offset + block_offset, block_length, buffer):
+                crc = zlib.crc32(chunk, crc)
+            if crc != expected:
+                raise ValueError(f"{name} checksum mismatch")
+            checked += block_length
+        return "crc", len(blocks), checked
+
+    codec = compression.get_codec(info.codec)
+    for name, (block_offset, block_length), expected in zip(names, blocks, expected_sizes(info)):
+        decompressor = codec.decompressor()
+        size = 0
+        try:
+            for chunk in iter_range(f, offset + block_offset, block_length, buffer):
+                for piece in decompressor.feed(chunk, READ_CHUNK):
+                    size += len(piece)
+            size += len(decompressor.flush())
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"{name} does not decompress: {e}") from None
+        if size < expected:
+            raise ValueError(f"{name} holds {size:,} of {expected:,} bytes")
+        checked += block_length
+    return "decompress", len(blocks), checked
+
+
+def verify_file(path):
+    """
+    Verify every payload in one WAV (each entry of an archive) with bounded memory
+    Returns: VerifyResult, or None if the file is not an encoded image or archive
+    """
+    entry = inspect_file(path)
+    if entry is None:
+        return None
+    if entry.kind == "damaged":
+        return VerifyResult(path, False, error=entry.error)
+
+    buffer = bytearray(READ_CHUNK)
+    try:
+        with open(path, 'rb') as f:
+            data_offset, data_length, head = locate_data(f, entry.file_size)
+            if entry.kind == "archive":
+                methods, blocks, checked = set(), 0, 0
+                for entry in read_archive_index(f, data_offset, data_length):
+                    try:
+                        method, count, size = verify_payload(f, data_offset + entry.offset, entry.length, buffer)
+                    except ValueError as e:
+                        raise ValueError(f"{entry.name}: {e}") from None
+                    methods.add(method)
+                    blocks += count
+                    checked += size
+                return VerifyResult(path, True, "+".join(sorted(methods)), blocks, checked)
+
+            method, blocks, checked = verify_payload(f, data_offset, data_length, buffer, head)
+            return VerifyResult(path, True, method, blocks, checked)
+    except (OSError, ValueError, struct.error) as e:
+        return VerifyResult(path, False, error=str(e) or "header is damaged")
+
+
+# ---------- OUTPUT ----------
+def format_dimensions(width, height):
+    return f"{width}x{height}"
+
+
+def print_table(entries, root):
+    print(f"{'NAME':<36} {'KIND':<7} {'STORED':>11} {'ORIGINAL':>11} {'MODE':<8} {'CODEC':<6} "
+          f"{'FILTER':<11} {'STRIPS':>6} {'FRAMES':>6} {'SIZE':>12} {'RATIO':>6} CRC")
+    for e in entries:
+        name = os.path.relpath(e.path, root) if root else e.path
+        if e.kind == "damaged":
+            print(f"{name:<36} {e.kind:<7} {e.error}")
+        elif e.kind == "archive":
+            print(f"{name:<36} {e.kind:<7} {str(e.entries) + ' entries':>11} {'':>11} {'-':<8} {'-':<6} "
+                  f"{'-':<11} {'-':>6} {'-':>6} {e.file_size:>12,}")
+        else:
+            mode = e.mode + (f"/{e.palette_colors}" if e.palette_colors else "")
+            print(f"{name:<36} {e.kind:<7} {format_dimensions(e.width, e.height):>11} "
+                  f"{format_dimensions(e.original_width, e.original_height):>11} {mode:<8} {e.codec:<6} "
+                  f"{e.filter:<11} {e.strips:>6} {e.frames:>6} {e.file_size:>12,} {e.ratio * 100:>5.1f}% "
+                  f"{'yes' if e.checksum else 'no'}")
+
+
+def write_catalog(entries, out_format, root):
+    if out_format == "table":
+        print_table(entries, root)
+    elif out_format == "json":
+        json.dump([asdict(e) for e in entries], sys.stdout, indent=1)
+        print()
+    else:
+        writer = csv.writer(sys.stdout)
+        fields = list(asdict(entries[0]).keys()) if entries else ["path"]
+        writer.writerow(fields)
+        for e in entries:
+            writer.writerow(asdict(e).values())
+
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Catalog and verify encoded WAV files")
+    parser.add_argument("command", choices=("inspect", "verify"),
+                        help="inspect: list headers only; verify: check every stored byte")
+    parser.add_argument("paths", nargs="*", default=[WAV_FOLDER],
+                        help="WAV files or folders, searched recursively (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS,
+                        help="worker processes to use (0 = one per CPU core, default: %(default)s)")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="name",
+                        help="inspect: catalog order (default: %(default)s)")
+    parser.add_argument("--reverse", action="store_true", help="inspect: reverse the order")
+    parser.add_argument("--format", choices=("table", "csv", "json"), default="table",
+                        help="inspect: output format (default: %(default)s)")
+    args = parser.parse_args()
+
+    root = args.paths[0] if len(args.paths) == 1 and os.path.isdir(args.paths[0]) else None
+
+    if args.command == "inspect":
+        entries = [entry for entry in scan(args.paths, inspect_file, args.jobs) if entry is not None]
+        write_catalog(sort_catalog(entries, args.sort, args.reverse), args.format, root)
+        if args.format == "table":
+            print("-" * 50)
+            print(f"{len(entries)} file(s), {sum(e.file_size for e in entries):,} bytes")
+        return
+
+    checked = failed = unchecked = 0
+    for result in scan(args.paths, verify_file, args.jobs):
+        if result is None:
+            continue
+        name = os.path.relpath(result.path, root) if root else result.path
+        checked += 1
+        if result.ok:
+            unchecked += "decompress" in result.method
+            print(f"✓ {name} ({result.method}, {result.blocks} block(s), {result.checked_bytes:,} bytes)")
+        else:
+            failed += 1
+            print(f"✗ {name}: {result.error}")
+    print("-" * 50)
+    print(f"Verified {checked} file(s): {checked - failed} OK, {failed} failed")
+    if unchecked:
+        print(f"{unchecked} file(s) have no checksums and were checked by decompressing them")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Compression backends, addressed by the codec ID stored in the payload header
+
+IDs 0 and 1 match the old on/off compression flag, so every existing file
+reads as "none" or "zlib". Optional backends register themselves only when
+their module can be imported.
+"""
+import bz2
+import lzma
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# ---------- CONFIG ----------
+AUTO = "auto"
+AUTO_TIME_BUDGET = 2.0  # Seconds of estimated compression time allowed per image
+AUTO_MIN_GAIN = 0.02  # A slower codec must save at least this fraction of the size
+AUTO_SAMPLE_BYTES = 256 * 1024
+AUTO_SAMPLE_COUNT = 4
+AUTO_CODEC_LEVEL = 6  # Level the codec comparison runs at when the level is tuned too
+AUTO_LEVEL_COUNT = 4  # Levels tried per codec, spread over its range
+AUTO_LEVEL_GAIN = 256.0  # Default target: bytes a level must save per extra CPU millisecond
+PARALLEL_BLOCK_SIZE = 1024 * 1024  # Bytes deflated per thread by compress_parallel
+PARALLEL_MIN_SIZE = 2 * PARALLEL_BLOCK_SIZE  # Smaller data is compressed in one piece
+
+
+@dataclass(frozen=True)
+class Codec:
+    codec_id: int
+    name: str
+    min_level: int
+    max_level: int
+    compress_func: Callable
+    decompress_func: Callable
+    compressor_func: Optional[Callable] = None
+    decompressor_func: Optional[Callable] = None
+
+    def clamp(self, level):
+        return max(self.min_level, min(self.max_level, level))
+
+    def compress(self, data, level):
+        return self.compress_func(data, self.clamp(level))
+
+    def decompress(self, data):
+        return self.decompress_func(data)
+
+    def compressor(self, level):
+        """
+        Incremental compressor with compress()/flush()
+        """
+        if self.compressor_func is None:
+            return _BufferedCompressor(self, level)
+        return self.compressor_func(self.clamp(level))
+
+    def decompressor(self):
+        return StreamDecompressor(self)
+
+
+CODECS = {}
+CODECS_BY_NAME = {}
+
+
+def register_codec(codec):
+    CODECS[codec.codec_id] = codec
+    CODECS_BY_NAME[codec.name] = codec
+
+
+def get_codec(codec):
+    """
+    Look up a codec by ID or name
+    """
+    table = CODECS if isinstance(codec, int) else CODECS_BY_NAME
+    try:
+        return table[codec]
+    except KeyError:
+        raise ValueError(f"Compression codec {codec!r} is not available") from None
+
+
+def codec_names():
+    return [codec.name for codec in sorted(CODECS.values(), key=lambda c: c.codec_id)]
+
+
+# ---------- STREAMING ADAPTERS ----------
+class _BufferedCompressor:
+    # For backends without an incremental API: compress everything on flush()
+    def __init__(self, codec, level):
+        self.codec = codec
+        self.level = level
+        self.buffer = bytearray()
+
+    def compress(self, data):
+        self.buffer += data
+        return b''
+
+    def flush(self):
+        data, self.buffer = bytes(self.buffer), bytearray()
+        return self.codec.compress(data, self.level)
+
+
+class _NullCompressor:
+    def compress(self, data):
+        return bytes(data)
+
+    def flush(self):
+        return b''
+
+
+class StreamDecompressor:
+    """
+    Incremental decompressor yielding output in pieces of at most max_length bytes
+    Backends without an incremental API buffer their input until flush().
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.buffer = None
+        if codec.decompressor_func is None:
+            self.buffer = bytearray()
+            self.engine = None
+        else:
+            self.engine = codec.decompressor_func()
+
+    def feed(self, data, max_length):
+        engine = self.engine
+        if self.buffer is not None:
+            self.buffer += data
+        elif self.codec.codec_id == NONE:
+            yield bytes(data)
+        elif hasattr(engine, 'unconsumed_tail'):
+            while data and not engine.eof:
+                yield engine.decompress(data, max_length)
+                data = engine.unconsumed_tail
+        elif not engine.eof:
+            yield engine.decompress(data, max_length)
+            while not engine.eof and not engine.needs_input:
+                yield engine.decompress(b'', max_length)
+
+    def flush(self):
+        if self.buffer is not None:
+            return self.codec.decompress(bytes(self.buffer))
+        if hasattr(self.engine, 'unconsumed_tail'):
+            return self.engine.flush()
+        return b''
+
+
+def decompress_prefix(codec, data, size):
+    """
+    Decompress only as much of data as needed for its first `size` bytes
+    """
+    if codec.codec_id == NONE:
+        return data[:size]
+    out = bytearray()
+    decompressor = codec.decompressor()
+    for piece in decompressor.feed(data, size - len(out)):
+        out += piece
+        if len(out) >= size:
+            return bytes(out[:size])
+    out += decompressor.flush()
+    return bytes(out[:size])
+
+
+# ---------- BACKENDS ----------
+NONE = 0
+ZLIB = 1
+BZ2 = 2
+LZMA = 3
+ZSTD = 4
+BROTLI = 5
+
+# Codecs the old 13-byte header (and older decoders) can describe
+LEGACY_CODECS = (NONE, ZLIB)
+
+register_codec(Codec(NONE, "none", 0, 0, lambda data, level: bytes(data), bytes,
+                     lambda level: _NullCompressor(), lambda: None))
+register_codec(Codec(ZLIB, "zlib", 0, 9, lambda data, level: zlib.compress(data, level), zlib.decompress,
+                     zlib.compressobj, zlib.decompressobj))
+register_codec(Codec(BZ2, "bz2", 1, 9, lambda data, level: bz2.compress(data, level),
+                     lambda data: bz2.BZ2Decompressor().decompress(data),
+                     bz2.BZ2Compressor, bz2.BZ2Decompressor))
+register_codec(Codec(LZMA, "lzma", 0, 9, lambda data, level: lzma.compress(data, preset=level),
+                     lambda data: lzma.LZMADecompressor().decompress(data),
+                     lambda level: lzma.LZMACompressor(preset=level), lzma.LZMADecompressor))
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if zstandard is not None:
+    register_codec(Codec(
+        ZSTD, "zstd", 1, 22,
+        lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+        lambda level: zstandard.ZstdCompressor(level=level).compressobj(),
+    ))
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+if brotli is not None:
+    register_codec(Codec(
+        BROTLI, "brotli", 0, 11,
+        lambda data, level: brotli.compress(bytes(data), quality=level),
+        brotli.decompress,
+    ))
+
+
+# ---------- PARALLEL DEFLATE ----------
+ADLER_BASE = 65521
+DEFLATE_WINDOW = 32 * 1024
+
+
+def adler32_combine(adler1, adler2, length2):
+    """
+    Adler-32 of A + B from the checksums of A and B and the length of B
+    """
+    remainder = length2 % ADLER_BASE
+    low1, high1 = adler1 & 0xffff, adler1 >> 16
+    low2, high2 = adler2 & 0xffff, adler2 >> 16
+    low = (low1 + low2 - 1) % ADLER_BASE
+    high = (high1 + high2 + remainder * low1 - remainder) % ADLER_BASE
+    return (high << 16) | low
+
+
+def _deflate_block(data, dictionary, level, last):
+    # Raw deflate primed with the tail of the previous block, so matches can
+    # reach back across the boundary just as in a single stream
+    if dictionary:
+        engine = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        engine = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    out = engine.compress(data)
+    out += engine.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return out, zlib.adler32(data)
+
+
+def compress_parallel(codec, data, level, threads, block_size=PARALLEL_BLOCK_SIZE):
+    """
+    Compress data with codec, splitting zlib work over up to `threads` threads
+    Like pigz: every block of block_size bytes is deflated on its own, with the
+    last 32 KB of the block before it as preset dictionary, and ends on a sync
+    flush (the last one finishes the stream). The raw blocks are joined under
+    one zlib header and the combined Adler-32, so the result is an ordinary
+    zlib stream that zlib.decompress and decompressobj read as usual. Other
+    codecs, a single thread and data under PARALLEL_MIN_SIZE fall back to
+    codec.compress().
+    """
+    if codec.codec_id != ZLIB or threads <= 1 or len(data) < max(PARALLEL_MIN_SIZE, 2 * block_size):
+        return codec.compress(data, level)
+
+    level = codec.clamp(level)
+    view = memoryview(data)
+    starts = range(0, len(view), block_size)
+    last = starts[-1]
+
+    def deflate(start):
+        return _deflate_block(view[start:start + block_size], view[max(0, start - DEFLATE_WINDOW):start],
+                              level, start == last)
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(starts))) as pool:
+        blocks = list(pool.map(deflate, starts))
+
+    # zlib header for this level, taken from zlib itself
+    out = bytearray(zlib.compress(b'', level)[:2])
+    checksum = 1
+    for start, (block, adler) in zip(starts, blocks):
+        out += block
+        checksum = adler32_combine(checksum, adler, min(block_size, len(view) - start))
+    out += checksum.to_bytes(4, 'big')
+    return bytes(out)
+
+
+# ---------- AUTO SELECTION ----------
+def sample_data(data, sample_bytes=AUTO_SAMPLE_BYTES, count=AUTO_SAMPLE_COUNT):
+    """
+    Pick `count` evenly spaced slices of data totalling about sample_bytes
+    """
+    if len(data) <= sample_bytes:
+        return [data]
+    size = sample_bytes // count
+    step = (len(data) - size) // max(1, count - 1)
+    return [data[i * step:i * step + size] for i in range(count)]
+
+
+def choose_codec(samples, total_size, level, time_budget=AUTO_TIME_BUDGET, min_gain=AUTO_MIN_GAIN):
+    """
+    Pick the codec with the best size/time tradeoff for data represented by samples
+    Every available codec compresses the samples; sizes and times are scaled
+    up to total_size. Codecs whose estimated time exceeds time_budget are
+    dropped, then, from fastest to slowest, a codec only replaces the current
+    choice if it is at least min_gain smaller.
+    Returns: (codec, estimates) with estimates = {name: (size, seconds)}
+    """
+    sample = b''.join(bytes(s) for s in samples)
+    if not sample:
+        return get_codec(NONE), {}
+
+    scale = total_size / len(sample)
+    estimates = {}
+    for codec in CODECS.values():
+        start = time.perf_counter()
+        size = len(codec.compress(sample, level))
+        elapsed = time.perf_counter() - start
+        estimates[codec.name] = (int(size * scale), elapsed * scale)
+
+    best, best_size = get_codec(NONE), estimates["none"][0]
+    for name, (size, seconds) in sorted(estimates.items(), key=lambda item: item[1][1]):
+        if seconds > time_budget:
+            continue
+        if size < best_size * (1 - min_gain):
+            best, best_size = CODECS_BY_NAME[name], size
+
+    return best, estimates
+
+
+@dataclass(frozen=True)
+class LevelTarget:
+    """
+    What automatic level tuning optimizes for
+    "gain": raise the level while it saves at least `value` bytes per extra CPU millisecond
+    "speed": smallest output that still compresses at `value` MB/s or faster
+    "ratio": fastest level whose output is at most `value` times the input size
+    """
+    kind: str = "gain"
+    value: float = AUTO_LEVEL_GAIN
+
+    def __str__(self):
+        return f"{self.kind}:{self.value:g}"
+
+
+LEVEL_TARGET_KINDS = ("gain", "speed", "ratio")
+
+
+def parse_level_target(text):
+    """
+    Parse "gain:256", "speed:40" or "ratio:0.3" into a LevelTarget
+    """
+    kind, _, value = text.partition(":")
+    if kind not in LEVEL_TARGET_KINDS or not value:
+        raise ValueError(f"Invalid level target {text!r}, expected gain:N, speed:N or ratio:N")
+    return LevelTarget(kind, float(value))
+
+
+def level_candidates(codec, count=AUTO_LEVEL_COUNT):
+    """
+    Up to `count` levels spread evenly over the useful range of codec
+    """
+    low = codec.min_level if codec.max_level == 0 else max(codec.min_level, 1)
+    span = codec.max_level - low
+    return sorted({low + round(span * i / max(1, count - 1)) for i in range(count)})
+
+
+def choose_level(codec, samples, total_size, target=LevelTarget()):
+    """
+    Pick the compression level of codec for data represented by samples
+    The samples are compressed at a few levels and sizes and times are scaled
+    up to total_size, then the level is picked according to target.
+    Returns: (level, estimates) with estimates = {level: (size, seconds)}
+    """
+    sample = b''.join(bytes(s) for s in samples)
+    levels = level_candidates(codec)
+    if not sample or len(levels) == 1:
+        return levels[0], {}
+
+    scale = total_size / len(sample)
+    estimates = {}
+    for level in levels:
+        start = time.perf_counter()
+        size = len(codec.compress(sample, level))
+        elapsed = time.perf_counter() - start
+        estimates[level] = (int(size * scale), elapsed * scale)
+
+    def size_of(level):
+        return estimates[level][0]
+
+    def time_of(level):
+        return estimates[level][1]
+
+    if target.kind == "speed":
+        fast = [level for level in levels if total_size / max(time_of(level), 1e-9) / 1e6 >= target.value]
+        return min(fast or [min(levels, key=time_of)], key=size_of), estimates
+    if target.kind == "ratio":
+        small = [level for level in levels if size_of(level) <= target.value * total_size]
+        return (min(small, key=time_of) if small else min(levels, key=size_of)), estimates
+
+    # Marginal gain: every step up has to pay for its extra CPU time
+    best = levels[0]
+    for level in levels[1:]:
+        saved = size_of(best) - size_of(level)
+        extra_ms = (time_of(level) - time_of(best)) * 1000
+        if saved > 0 and (extra_ms <= 0 or saved / extra_ms >= target.value):
+            best = level
+    return best, estimates
@@ -1,334 +1,518 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
-import wave
-import struct
-import os
-import zlib
-from PIL import Image
-import threading
-
-class ImageWAVConverter:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Image to WAV Converter")
-        self.root.geometry("700x500")
-        self.root.configure(bg='#C0C0C0')
-        
-        # Configuration
-        self.sample_rate = 44100
-        self.channels = 1
-        self.sample_width = 2
-        self.compression_enabled = tk.BooleanVar(value=True)
-        self.compression_level = tk.IntVar(value=9)
-        self.quality_mode = tk.StringVar(value="HIGH")
-        
-        self.quality_settings = {
-            "LOW": 256,
-            "MEDIUM": 512,
-            "HIGH": 1024,
-            "MAX": 2048,
-            "ORIGINAL": None
-        }
-        
-        # Create menu bar
-        menubar = tk.Menu(root)
-        root.config(menu=menubar)
-        
-        file_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="File", menu=file_menu)
-        file_menu.add_command(label="Exit", command=root.quit)
-        
-        help_menu = tk.Menu(menubar, tearoff=0)
-        menubar.add_cascade(label="Help", menu=help_menu)
-        help_menu.add_command(label="About", command=self.show_about)
-        
-        # Create main container with border
-        main_frame = tk.Frame(root, bg='#C0C0C0', relief=tk.SUNKEN, bd=2)
-        main_frame.pack(fill='both', expand=True, padx=5, pady=5)
-        
-        # Toolbar
-        toolbar = tk.Frame(main_frame, bg='#C0C0C0', relief=tk.RAISED, bd=2)
-        toolbar.pack(side='top', fill='x', padx=2, pady=2)
-        
-        tk.Button(toolbar, text="Encode Images", width=15, height=2, 
-                 relief=tk.RAISED, bd=2, command=self.encode_images).pack(side='left', padx=2, pady=2)
-        
-        tk.Button(toolbar, text="Decode WAV", width=15, height=2,
-                 relief=tk.RAISED, bd=2, command=self.decode_wav).pack(side='left', padx=2, pady=2)
-        
-        tk.Frame(toolbar, width=2, bg='#808080', relief=tk.SUNKEN, bd=1).pack(side='left', fill='y', padx=5)
-        
-        tk.Button(toolbar, text="Clear Log", width=12, height=2,
-                 relief=tk.RAISED, bd=2, command=self.clear_log).pack(side='left', padx=2, pady=2)
-        
-        # Settings panel
-        settings_frame = tk.LabelFrame(main_frame, text="Settings", bg='#C0C0C0', 
-                                      relief=tk.GROOVE, bd=2, padx=10, pady=10)
-        settings_frame.pack(side='top', fill='x', padx=5, pady=5)
-        
-        # Quality settings
-        quality_frame = tk.Frame(settings_frame, bg='#C0C0C0')
-        quality_frame.pack(side='left', padx=10)
-        
-        tk.Label(quality_frame, text="Quality Mode:", bg='#C0C0C0').pack(anchor='w')
-        quality_combo = ttk.Combobox(quality_frame, textvariable=self.quality_mode, 
-                                    state='readonly', width=12)
-        quality_combo['values'] = ('LOW', 'MEDIUM', 'HIGH', 'MAX', 'ORIGINAL')
-        quality_combo.pack()
-        
-        # Compression settings
-        compression_frame = tk.Frame(settings_frame, bg='#C0C0C0')
-        compression_frame.pack(side='left', padx=10)
-        
-        tk.Checkbutton(compression_frame, text="Enable Compression", 
-                      variable=self.compression_enabled, bg='#C0C0C0').pack(anchor='w')
-        
-        level_frame = tk.Frame(compression_frame, bg='#C0C0C0')
-        level_frame.pack(fill='x')
-        tk.Label(level_frame, text="Level (0-9):", bg='#C0C0C0').pack(side='left')
-        tk.Spinbox(level_frame, from_=0, to=9, textvariable=self.compression_level, 
-                  width=5, relief=tk.SUNKEN, bd=1).pack(side='left', padx=5)
-        
-        # Separator
-        separator = tk.Frame(main_frame, height=2, bg='#808080', relief=tk.SUNKEN, bd=1)
-        separator.pack(fill='x', padx=5, pady=5)
-        
-        # Log panel
-        log_frame = tk.LabelFrame(main_frame, text="Log", bg='#C0C0C0', 
-                                 relief=tk.GROOVE, bd=2)
-        log_frame.pack(fill='both', expand=True, padx=5, pady=5)
-        
-        self.log_text = scrolledtext.ScrolledText(log_frame, height=15, 
-                                                  bg='white', fg='black',
-                                                  relief=tk.SUNKEN, bd=2,
-                                                  font=('Courier', 9))
-        self.log_text.pack(fill='both', expand=True, padx=5, pady=5)
-        
-        # Status bar
-        self.status_bar = tk.Label(root, text="Ready", bd=1, relief=tk.SUNKEN, 
-                                  anchor='w', bg='#C0C0C0')
-        self.status_bar.pack(side='bottom', fill='x')
-        
-        self.log("Application started")
-    
-    def log(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
-    
-    def clear_log(self):
-        self.log_text.delete(1.0, tk.END)
-    
-    def update_status(self, message):
-        self.status_bar.config(text=message)
-        self.root.update_idletasks()
-    
-    def show_about(self):
-        messagebox.showinfo("About", 
-                           "Image to WAV Converter\n\n" +
-                           "Encodes images into WAV audio files\n" +
-                           "and decodes them back to images.\n\n" +
-                           "Version 1.0")
-    
-    def encode_header(self, width, height, original_width, original_height, is_compressed, uncompressed_size):
-        header = struct.pack('<HHHH', width, height, original_width, original_height)
-        header += struct.pack('B', 1 if is_compressed else 0)
-        header += struct.pack('<I', uncompressed_size)
-        return header
-    
-    def decode_header(self, data):
-        width, height, original_w, original_h = struct.unpack('<HHHH', data[:8])
-        is_compressed = struct.unpack('B', data[8:9])[0] == 1
-        uncompressed_size = struct.unpack('<I', data[9:13])[0]
-        return width, height, original_w, original_h, is_compressed, uncompressed_size
-    
-    def encode_images(self):
-        files = filedialog.askopenfilenames(
-            title="Select Images to Encode",
-            filetypes=[
-                ("All Images", "*.png *.jpg *.jpeg *.bmp *.gif *.tiff *.tif *.webp"),
-                ("PNG files", "*.png"),
-                ("JPEG files", "*.jpg *.jpeg"),
-                ("All files", "*.*")
-            ]
-        )
-        
-        if not files:
-            return
-        
-        output_dir = filedialog.askdirectory(title="Select Output Directory")
-        if not output_dir:
-            return
-        
-        def encode_thread():
-            self.update_status("Encoding...")
-            successful = 0
-            failed = 0
-            
-            max_size = self.quality_settings[self.quality_mode.get()]
-            enable_compression = self.compression_enabled.get()
-            compression_level = self.compression_level.get()
-            
-            self.log(f"--- Encoding {len(files)} file(s) ---")
-            self.log(f"Quality: {self.quality_mode.get()}")
-            self.log(f"Compression: {'ON (level ' + str(compression_level) + ')' if enable_compression else 'OFF'}")
-            self.log("-" * 50)
-            
-            for image_file in files:
-                try:
-                    self.log(f"\nProcessing: {os.path.basename(image_file)}")
-                    
-                    img = Image.open(image_file)
-                    
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                        img = background
-                    else:
-                        img = img.convert("RGB")
-                    
-                    original_w, original_h = img.size
-                    self.log(f"  Original: {original_w}x{original_h}")
-                    
-                    if max_size is not None:
-                        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                        w, h = img.size
-                        self.log(f"  Encoded: {w}x{h}")
-                    else:
-                        w, h = original_w, original_h
-                    
-                    pixel_data = bytearray()
-                    for y in range(h):
-                        for x in range(w):
-                            r, g, b = img.getpixel((x, y))
-                            pixel_data.extend(struct.pack('BBB', r, g, b))
-                    
-                    uncompressed_size = len(pixel_data)
-                    
-                    if enable_compression:
-                        compressed_data = zlib.compress(bytes(pixel_data), level=compression_level)
-                        ratio = (len(compressed_data) / uncompressed_size) * 100
-                        self.log(f"  Compressed: {uncompressed_size:,} -> {len(compressed_data):,} bytes ({ratio:.1f}%)")
-                        final_data = compressed_data
-                    else:
-                        final_data = pixel_data
-                    
-                    base_name = os.path.splitext(os.path.basename(image_file))[0]
-                    out_file = os.path.join(output_dir, f"{base_name}_encoded.wav")
-                    
-                    with wave.open(out_file, 'wb') as wav:
-                        wav.setnchannels(self.channels)
-                        wav.setsampwidth(self.sample_width)
-                        wav.setframerate(self.sample_rate)
-                        
-                        audio_data = bytearray()
-                        audio_data.extend(self.encode_header(w, h, original_w, original_h, 
-                                                            enable_compression, uncompressed_size))
-                        audio_data.extend(final_data)
-                        
-                        if len(audio_data) % 2 != 0:
-                            audio_data.append(0)
-                        
-                        wav.writeframes(bytes(audio_data))
-                    
-                    file_size = os.path.getsize(out_file)
-                    self.log(f"  Saved: {os.path.basename(out_file)} ({file_size/1024:.1f} KB)")
-                    successful += 1
-                    
-                except Exception as e:
-                    self.log(f"  ERROR: {str(e)}")
-                    failed += 1
-            
-            self.log("\n" + "=" * 50)
-            self.log(f"Complete! Success: {successful} | Failed: {failed}")
-            self.update_status("Ready")
-            messagebox.showinfo("Encoding Complete", 
-                              f"Encoded {successful} file(s)\nFailed: {failed}")
-        
-        threading.Thread(target=encode_thread, daemon=True).start()
-    
-    def decode_wav(self):
-        files = filedialog.askopenfilenames(
-            title="Select WAV Files to Decode",
-            filetypes=[
-                ("WAV files", "*.wav"),
-                ("All files", "*.*")
-            ]
-        )
-        
-        if not files:
-            return
-        
-        output_dir = filedialog.askdirectory(title="Select Output Directory")
-        if not output_dir:
-            return
-        
-        def decode_thread():
-            self.update_status("Decoding...")
-            successful = 0
-            failed = 0
-            
-            self.log(f"\n--- Decoding {len(files)} file(s) ---")
-            self.log("-" * 50)
-            
-            for wav_file in files:
-                try:
-                    self.log(f"\nProcessing: {os.path.basename(wav_file)}")
-                    
-                    with wave.open(wav_file, 'rb') as wav:
-                        audio_data = wav.readframes(wav.getnframes())
-                    
-                    w, h, original_w, original_h, is_compressed, uncompressed_size = self.decode_header(audio_data)
-                    
-                    self.log(f"  Encoded: {w}x{h}")
-                    self.log(f"  Original: {original_w}x{original_h}")
-                    self.log(f"  Compression: {'YES' if is_compressed else 'NO'}")
-                    
-                    pixel_data_raw = audio_data[13:]
-                    
-                    if is_compressed:
-                        pixel_data = zlib.decompress(pixel_data_raw)
-                        self.log(f"  Decompressed: {len(pixel_data):,} bytes")
-                    else:
-                        pixel_data = pixel_data_raw
-                    
-                    img = Image.new('RGB', (w, h), color=(0, 0, 0))
-                    pixels = img.load()
-                    
-                    offset = 0
-                    for y in range(h):
-                        for x in range(w):
-                            if offset + 2 < len(pixel_data):
-                                r = pixel_data[offset]
-                                g = pixel_data[offset + 1]
-                                b = pixel_data[offset + 2]
-                                pixels[x, y] = (r, g, b)
-                                offset += 3
-                    
-                    img_final = img.resize((original_w, original_h), Image.Resampling.LANCZOS)
-                    
-                    base_name = os.path.splitext(os.path.basename(wav_file))[0].replace("_encoded", "")
-                    out_file = os.path.join(output_dir, f"{base_name}_decoded.png")
-                    img_final.save(out_file)
-                    
-                    self.log(f"  Saved: {os.path.basename(out_file)}")
-                    successful += 1
-                    
-                except Exception as e:
-                    self.log(f"  ERROR: {str(e)}")
-                    failed += 1
-            
-            self.log("\n" + "=" * 50)
-            self.log(f"Complete! Success: {successful} | Failed: {failed}")
-            self.update_status("Ready")
-            messagebox.showinfo("Decoding Complete", 
-                              f"Decoded {successful} file(s)\nFailed: {failed}")
-        
-        threading.Thread(target=decode_thread, daemon=True).start()
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = ImageWAVConverter(root)
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox, scrolledtext
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from batch import run_batch
+from compression import AUTO, codec_names
+from filters import FILTER_NAMES
+from output import OUTPUT_PROFILES, get_profile
+from palette import PALETTE_OPTIONS
+from profiling import RunStats
+from wav_codec import QUALITY_SETTINGS, RESIZE_MODES, EncodeOptions, encode_image_file, decode_wav_file
+
+PREVIEW_SIZE = 256  # Longest side of "Decode Preview Only" thumbnails
+JOBS = 1  # Default worker processes (0 = one per CPU core)
+MAX_LOG_LINES = 2000  # Oldest log lines are dropped beyond this
+POLL_MS = 100  # How often the UI drains messages from the worker thread
+MAX_MESSAGES_PER_POLL = 500  # Keeps each drain short so the window stays responsive
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def encode_report(result, max_size):
+    """
+    Log lines describing one EncodeResult
+    """
+    original_w, original_h = result.original_size
+    lines = [f"  Original: {original_w}x{original_h}"]
+    
+    if max_size is not None:
+        w, h = result.encoded_size
+        lines.append(f"  Encoded: {w}x{h}")
+    
+    if result.mode != "RGB":
+        lines.append(f"  Pixel mode: {result.mode}")
+    if result.palette_colors is not None:
+        lines.append(f"  Palette: {result.palette_colors} colors, {result.index_bits}-bit indices")
+    if result.frame_count > 1:
+        lines.append(f"  Animation: {result.frame_count} frames ({result.keyframe_count} keyframe(s))")
+    if result.codec_auto:
+        lines.append(f"  Codec: {result.codec} (auto)")
+    if result.level_auto and result.level is not None:
+        lines.append(f"  Level: {result.level} (auto)")
+    if result.compressed_size is not None:
+        ratio = (result.compressed_size / result.uncompressed_size) * 100
+        lines.append(f"  Compressed ({result.codec}): {result.uncompressed_size:,} -> {result.compressed_size:,} bytes ({ratio:.1f}%)")
+    
+    lines.append(f"  Saved: {os.path.basename(result.out_file)} ({result.file_size/1024:.1f} KB)")
+    return lines
+
+def decode_report(result):
+    """
+    Log lines describing one DecodeResult
+    """
+    w, h = result.encoded_size
+    original_w, original_h = result.original_size
+    
+    lines = [f"  Encoded: {w}x{h} ({result.mode})",
+             f"  Original: {original_w}x{original_h}",
+             f"  Compression: {'YES (' + result.codec + ')' if result.is_compressed else 'NO'}"]
+    if result.filter != "none":
+        lines.append(f"  Filter: {result.filter}")
+    if result.palette_colors is not None:
+        lines.append(f"  Palette: {result.palette_colors} colors")
+    if result.frame_count > 1:
+        lines.append(f"  Animation: {result.frame_count} frames" if result.frame is None
+                     else f"  Frame: {result.frame} of {result.frame_count}")
+    
+    if result.preview is not None:
+        lines.append(f"  Preview: max {result.preview}x{result.preview}")
+    elif result.is_compressed:
+        lines.append(f"  Decompressed: {result.decompressed_size:,} bytes")
+    
+    out_w, out_h = result.output_size
+    lines.append(f"  Saved: {os.path.basename(result.out_file)} ({out_w}x{out_h})")
+    lines.append("  Time: " + " | ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in result.timings.items()))
+    return lines
+
+class ImageWAVConverter:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Image to WAV Converter")
+        self.root.geometry("700x500")
+        self.root.configure(bg='#C0C0C0')
+        
+        # Configuration
+        self.compression_enabled = tk.BooleanVar(value=True)
+        self.compression_level = tk.IntVar(value=9)
+        self.compression_codec = tk.StringVar(value="zlib")
+        self.auto_level = tk.BooleanVar(value=False)
+        self.row_filter = tk.StringVar(value="none")
+        self.embed_pyramid = tk.BooleanVar(value=False)
+        self.flatten = tk.BooleanVar(value=False)
+        self.palette = tk.StringVar(value="auto")
+        self.preview_only = tk.BooleanVar(value=False)
+        self.show_timings = tk.BooleanVar(value=False)
+        self.output_profile = tk.StringVar(value="exact")
+        self.quality_mode = tk.StringVar(value="HIGH")
+        self.resize_mode = tk.StringVar(value="exact")
+        self.jobs = tk.IntVar(value=JOBS)
+        
+        self.quality_settings = QUALITY_SETTINGS
+        
+        # Worker thread -> UI messages, drained by poll_messages() on the Tk main loop
+        self.messages = queue.Queue()
+        self.cancel_event = None
+        self.batch_label = ""
+        self.batch_start = 0.0
+        
+        # Create menu bar
+        menubar = tk.Menu(root)
+        root.config(menu=menubar)
+        
+        file_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="File", menu=file_menu)
+        file_menu.add_command(label="Exit", command=self.on_close)
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        help_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Help", menu=help_menu)
+        help_menu.add_command(label="About", command=self.show_about)
+        
+        # Create main container with border
+        main_frame = tk.Frame(root, bg='#C0C0C0', relief=tk.SUNKEN, bd=2)
+        main_frame.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        # Toolbar
+        toolbar = tk.Frame(main_frame, bg='#C0C0C0', relief=tk.RAISED, bd=2)
+        toolbar.pack(side='top', fill='x', padx=2, pady=2)
+        
+        tk.Button(toolbar, text="Encode Images", width=15, height=2, 
+                 relief=tk.RAISED, bd=2, command=self.encode_images).pack(side='left', padx=2, pady=2)
+        
+        tk.Button(toolbar, text="Decode WAV", width=15, height=2,
+                 relief=tk.RAISED, bd=2, command=self.decode_wav).pack(side='left', padx=2, pady=2)
+        
+        tk.Frame(toolbar, width=2, bg='#808080', relief=tk.SUNKEN, bd=1).pack(side='left', fill='y', padx=5)
+        
+        tk.Button(toolbar, text="Clear Log", width=12, height=2,
+                 relief=tk.RAISED, bd=2, command=self.clear_log).pack(side='left', padx=2, pady=2)
+        
+        # Settings panel
+        settings_frame = tk.LabelFrame(main_frame, text="Settings", bg='#C0C0C0', 
+                                      relief=tk.GROOVE, bd=2, padx=10, pady=10)
+        settings_frame.pack(side='top', fill='x', padx=5, pady=5)
+        
+        # Quality settings
+        quality_frame = tk.Frame(settings_frame, bg='#C0C0C0')
+        quality_frame.pack(side='left', padx=10)
+        
+        tk.Label(quality_frame, text="Quality Mode:", bg='#C0C0C0').pack(anchor='w')
+        quality_combo = ttk.Combobox(quality_frame, textvariable=self.quality_mode, 
+                                    state='readonly', width=12)
+        quality_combo['values'] = ('LOW', 'MEDIUM', 'HIGH', 'MAX', 'ORIGINAL')
+        quality_combo.pack()
+        
+        tk.Label(quality_frame, text="Resize:", bg='#C0C0C0').pack(anchor='w')
+        resize_combo = ttk.Combobox(quality_frame, textvariable=self.resize_mode,
+                                   state='readonly', width=12)
+        resize_combo['values'] = RESIZE_MODES
+        resize_combo.pack()
+        
+        tk.Label(quality_frame, text="Workers (0 = all cores):", bg='#C0C0C0').pack(anchor='w')
+        tk.Spinbox(quality_frame, from_=0, to=64, textvariable=self.jobs,
+                  width=5, relief=tk.SUNKEN, bd=1).pack(anchor='w')
+        
+        # Compression settings
+        compression_frame = tk.Frame(settings_frame, bg='#C0C0C0')
+        compression_frame.pack(side='left', padx=10)
+        
+        tk.Checkbutton(compression_frame, text="Enable Compression", 
+                      variable=self.compression_enabled, bg='#C0C0C0').pack(anchor='w')
+        
+        level_frame = tk.Frame(compression_frame, bg='#C0C0C0')
+        level_frame.pack(fill='x')
+        tk.Label(level_frame, text="Level (0-9):", bg='#C0C0C0').pack(side='left')
+        tk.Spinbox(level_frame, from_=0, to=9, textvariable=self.compression_level, 
+                  width=5, relief=tk.SUNKEN, bd=1).pack(side='left', padx=5)
+        tk.Checkbutton(level_frame, text="Auto", variable=self.auto_level,
+                      bg='#C0C0C0').pack(side='left')
+        
+        codec_frame = tk.Frame(compression_frame, bg='#C0C0C0')
+        codec_frame.pack(fill='x')
+        tk.Label(codec_frame, text="Codec:", bg='#C0C0C0').pack(side='left')
+        codec_combo = ttk.Combobox(codec_frame, textvariable=self.compression_codec,
+                                  state='readonly', width=8)
+        codec_combo['values'] = tuple(codec_names()) + (AUTO,)
+        codec_combo.pack(side='left', padx=5)
+        
+        filter_frame = tk.Frame(compression_frame, bg='#C0C0C0')
+        filter_frame.pack(fill='x')
+        tk.Label(filter_frame, text="Filter:", bg='#C0C0C0').pack(side='left')
+        filter_combo = ttk.Combobox(filter_frame, textvariable=self.row_filter,
+                                   state='readonly', width=8)
+        filter_combo['values'] = FILTER_NAMES
+        filter_combo.pack(side='left', padx=5)
+        
+        palette_frame = tk.Frame(compression_frame, bg='#C0C0C0')
+        palette_frame.pack(fill='x')
+        tk.Label(palette_frame, text="Palette:", bg='#C0C0C0').pack(side='left')
+        palette_combo = ttk.Combobox(palette_frame, textvariable=self.palette,
+                                    state='readonly', width=8)
+        palette_combo['values'] = PALETTE_OPTIONS
+        palette_combo.pack(side='left', padx=5)
+        
+        # Preview settings
+        preview_frame = tk.Frame(settings_frame, bg='#C0C0C0')
+        preview_frame.pack(side='left', padx=10)
+        
+        tk.Checkbutton(preview_frame, text="Embed Preview Pyramid",
+                      variable=self.embed_pyramid, bg='#C0C0C0').pack(anchor='w')
+        tk.Checkbutton(preview_frame, text="Flatten Alpha / Grayscale to RGB",
+                      variable=self.flatten, bg='#C0C0C0').pack(anchor='w')
+        tk.Checkbutton(preview_frame, text=f"Decode Preview Only ({PREVIEW_SIZE}px)",
+                      variable=self.preview_only, bg='#C0C0C0').pack(anchor='w')
+        tk.Checkbutton(preview_frame, text="Log Stage Timings",
+                      variable=self.show_timings, bg='#C0C0C0').pack(anchor='w')
+        
+        output_frame = tk.Frame(preview_frame, bg='#C0C0C0')
+        output_frame.pack(fill='x')
+        tk.Label(output_frame, text="Decode Output:", bg='#C0C0C0').pack(side='left')
+        output_combo = ttk.Combobox(output_frame, textvariable=self.output_profile,
+                                   state='readonly', width=8)
+        output_combo['values'] = tuple(OUTPUT_PROFILES)
+        output_combo.pack(side='left', padx=5)
+        
+        # Separator
+        separator = tk.Frame(main_frame, height=2, bg='#808080', relief=tk.SUNKEN, bd=1)
+        separator.pack(fill='x', padx=5, pady=5)
+        
+        # Log panel
+        log_frame = tk.LabelFrame(main_frame, text="Log", bg='#C0C0C0', 
+                                 relief=tk.GROOVE, bd=2)
+        log_frame.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        self.log_text = scrolledtext.ScrolledText(log_frame, height=15, 
+                                                  bg='white', fg='black',
+                                                  relief=tk.SUNKEN, bd=2,
+                                                  font=('Courier', 9))
+        self.log_text.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        # Status bar with progress and cancel
+        status_frame = tk.Frame(root, bg='#C0C0C0')
+        status_frame.pack(side='bottom', fill='x')
+        
+        self.cancel_button = tk.Button(status_frame, text="Cancel", width=10, relief=tk.RAISED, bd=2,
+                                       state=tk.DISABLED, command=self.cancel_batch)
+        self.cancel_button.pack(side='right', padx=2, pady=1)
+        
+        self.progress = ttk.Progressbar(status_frame, mode='determinate', length=200)
+        self.progress.pack(side='right', padx=2, pady=1)
+        
+        self.status_bar = tk.Label(status_frame, text="Ready", bd=1, relief=tk.SUNKEN, 
+                                  anchor='w', bg='#C0C0C0')
+        self.status_bar.pack(side='left', fill='x', expand=True)
+        
+        self.log("Application started")
+        self.poll_messages()
+    
+    def log(self, message):
+        """
+        Queue a log line (safe to call from any thread)
+        """
+        self.messages.put(("log", message))
+    
+    def append_log(self, lines):
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        
+        # Keep only the newest MAX_LOG_LINES lines
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > MAX_LOG_LINES:
+            self.log_text.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
+        self.log_text.see(tk.END)
+    
+    def poll_messages(self):
+        """
+        Drain queued worker messages in one batch, then reschedule itself
+        """
+        lines = []
+        for _ in range(MAX_MESSAGES_PER_POLL):
+            try:
+                kind, *payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            
+            if kind == "log":
+                lines.append(payload[0])
+                continue
+            
+            # Keep the log in order with progress and completion messages
+            if lines:
+                self.append_log(lines)
+                lines = []
+            if kind == "progress":
+                self.update_progress(*payload)
+            elif kind == "done":
+                self.finish_batch(*payload)
+        
+        if lines:
+            self.append_log(lines)
+        self.root.after(POLL_MS, self.poll_messages)
+    
+    def log_stats(self, stats):
+        if not self.show_timings.get() or not stats.files:
+            return
+        lines = [f"\nStage timings ({len(stats.files)} file(s)):"]
+        lines.extend(f"  {line}" for line in stats.format_summary())
+        self.append_log(lines)
+
+    def clear_log(self):
+        self.log_text.delete(1.0, tk.END)
+    
+    def update_status(self, message):
+        self.status_bar.config(text=message)
+    
+    def update_progress(self, done, total):
+        self.progress.config(maximum=max(total, 1), value=done)
+        
+        status = f"{self.batch_label} {done}/{total} ({done * 100 // max(total, 1)}%)"
+        if self.cancel_event.is_set():
+            status += " - cancelling, finishing files in progress..."
+        elif 0 < done < total:
+            elapsed = time.perf_counter() - self.batch_start
+            status += f" - ETA {format_duration(elapsed / done * (total - done))}"
+        self.update_status(status)
+    
+    def is_busy(self):
+        if self.cancel_event is None:
+            return False
+        messagebox.showwarning("Busy", "Wait for the current batch to finish or cancel it first.")
+        return True
+    
+    def read_int(self, variable, name, low, high):
+        """
+        Value of an IntVar bound to a free-text Spinbox, or None after telling the user it's invalid
+        """
+        try:
+            value = variable.get()
+        except tk.TclError:
+            value = None
+        if value is None or not low <= value <= high:
+            messagebox.showerror("Invalid Setting", f"{name} must be a whole number from {low} to {high}.")
+            return None
+        return value
+    
+    def start_batch(self, label, func, files, jobs, output_dir, report, *args, **kwargs):
+        """
+        Run func(file, output_dir, *args, **kwargs) for every file on a background thread
+        Settings are read and validated by the caller on the main thread; the
+        worker only queues messages.
+        """
+        self.cancel_event = threading.Event()
+        self.batch_label = label
+        self.batch_start = time.perf_counter()
+        self.cancel_button.config(state=tk.NORMAL)
+        self.update_progress(0, len(files))
+        
+        threading.Thread(target=self.batch_thread, daemon=True,
+                         args=(func, files, jobs, output_dir, report, args, kwargs,
+                               self.cancel_event)).start()
+    
+    def batch_thread(self, func, files, jobs, output_dir, report, args, kwargs, cancel_event):
+        successful = 0
+        failed = 0
+        stats = RunStats()
+        
+        results = run_batch(func, files, jobs, output_dir, *args, **kwargs)
+        try:
+            for item, result, error in results:
+                self.log(f"\nProcessing: {os.path.basename(item)}")
+                if error is None:
+                    for line in report(result):
+                        self.log(line)
+                    stats.add(item, result.timings)
+                    successful += 1
+                else:
+                    self.log(f"  ERROR: {error.strip().splitlines()[-1]}")
+                    failed += 1
+                
+                self.messages.put(("progress", successful + failed, len(files)))
+                if cancel_event.is_set():
+                    break
+        except Exception as e:
+            self.log(f"  ERROR: batch stopped: {type(e).__name__}: {e}")
+        finally:
+            try:
+                # Cancels queued work and waits for files already being processed
+                results.close()
+            finally:
+                # Always sent, so the GUI leaves the busy state whatever happened
+                self.messages.put(("done", successful, failed, len(files) - successful - failed, stats))
+    
+    def finish_batch(self, successful, failed, cancelled, stats):
+        title = f"{self.batch_label} Complete"
+        summary = f"Complete! Success: {successful} | Failed: {failed}"
+        if cancelled:
+            title = f"{self.batch_label} Cancelled"
+            summary += f" | Cancelled: {cancelled}"
+        
+        self.append_log(["\n" + "=" * 50, summary])
+        self.log_stats(stats)
+        self.update_status(f"Ready - {summary} in {format_duration(time.perf_counter() - self.batch_start)}")
+        self.cancel_button.config(state=tk.DISABLED)
+        self.cancel_event = None
+        messagebox.showinfo(title, summary.replace(" | ", "\n"))
+    
+    def cancel_batch(self):
+        if self.cancel_event is None:
+            return
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.update_status(f"{self.batch_label} - cancelling, finishing files in progress...")
+    
+    def on_close(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.root.destroy()
+    
+    def show_about(self):
+        messagebox.showinfo("About", 
+                           "Image to WAV Converter\n\n" +
+                           "Encodes images into WAV audio files\n" +
+                           "and decodes them back to images.\n\n" +
+                           "Version 1.0")
+    
+    def encode_images(self):
+        if self.is_busy():
+            return
+        
+        jobs = self.read_int(self.jobs, "Workers", 0, 64)
+        if jobs is None:
+            return
+        if self.auto_level.get():
+            compression_level = AUTO
+        else:
+            compression_level = self.read_int(self.compression_level, "Compression level", 0, 9)
+            if compression_level is None:
+                return
+        
+        files = filedialog.askopenfilenames(
+            title="Select Images to Encode",
+            filetypes=[
+                ("All Images", "*.png *.jpg *.jpeg *.bmp *.gif *.tiff *.tif *.webp"),
+                ("PNG files", "*.png"),
+                ("JPEG files", "*.jpg *.jpeg"),
+                ("All files", "*.*")
+            ]
+        )
+        
+        if not files:
+            return
+        
+        output_dir = filedialog.askdirectory(title="Select Output Directory")
+        if not output_dir:
+            return
+        
+        max_size = self.quality_settings[self.quality_mode.get()]
+        enable_compression = self.compression_enabled.get()
+        codec = self.compression_codec.get()
+        row_filter = self.row_filter.get()
+        options = EncodeOptions(max_size=max_size, enable_compression=enable_compression,
+                                compression_level=compression_level, codec=codec, filter=row_filter,
+                                pyramid=self.embed_pyramid.get(), flatten=self.flatten.get(),
+                                palette=self.palette.get(), resize=self.resize_mode.get())
+        
+        self.log(f"--- Encoding {len(files)} file(s) ---")
+        self.log(f"Quality: {self.quality_mode.get()} ({self.resize_mode.get()} resize)")
+        self.log(f"Compression: {'ON (' + codec + ', level ' + str(compression_level) + ')' if enable_compression else 'OFF'}")
+        self.log(f"Filter: {row_filter}")
+        self.log(f"Palette: {self.palette.get()}")
+        self.log("-" * 50)
+        
+        self.start_batch("Encoding", encode_image_file, files, jobs, output_dir,
+                         lambda result: encode_report(result, max_size), options)
+    
+    def decode_wav(self):
+        if self.is_busy():
+            return
+        
+        jobs = self.read_int(self.jobs, "Workers", 0, 64)
+        if jobs is None:
+            return
+        
+        files = filedialog.askopenfilenames(
+            title="Select WAV Files to Decode",
+            filetypes=[
+                ("WAV files", "*.wav"),
+                ("All files", "*.*")
+            ]
+        )
+        
+        if not files:
+            return
+        
+        output_dir = filedialog.askdirectory(title="Select Output Directory")
+        if not output_dir:
+            return
+        
+        preview = PREVIEW_SIZE if self.preview_only.get() else None
+        profile = get_profile(self.output_profile.get())
+        
+        self.log(f"\n--- Decoding {len(files)} file(s) ---")
+        self.log(f"Output: {self.output_profile.get()}")
+        self.log("-" * 50)
+        
+        self.start_batch("Decoding", decode_wav_file, files, jobs, output_dir, decode_report,
+                         preview=preview, profile=profile)
+
+if __name__ == "__main__":
+    # In the frozen exe, pool workers start this script again; let them run their job instead of a new window
+    multiprocessing.freeze_support()
+    root = tk.Tk()
+    app = ImageWAVConverter(root)
     root.mainloop()
\ No newline at end of file
@@ -1,110 +1,341 @@
-import wave
-import struct
-import os
-import glob
-import zlib
-from PIL import Image
-
-# ---------- CONFIG ----------
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-WAV_FOLDER = os.path.join(SCRIPT_DIR, "wav_output")
-OUT_FOLDER = os.path.join(SCRIPT_DIR, "decoded_images")
-
-os.makedirs(OUT_FOLDER, exist_ok=True)
-
-# ---------- DECODING ----------
-def decode_header(data):
-    """
-    Decode header from first 13 bytes
-    Returns: (width, height, original_width, original_height, is_compressed, uncompressed_size)
-    """
-    width, height, original_w, original_h = struct.unpack('<HHHH', data[:8])
-    is_compressed = struct.unpack('B', data[8:9])[0] == 1
-    uncompressed_size = struct.unpack('<I', data[9:13])[0]
-    
-    return width, height, original_w, original_h, is_compressed, uncompressed_size
-
-# ---------- FIND WAV FILES ----------
-wav_pattern = os.path.join(WAV_FOLDER, "*_encoded.wav")
-wav_files = glob.glob(wav_pattern)
-
-if not wav_files:
-    print(f"No encoded WAV files found in: {WAV_FOLDER}")
-    print(f"Please run the encoder script first!")
-    exit()
-
-print(f"Found {len(wav_files)} WAV file(s)")
-print("-" * 50)
-
-# ---------- DECODE EACH WAV ----------
-successful = 0
-failed = 0
-
-for wav_file in wav_files:
-    print(f"\nDecoding: {os.path.basename(wav_file)}")
-    
-    try:
-        # Open WAV file
-        with wave.open(wav_file, 'rb') as wav:
-            audio_data = wav.readframes(wav.getnframes())
-        
-        # Decode header (first 13 bytes)
-        w, h, original_w, original_h, is_compressed, uncompressed_size = decode_header(audio_data)
-        
-        print(f"  Encoded size: {w}x{h} pixels")
-        print(f"  Original size: {original_w}x{original_h} pixels")
-        print(f"  Compression: {'YES' if is_compressed else 'NO'}")
-        
-        # Extract pixel data (after 13-byte header)
-        pixel_data_raw = audio_data[13:]
-        
-        # Decompress if needed
-        if is_compressed:
-            print(f"  Decompressing {len(pixel_data_raw):,} bytes...")
-            pixel_data = zlib.decompress(pixel_data_raw)
-            print(f"  ✓ Decompressed to {len(pixel_data):,} bytes")
-        else:
-            pixel_data = pixel_data_raw
-        
-        # Create image
-        img = Image.new('RGB', (w, h), color=(0, 0, 0))
-        pixels = img.load()
-        
-        # Decode pixels
-        offset = 0
-        pixel_count = 0
-        
-        for y in range(h):
-            for x in range(w):
-                if offset + 2 < len(pixel_data):
-                    r = pixel_data[offset]
-                    g = pixel_data[offset + 1]
-                    b = pixel_data[offset + 2]
-                    
-                    pixels[x, y] = (r, g, b)
-                    pixel_count += 1
-                    
-                    offset += 3
-        
-        # Resize to original dimensions
-        img_final = img.resize((original_w, original_h), Image.Resampling.LANCZOS)
-        
-        # Save
-        base_name = os.path.splitext(os.path.basename(wav_file))[0].replace("_encoded", "")
-        out_file = os.path.join(OUT_FOLDER, f"{base_name}_decoded.png")
-        img_final.save(out_file)
-        
-        print(f"  ✓ Decoded {pixel_count:,} pixels")
-        print(f"  ✓ Resized to original dimensions")
-        print(f"  ✓ Saved: {out_file}")
-        
-        successful += 1
-        
-    except Exception as e:
-        print(f"  ✗ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        failed += 1
-
-print("\n" + "=" * 50)
-print(f"Decoding complete! Success: {successful} | Failed: {failed}")
\ No newline at end of file
+import argparse
+import contextlib
+import dataclasses
+import os
+import sys
+from archive import extract_entry, list_archive, output_clashes
+from batch import run_batch
+from discovery import WAV_EXTENSIONS, iter_files
+from manifest import Manifest
+from output import OUTPUT_FORMATS, OUTPUT_PROFILES, RESAMPLERS, get_profile
+from profiling import RunStats, cprofile_to
+from wav_codec import decode_wav_bytes, decode_wav_file
+from wav_stream import stream_decode_wav_file
+
+# ---------- CONFIG ----------
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WAV_FOLDER = os.path.join(SCRIPT_DIR, "wav_output")
+OUT_FOLDER = os.path.join(SCRIPT_DIR, "decoded_images")
+
+# STREAMING - decode in row strips with bounded memory (PNG written without filtering)
+ENABLE_STREAMING = False
+
+# PREVIEW - decode only a thumbnail of at most N x N pixels, e.g. 256. Files
+# encoded with a preview pyramid are served from it without touching the full image.
+PREVIEW_SIZE = None
+
+# OUTPUT - how decoded images are written:
+# "exact"  = upscale to the original size with Lanczos, default PNG (slowest)
+# "fast"   = upscale with bilinear, PNG compress level 1
+# "native" = keep the stored (encoded) size, PNG compress level 1
+# "raw"    = keep the stored size, PPM (header + pixel rows, no compression)
+# Animations are written whole as APNG, one PPM per frame in a single file, or a
+# (frames, height, width, channels) .npy; --frame N extracts one frame instead.
+OUTPUT_PROFILE = "exact"
+
+# PARALLELISM - worker processes for batch decoding (0 = one per CPU core)
+JOBS = 1
+# Threads inflating the strips of one image (strip-layout files only)
+THREADS = 1
+
+# INCREMENTAL - skip WAVs already decoded with the same settings (tracked in a
+# manifest in OUT_FOLDER) and delete images decoded from WAVs that no longer exist
+INCREMENTAL = True
+
+# PROFILING - print per-stage timings (read, decompress, unpack, resize, save, ...)
+PROFILE = False
+
+# ---------- ARGUMENTS ----------
+def parse_region(text):
+    """
+    Parse "left,top,right,bottom" (original image pixels)
+    """
+    try:
+        left, top, right, bottom = (int(v) for v in text.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("region must be left,top,right,bottom")
+    return left, top, right, bottom
+
+# ---------- FIND WAV FILES ----------
+def find_wav_files(paths=(WAV_FOLDER,), recursive=False, include=("*_encoded.wav",), exclude=()):
+    """
+    Yield (path, subfolder) for every encoded WAV under paths, in one scandir pass per folder
+    """
+    return iter_files(paths, WAV_EXTENSIONS, include, exclude, recursive)
+
+# ---------- REPORT ----------
+def print_result(result):
+    w, h = result.encoded_size
+    original_w, original_h = result.original_size
+    
+    print(f"  Encoded size: {w}x{h} pixels")
+    print(f"  Original size: {original_w}x{original_h} pixels")
+    print(f"  Pixel mode: {result.mode}")
+    if result.palette_colors is not None:
+        print(f"  Palette: {result.palette_colors} colors")
+    if result.frame_count > 1:
+        print(f"  Animation: {result.frame_count} frames")
+    print(f"  Compression: {'YES (' + result.codec + ')' if result.is_compressed else 'NO'}")
+    if result.filter != "none":
+        print(f"  Filter: {result.filter}")
+    if result.strip_count > 1:
+        print(f"  Layout: {result.strip_count} strips")
+    
+    if result.is_compressed and result.region is None and result.preview is None:
+        print(f"  Decompressing {result.stored_size:,} bytes...")
+        print(f"  ✓ Decompressed to {result.decompressed_size:,} bytes")
+    
+    print(f"  ✓ Decoded {result.pixel_count:,} pixels")
+    if result.frame is not None:
+        print(f"  ✓ Frame {result.frame} of {result.frame_count}")
+    elif result.frame_count > 1 and result.region is None and result.preview is None:
+        print(f"  ✓ All {result.frame_count} frames")
+    if result.preview is not None:
+        print(f"  ✓ Preview thumbnail (max {result.preview}x{result.preview})")
+    elif result.region is not None:
+        print(f"  ✓ Region: {result.region}")
+    elif result.output_size == result.original_size:
+        print(f"  ✓ Resized to original dimensions")
+    else:
+        print(f"  ✓ Kept stored dimensions ({w}x{h})")
+    print(f"  ✓ Saved: {result.out_file}")
+    print(f"  Time: {format_timings(result.timings)}")
+
+def format_profile(profile):
+    size = f"original size ({profile.resample})" if profile.resize else "stored size"
+    fmt = f"PNG level {profile.png_level}" if profile.format == "png" else profile.format.upper()
+    return f"{size}, {fmt}"
+
+def format_timings(timings):
+    steps = " | ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in timings.items())
+    return f"{steps} | total {sum(timings.values()) * 1000:.0f}ms"
+
+def print_archive(archive_file, entries):
+    print(f"Archive: {archive_file} ({len(entries)} image(s))")
+    print(f"  {'Name':<32}{'Encoded':>12}{'Original':>12}{'Codec':>8}{'Stored':>14}")
+    for entry in entries:
+        print(f"  {entry.name:<32}{f'{entry.width}x{entry.height}':>12}"
+              f"{f'{entry.original_width}x{entry.original_height}':>12}{entry.codec_name:>8}{entry.length:>14,}")
+
+# ---------- BATCH ----------
+def make_output(args):
+    return get_profile(args.output_profile, format=args.format, resample=args.resample,
+                       png_level=args.png_level, resize=False if args.no_resize else None)
+
+def decode_into(item, out_root, decode, options):
+    """
+    Decode one (path, subfolder) item into the same subfolder of out_root (batch worker)
+    """
+    wav_file, subfolder = item
+    out_dir = os.path.join(out_root, subfolder)
+    os.makedirs(out_dir, exist_ok=True)
+    return decode(wav_file, out_dir, **options)
+
+def decode_files(items, out_folder, args, output):
+    """
+    Decode (path, subfolder) items into out_folder as they arrive
+    items may be a lazy discovery generator: decoding starts with the first
+    file found. Returns: (successful, skipped, failed)
+    """
+    os.makedirs(out_folder, exist_ok=True)
+    
+    manifest = Manifest(out_folder)
+    pruned = manifest.prune()
+    for out_file in pruned:
+        print(f"Pruned: {os.path.basename(out_file)} (WAV deleted)")
+    manifest.save()
+    
+    print(f"Output: {args.output_profile} ({format_profile(output)})")
+    print("-" * 50)
+    
+    # ---------- DECODE EACH WAV ----------
+    successful = 0
+    skipped = 0
+    failed = 0
+    
+    if args.streaming and args.region is None and args.preview is None and args.frame is None:
+        decode, options = stream_decode_wav_file, {"profile": output}
+    else:
+        decode, options = decode_wav_file, {"region": args.region, "threads": args.threads,
+                                            "preview": args.preview, "profile": output, "frame": args.frame}
+    settings = {"region": args.region, "preview": args.preview, "frame": args.frame,
+                "streaming": decode is stream_decode_wav_file, "output": dataclasses.asdict(output)}
+    
+    def pending():
+        # Runs lazily inside the batch, so decoded files are skipped as they are found
+        nonlocal skipped
+        for item in items:
+            if not args.force and manifest.is_current(item[0], settings):
+                skipped += 1
+                continue
+            yield item
+    
+    stats = RunStats()
+    profiler = cprofile_to(args.cprofile) if args.cprofile else contextlib.nullcontext()
+    
+    # Results arrive in completion order
+    try:
+        with profiler:
+            for item, result, error in run_batch(decode_into, pending(), args.jobs, out_folder, decode, options):
+                wav_file = item[0]
+                print(f"\nDecoding: {os.path.basename(wav_file)}")
+                
+                if error is None:
+                    print_result(result)
+                    manifest.record(wav_file, [result.out_file], settings)
+                    stats.add(wav_file, result.timings)
+                    successful += 1
+                else:
+                    print(f"  ✗ Error: {error.strip().splitlines()[-1]}")
+                    print(error, end="")
+                    manifest.forget(wav_file)
+                    failed += 1
+    finally:
+        manifest.save()
+    
+    if successful + skipped + failed == 0:
+        print("No encoded WAV files found")
+        print(f"Please run the encoder script first!")
+        return successful, skipped, failed
+    
+    print("\n" + "=" * 50)
+    print(f"Decoding complete! Success: {successful} | Skipped: {skipped} | Failed: {failed}")
+    if pruned:
+        print(f"Pruned {len(pruned)} image(s) decoded from deleted WAVs")
+    
+    report_stats(stats, args)
+    return successful, skipped, failed
+
+def report_stats(stats, args):
+    """
+    Print the stage timing summary (--profile) and save it (--profile-out)
+    """
+    if args.profile:
+        print(f"\nStage timings ({len(stats.files)} file(s)):")
+        for line in stats.format_summary():
+            print(f"  {line}")
+    if args.profile_out:
+        stats.export(args.profile_out)
+        print(f"✓ Stage timings saved: {args.profile_out}")
+
+# ---------- PIPES ----------
+def decode_pipe(source, dest, args, name="<stdin>"):
+    """
+    Decode one WAV read from a binary file (e.g. stdin) into an image written to dest (e.g. stdout)
+    The report goes to stderr, so dest can be piped on.
+    """
+    data, result = decode_wav_bytes(source, args.region, args.threads, args.preview, make_output(args),
+                                    args.frame, name)
+    dest.write(data)
+    dest.flush()
+    result.out_file = getattr(dest, "name", "<stdout>")
+    with contextlib.redirect_stdout(sys.stderr):
+        print(f"Decoding: {name}")
+        print_result(result)
+    return result
+
+# ---------- MAIN ----------
+def add_decode_arguments(parser):
+    """
+    Decoder options shared with sonicraster.py (defaults from the CONFIG section above)
+    """
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS,
+                        help="worker processes to use (0 = one per CPU core, default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=THREADS,
+                        help="threads inflating the strips of one image (default: %(default)s)")
+    parser.add_argument("--region", type=parse_region, metavar="L,T,R,B",
+                        help="decode only this box of the original image")
+    parser.add_argument("--preview", type=int, default=PREVIEW_SIZE, metavar="N",
+                        help="write only a thumbnail of at most N x N pixels")
+    parser.add_argument("--frame", type=int, metavar="N",
+                        help="write only frame N (from 0) of animated files, decoding from the keyframe before it")
+    parser.add_argument("--output-profile", choices=OUTPUT_PROFILES, default=OUTPUT_PROFILE,
+                        help="resize and file format preset (default: %(default)s)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="override the profile's file format")
+    parser.add_argument("--resample", choices=RESAMPLERS, help="override the profile's resampler")
+    parser.add_argument("--png-level", type=int, choices=range(10), metavar="0-9",
+                        help="override the profile's PNG compression level")
+    parser.add_argument("--no-resize", action="store_true",
+                        help="keep the stored dimensions instead of scaling to the original size")
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=ENABLE_STREAMING,
+                        help="decode in row strips with bounded memory (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", default=not INCREMENTAL,
+                        help="decode every WAV even if it is unchanged")
+    parser.add_argument("--profile", action="store_true", default=PROFILE,
+                        help="print a per-stage timing summary at the end")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="export per-file stage timings to FILE (.json or .csv)")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="run under cProfile and save the stats to FILE (use with -j 1)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode *_encoded.wav files back into images")
+    add_decode_arguments(parser)
+    parser.add_argument("--archive", metavar="FILE",
+                        help="decode images from an archive WAV (looked up in the WAV folder if not found)")
+    parser.add_argument("--name", action="append", metavar="NAME",
+                        help="archive entry to decode (repeatable, default: all)")
+    parser.add_argument("--list", action="store_true",
+                        help="list the archive contents without decoding anything")
+    args = parser.parse_args()
+    output = make_output(args)
+    
+    if args.archive:
+        return decode_archive(args, output)
+    
+    decode_files(find_wav_files(), OUT_FOLDER, args, output)
+
+def decode_archive(args, output):
+    """
+    List or decode entries of one archive WAV (not tracked in the manifest)
+    """
+    archive_file = args.archive
+    if not os.path.exists(archive_file):
+        archive_file = os.path.join(WAV_FOLDER, archive_file)
+    entries = list_archive(archive_file)
+    
+    if args.list:
+        print_archive(archive_file, entries)
+        return
+    
+    names = args.name or [entry.name for entry in entries]
+    try:
+        clashes = output_clashes(names, args.region, args.preview is not None, output.extension, args.frame)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return
+    if clashes:
+        for group in clashes:
+            print(f"✗ Entries would be decoded to the same file: {', '.join(group)}")
+        print("Decode them separately with --name")
+        return
+    
+    print(f"Decoding {len(names)} of {len(entries)} image(s) from {os.path.basename(archive_file)}")
+    print("-" * 50)
+    
+    os.makedirs(OUT_FOLDER, exist_ok=True)
+    successful = 0
+    failed = 0
+    stats = RunStats()
+    options = {"region": args.region, "threads": args.threads, "preview": args.preview,
+               "profile": output, "frame": args.frame}
+    profiler = cprofile_to(args.cprofile) if args.cprofile else contextlib.nullcontext()
+    
+    with profiler:
+        for name, result, error in run_batch(extract_entry, names, args.jobs, archive_file, OUT_FOLDER, **options):
+            print(f"\nDecoding: {name}")
+            
+            if error is None:
+                print_result(result)
+                stats.add(name, result.timings)
+                successful += 1
+            else:
+                print(f"  ✗ Error: {error.strip().splitlines()[-1]}")
+                failed += 1
+    
+    print("\n" + "=" * 50)
+    print(f"Decoding complete! Success: {successful} | Failed: {failed}")
+    report_stats(stats, args)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,78 @@
+"""
+Single-pass file discovery shared by the command-line scripts
+
+Folders are walked once with os.scandir, matching extensions
+case-insensitively, and files are yielded as they are found so a batch can
+start before a large tree has been fully listed. Include/exclude patterns
+are shell wildcards matched against both the file name and the path
+relative to the folder being searched; an excluded folder is not entered.
+"""
+import fnmatch
+import os
+
+# Image formats Pillow can open
+IMAGE_EXTENSIONS = (
+    '.png', '.jpg', '.jpeg', '.bmp', '.gif',
+    '.tiff', '.tif', '.webp', '.ico', '.ppm',
+    '.pgm', '.pbm', '.pnm', '.dib', '.eps',
+    '.im', '.msp', '.pcx', '.sgi', '.tga',
+    '.xbm',
+)
+WAV_EXTENSIONS = ('.wav',)
+
+
+def has_extension(name, extensions):
+    return os.path.splitext(name)[1].lower() in extensions
+
+
+def matches(name, rel_path, patterns):
+    """
+    Whether a file or folder matches any of the wildcard patterns (case-insensitive)
+    """
+    name, rel_path = name.lower(), rel_path.replace(os.sep, '/').lower()
+    return any(fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(rel_path, pattern)
+               for pattern in patterns)
+
+
+def iter_files(paths, extensions, include=(), exclude=(), recursive=True):
+    """
+    Yield (path, subfolder) for every matching file under paths, as it is found
+    subfolder is the file's folder relative to the searched path ("" at the
+    top, and for files named directly). Named files are yielded whatever
+    their extension; a file reached twice is yielded once.
+    """
+    include = [pattern.lower() for pattern in include]
+    exclude = [pattern.lower() for pattern in exclude]
+    seen = set()
+
+    def wanted(path):
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    for path in paths:
+        if not os.path.isdir(path):
+            if wanted(path):
+                yield path, ""
+            continue
+
+        pending = [""]
+        while pending:
+            subfolder = pending.pop()
+            try:
+                entries = os.scandir(os.path.join(path, subfolder))
+            except OSError:
+                continue  # Vanished or unreadable folder
+            with entries:
+                for entry in entries:
+                    rel_path = os.path.join(subfolder, entry.name)
+                    if exclude and matches(entry.name, rel_path, exclude):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            pending.append(rel_path)
+                    elif (has_extension(entry.name, extensions) and entry.is_file()
+                          and (not include or matches(entry.name, rel_path, include)) and wanted(entry.path)):
+                        yield entry.path, subfolder
@@ -0,0 +1,261 @@
+"""
+PNG-style predictive row filters applied to pixel rows before compression
+
+A filtered strip is a sequence of blocks of up to block_rows pixel rows. Each
+row is prefixed with its PNG filter type (0 None, 1 Sub, 2 Up, 3 Average,
+4 Paeth) and predicted from the row above; the first row of every strip
+predicts from a zero row so strips stay independently decodable. In planar
+mode every block stores its R, G and B planes one after another, each
+filtered as a one-byte-per-pixel image.
+
+Filtering needs NumPy. Unfiltering does not: filtered rows are exactly PNG
+scanlines, so Pillow's PNG decoder undoes them in C.
+"""
+import io
+import struct
+import zlib
+from dataclasses import dataclass
+
+from PIL import Image
+
+# ---------- CONFIG ----------
+BLOCK_ROWS = 64
+
+FILTER_NONE = 0
+FILTER_PNG = 1
+
+# Filter names accepted by the encoder; "adaptive" picks the best predictor per row
+PREDICTORS = {"none": 0, "sub": 1, "up": 2, "average": 3, "paeth": 4}
+ADAPTIVE = "adaptive"
+FILTER_NAMES = ("none", ADAPTIVE, "sub", "up", "average", "paeth")
+
+FILTER_RECORD = struct.Struct('<BBH')  # filter method, planar flag, rows per block
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """
+    Filter layout of a payload, stored in the versioned header
+    """
+    method: int = FILTER_NONE
+    planar: bool = False
+    block_rows: int = BLOCK_ROWS
+
+    @property
+    def active(self):
+        return self.method != FILTER_NONE or self.planar
+
+    @property
+    def name(self):
+        parts = (["png"] if self.method == FILTER_PNG else []) + (["planar"] if self.planar else [])
+        return "+".join(parts) or "none"
+
+    def pack(self):
+        return FILTER_RECORD.pack(self.method, int(self.planar), self.block_rows)
+
+    @classmethod
+    def unpack(cls, data):
+        method, planar, block_rows = FILTER_RECORD.unpack_from(data)
+        if method not in (FILTER_NONE, FILTER_PNG):
+            raise ValueError(f"Unsupported filter method: {method}")
+        return cls(method, bool(planar), block_rows)
+
+    def stored_size(self, width, rows, channels=3):
+        """
+        Size of `rows` filtered pixel rows (a whole strip or a prefix of whole blocks)
+        """
+        prefix = 1 if self.method == FILTER_PNG else 0
+        if self.planar:
+            return rows * channels * (width + prefix)
+        return rows * (width * channels + prefix)
+
+
+def make_spec(filter_name, planar=False):
+    """
+    Build the FilterSpec for an encoder filter name (see FILTER_NAMES)
+    """
+    if filter_name not in FILTER_NAMES:
+        raise ValueError(f"Unknown filter {filter_name!r}, expected one of {', '.join(FILTER_NAMES)}")
+    method = FILTER_NONE if filter_name == "none" else FILTER_PNG
+    return FilterSpec(method, bool(planar))
+
+
+# ---------- FILTERING ----------
+def _require_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Row filtering needs NumPy (pip install numpy)") from None
+    return numpy
+
+
+def _filter_block(np, rows, prior, bpp, filter_name):
+    # rows: (n, row_bytes) uint8, prior: (row_bytes,) uint8 -> (n, row_bytes + 1) uint8
+    n, row_bytes = rows.shape
+    up = np.empty_like(rows)
+    up[0] = prior
+    up[1:] = rows[:-1]
+    left = np.zeros_like(rows)
+    left[:, bpp:] = rows[:, :-bpp]
+
+    candidates = {}
+    wanted = PREDICTORS if filter_name == ADAPTIVE else {filter_name: PREDICTORS[filter_name]}
+    if "none" in wanted:
+        candidates[0] = rows
+    if "sub" in wanted:
+        candidates[1] = rows - left
+    if "up" in wanted:
+        candidates[2] = rows - up
+    if "average" in wanted:
+        candidates[3] = rows - ((left.astype(np.uint16) + up) >> 1).astype(np.uint8)
+    if "paeth" in wanted:
+        upleft = np.zeros_like(rows)
+        upleft[:, bpp:] = up[:, :-bpp]
+        a, b, c = left.astype(np.int16), up.astype(np.int16), upleft.astype(np.int16)
+        p = a + b - c
+        pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+        predictor = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        candidates[4] = rows - predictor.astype(np.uint8)
+
+    out = np.empty((n, row_bytes + 1), dtype=np.uint8)
+    if len(candidates) == 1:
+        (kind, filtered), = candidates.items()
+        out[:, 0] = kind
+        out[:, 1:] = filtered
+        return out
+
+    # Minimum sum of absolute differences (the libpng heuristic), one choice per row
+    kinds = sorted(candidates)
+    stack = np.stack([candidates[kind] for kind in kinds])
+    scores = np.abs(stack.view(np.int8).astype(np.int32)).sum(axis=2)
+    best = scores.argmin(axis=0)
+    out[:, 0] = np.asarray(kinds, dtype=np.uint8)[best]
+    out[:, 1:] = stack[best, np.arange(n)]
+    return out
+
+
+class StripFilter:
+    """
+    Filters the pixel rows of one strip, fed in whole blocks of spec.block_rows
+    rows (the last block may be shorter)
+    """
+
+    def __init__(self, spec, width, filter_name=ADAPTIVE, channels=3):
+        self.spec = spec
+        self.width = width
+        self.channels = channels
+        self.filter_name = filter_name if spec.method == FILTER_PNG else "none"
+        self.np = _require_numpy()
+        planes = channels if spec.planar else 1
+        row_bytes = width if spec.planar else width * channels
+        self.priors = [self.np.zeros(row_bytes, dtype=self.np.uint8) for _ in range(planes)]
+
+    def filter(self, data):
+        np = self.np
+        pixels = np.frombuffer(data, dtype=np.uint8).reshape(-1, self.width, self.channels)
+        if self.spec.planar:
+            planes = [pixels[:, :, i] for i in range(self.channels)]
+            bpp = 1
+        else:
+            planes = [pixels.reshape(len(pixels), -1)]
+            bpp = self.channels
+
+        out = []
+        for index, plane in enumerate(planes):
+            if self.spec.method == FILTER_PNG:
+                out.append(_filter_block(np, plane, self.priors[index], bpp, self.filter_name).tobytes())
+            else:
+                out.append(np.ascontiguousarray(plane).tobytes())
+            if len(plane):
+                self.priors[index] = plane[-1].copy()
+        return b''.join(out)
+
+
+def filter_strip(data, width, spec, filter_name=ADAPTIVE, channels=3):
+    """
+    Filter the pixel bytes of one whole strip
+    """
+    strip_filter = StripFilter(spec, width, filter_name, channels)
+    step = spec.block_rows * width * channels
+    return b''.join(strip_filter.filter(data[i:i + step]) for i in range(0, len(data), step))
+
+
+# ---------- UNFILTERING ----------
+def png_chunk(tag, data):
+    body = tag + data
+    return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xFFFFFFFF)
+
+
+# Interleaved pixel mode and PNG color type per channel count
+CHANNEL_MODES = {1: ('L', 0), 2: ('LA', 4), 3: ('RGB', 2), 4: ('RGBA', 6)}
+
+
+def _unfilter_plane(data, width, rows, bpp, prior):
+    # Wrap the filtered scanlines (plus the previous reconstructed row as an
+    # unfiltered first line) in a stored-deflate PNG and let Pillow unfilter it
+    mode, color_type = CHANNEL_MODES[bpp]
+    if prior is not None:
+        data = b'\x00' + prior + data
+        rows += 1
+    png = (b'\x89PNG\r\n\x1a\n'
+           + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, rows, 8, color_type, 0, 0, 0))
+           + png_chunk(b'IDAT', zlib.compress(data, 0))
+           + png_chunk(b'IEND', b''))
+    with Image.open(io.BytesIO(png)) as img:
+        if img.mode != mode:
+            raise ValueError("Corrupt filtered strip")
+        pixels = img.tobytes()
+    return pixels[len(prior):] if prior is not None else pixels
+
+
+class StripUnfilter:
+    """
+    Inverse of StripFilter: feed the filtered bytes of consecutive blocks
+    """
+
+    def __init__(self, spec, width, channels=3):
+        self.spec = spec
+        self.width = width
+        self.channels = channels
+        self.priors = [None] * (channels if spec.planar else 1)
+
+    def unfilter(self, data, rows):
+        """
+        Return the pixel bytes of one filtered block of `rows` rows
+        """
+        spec, width, channels = self.spec, self.width, self.channels
+        if not spec.planar:
+            if spec.method != FILTER_PNG:
+                return bytes(data)
+            pixels = _unfilter_plane(bytes(data), width, rows, channels, self.priors[0])
+            self.priors[0] = pixels[-width * channels:]
+            return pixels
+
+        plane_size = rows * (width + (1 if spec.method == FILTER_PNG else 0))
+        planes = []
+        for index in range(channels):
+            plane = bytes(data[index * plane_size:(index + 1) * plane_size])
+            if spec.method == FILTER_PNG:
+                plane = _unfilter_plane(plane, width, rows, 1, self.priors[index])
+                self.priors[index] = plane[-width:]
+            planes.append(Image.frombytes('L', (width, rows), plane))
+        return Image.merge(CHANNEL_MODES[channels][0], planes).tobytes()
+
+
+def unfilter_strip(data, width, rows, spec, channels=3):
+    """
+    Return the pixel bytes of a filtered strip, or of its first `rows` rows
+    if data holds only a prefix of whole blocks
+    """
+    unfilter = StripUnfilter(spec, width, channels)
+    out = []
+    pos = 0
+    for top in range(0, rows, spec.block_rows):
+        count = min(spec.block_rows, rows - top)
+        size = spec.stored_size(width, count, channels)
+        block = data[pos:pos + size]
+        if len(block) < size:
+            block = bytes(block) + bytes(size - len(block))
+        out.append(unfilter.unfilter(block, count))
+        pos += size
+    return b''.join(out)
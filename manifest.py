@@ -0,0 +1,190 @@
+"""
+Content-hash manifest that lets batch runs skip work that is already done
+
+One JSON manifest lives in each output folder and maps every source file to
+its size, mtime, SHA-256, the settings it was processed with and the files
+it produced. A source is current when all of those still match and its
+outputs exist; a changed mtime alone triggers a re-hash, not a re-encode.
+
+A source stored in an archive WAV records the output "<archive>#<entry>"
+(see archive_output) and the archive path, so pruning that source drops
+just its entry, never the archive shared with the other sources.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_NAME = ".sonicraster_manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK = 1 << 20
+ARCHIVE_SEPARATOR = "#"
+
+
+def file_digest(path):
+    """
+    SHA-256 hex digest of a file, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_output(archive_file, name):
+    """
+    Manifest output naming entry `name` of an archive
+    """
+    return f"{os.path.abspath(archive_file)}{ARCHIVE_SEPARATOR}{name}"
+
+
+def settings_key(settings):
+    """
+    Canonical JSON form of a settings dict, so equal settings compare equal
+    """
+    return json.dumps(settings, sort_keys=True, default=str)
+
+
+class Manifest:
+    """
+    Per-folder record of processed sources
+    Only the main process touches it; workers just produce the outputs.
+    """
+
+    def __init__(self, folder, name=MANIFEST_NAME):
+        self.path = os.path.join(folder, name)
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _key(source):
+        return os.path.abspath(source)
+
+    @staticmethod
+    def _archive_entry(entry, out_file):
+        # (archive file, entry name) for an archive output, else None
+        archive_file = entry.get("archive")
+        if archive_file and out_file.startswith(archive_file + ARCHIVE_SEPARATOR):
+            return archive_file, out_file[len(archive_file) + len(ARCHIVE_SEPARATOR):]
+        return None
+
+    def _output_exists(self, entry, out_file):
+        archive_entry = self._archive_entry(entry, out_file)
+        return os.path.exists(archive_entry[0] if archive_entry else out_file)
+
+    def is_current(self, source, settings):
+        """
+        True if source was already processed with these settings and is unchanged
+        """
+        entry = self.entries.get(self._key(source))
+        if entry is None or entry["settings"] != settings_key(settings):
+            return False
+        if not all(self._output_exists(entry, out_file) for out_file in entry["outputs"]):
+            return False
+
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return False
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+
+        # Touched but maybe not modified: compare the content
+        if file_digest(source) != entry["sha256"]:
+            return False
+        entry["mtime_ns"] = stat.st_mtime_ns
+        self.dirty = True
+        return True
+
+    def record(self, source, outputs, settings, archive_file=None):
+        """
+        Remember that source was processed into outputs with these settings
+        With archive_file, outputs made by archive_output() name its entries.
+        """
+        stat = os.stat(source)
+        entry = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_digest(source),
+            "settings": settings_key(settings),
+            "outputs": [out_file if archive_file else os.path.abspath(out_file) for out_file in outputs],
+        }
+        if archive_file:
+            entry["archive"] = os.path.abspath(archive_file)
+        self.entries[self._key(source)] = entry
+        self.dirty = True
+
+    def forget(self, source):
+        if self.entries.pop(self._key(source), None) is not None:
+            self.dirty = True
+
+    def prune(self, remove_archive_entries=None):
+        """
+        Drop entries whose source no longer exists and delete their outputs
+        Outputs still claimed by another entry are kept. Archive entries are
+        handed to remove_archive_entries(archive_file, names) instead (and
+        kept if it isn't given); the archive file itself is never deleted.
+        Returns: list of deleted outputs
+        """
+        gone = [key for key in self.entries if not os.path.exists(key)]
+        if not gone:
+            return []
+
+        removed_entries = [self.entries.pop(key) for key in gone]
+        self.dirty = True
+        claimed = {out_file for entry in self.entries.values() for out_file in entry["outputs"]}
+
+        deleted = []
+        archive_entries = {}
+        for entry in removed_entries:
+            for out_file in entry["outputs"]:
+                if out_file in claimed:
+                    continue
+                archive_entry = self._archive_entry(entry, out_file)
+                if archive_entry:
+                    archive_entries.setdefault(archive_entry[0], []).append((out_file, archive_entry[1]))
+                    continue
+                if not os.path.exists(out_file):
+                    continue
+                try:
+                    os.remove(out_file)
+                    deleted.append(out_file)
+                except OSError:
+                    pass
+
+        for archive_file, outputs in archive_entries.items():
+            if remove_archive_entries is None or not os.path.exists(archive_file):
+                continue
+            try:
+                remove_archive_entries(archive_file, [name for _, name in outputs])
+                deleted.extend(out_file for out_file, _ in outputs)
+            except (OSError, ValueError):
+                pass
+        return deleted
+
+    def save(self):
+        """
+        Write the manifest atomically (if anything changed)
+        """
+        if not self.dirty:
+            return
+        folder = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix=".manifest-", dir=folder)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.dirty = False
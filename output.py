@@ -0,0 +1,158 @@
+"""
+Output profiles for decoded images
+
+A profile decides whether a decoded image is scaled back up to its original
+dimensions (and with which resampler) and how it is written: PNG at a
+chosen zlib level, or a raw format (PPM, BMP, NumPy .npy) that is little
+more than a header in front of the pixel rows.
+"""
+import dataclasses
+import struct
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from PIL import Image
+
+RESAMPLERS = {
+    "lanczos": Image.Resampling.LANCZOS,
+    "bicubic": Image.Resampling.BICUBIC,
+    "bilinear": Image.Resampling.BILINEAR,
+    "box": Image.Resampling.BOX,
+    "nearest": Image.Resampling.NEAREST,
+}
+OUTPUT_FORMATS = ("png", "ppm", "bmp", "npy")
+STREAMABLE_FORMATS = ("png", "ppm", "npy")  # Written top to bottom, so the streaming decoder needs no full image
+ANIMATED_FORMATS = ("png", "ppm", "npy")  # APNG, one Netpbm image after another, a (frames, height, width[, channels]) array
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    resize: bool = True  # Scale back to the original dimensions
+    resample: str = "lanczos"  # Any of RESAMPLERS
+    format: str = "png"  # Any of OUTPUT_FORMATS
+    png_level: int = 6  # zlib level 0-9 (Pillow's default)
+
+    @property
+    def resampler(self):
+        return RESAMPLERS[self.resample]
+
+    @property
+    def extension(self):
+        return self.format
+
+
+OUTPUT_PROFILES = {
+    "exact": OutputProfile(),  # Original dimensions, Lanczos, default PNG
+    "fast": OutputProfile(resample="bilinear", png_level=1),
+    "native": OutputProfile(resize=False, png_level=1),  # Stored pixels only; upscaling adds no information
+    "raw": OutputProfile(resize=False, format="ppm"),
+}
+
+
+def get_profile(name="exact", **overrides):
+    """
+    Look up a named profile, replacing any fields given as non-None overrides
+    """
+    try:
+        profile = OUTPUT_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown output profile {name!r}") from None
+    return dataclasses.replace(profile, **{k: v for k, v in overrides.items() if v is not None})
+
+
+# ---------- RAW FORMATS ----------
+def ppm_header(width, height, mode="RGB"):
+    """
+    Netpbm header: PGM for L, PPM for RGB, PAM for the modes with alpha
+    """
+    if mode in ("L", "RGB"):
+        return f"P{5 if mode == 'L' else 6}\n{width} {height}\n255\n".encode('ascii')
+    tuple_type = "GRAYSCALE_ALPHA" if mode == "LA" else "RGB_ALPHA"
+    return (f"P7\nWIDTH {width}\nHEIGHT {height}\nDEPTH {len(mode)}\nMAXVAL 255\n"
+            f"TUPLTYPE {tuple_type}\nENDHDR\n").encode('ascii')
+
+
+def npy_header(width, height, channels=3, frames=None):
+    """
+    NumPy .npy v1.0 header for a (height, width, channels) uint8 array ((height, width) for one channel)
+    With frames, the array gets a leading (frames, ...) axis.
+    """
+    shape = (f"{frames}, " if frames is not None else "") + f"{height}, {width}" + (f", {channels}" if channels > 1 else "")
+    header = f"{{'descr': '|u1', 'fortran_order': False, 'shape': ({shape}), }}"
+    # Magic, version and length take 10 bytes; the whole header is padded to 64
+    header += " " * (-(10 + len(header) + 1) % 64) + "\n"
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def raw_header(profile, width, height, mode="RGB"):
+    if profile.format == "ppm":
+        return ppm_header(width, height, mode)
+    return npy_header(width, height, len(mode))
+
+
+class RawRowWriter:
+    """
+    Writes a PPM or .npy header followed by pixel rows as they arrive
+    """
+
+    def __init__(self, out_file, profile, width, height, mode="RGB"):
+        self.file = open(out_file, 'wb')
+        self.file.write(raw_header(profile, width, height, mode))
+
+    def write_rows(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_output(out_file):
+    """
+    Open a path for writing; an already open binary file is used as is and left open
+    """
+    if hasattr(out_file, "write"):
+        return nullcontext(out_file)
+    return open(out_file, 'wb')
+
+
+def save_image(img, out_file, profile):
+    """
+    Write an L, LA, RGB or RGBA image in the profile's format to a path or binary file
+    """
+    if profile.format in ("npy", "ppm"):
+        with open_output(out_file) as f:
+            f.write(raw_header(profile, img.width, img.height, img.mode))
+            f.write(img.tobytes())
+    elif profile.format == "png":
+        img.save(out_file, "PNG", compress_level=profile.png_level)
+    else:
+        if img.mode == "LA":
+            img = img.convert("RGBA")  # BMP has no gray + alpha layout
+        img.save(out_file, "BMP")
+
+
+def save_animation(images, durations, loop, out_file, profile):
+    """
+    Write same-sized frames as one file in the profile's format (see ANIMATED_FORMATS)
+    durations are in milliseconds, loop is the repeat count (0 = forever).
+    """
+    if profile.format not in ANIMATED_FORMATS:
+        raise ValueError(f"{profile.format.upper()} can't hold an animation; decode a single frame instead")
+    first = images[0]
+    if profile.format == "png":
+        first.save(out_file, "PNG", save_all=True, append_images=images[1:], duration=durations, loop=loop,
+                   compress_level=profile.png_level)
+        return
+    with open_output(out_file) as f:
+        if profile.format == "npy":
+            f.write(npy_header(first.width, first.height, len(first.mode), len(images)))
+        for img in images:
+            if profile.format == "ppm":
+                f.write(ppm_header(img.width, img.height, img.mode))
+            f.write(img.tobytes())
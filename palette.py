@@ -0,0 +1,170 @@
+"""
+Indexed-palette storage for low-color images
+
+An image with at most 256 distinct pixel values (screenshots, diagrams,
+pixel art, masks) can be stored as a table of those values plus one index
+per pixel. Indices are packed 1, 2, 4 or 8 bits per pixel, most significant
+bits first, and every row starts on a whole byte, exactly like PNG's
+indexed rows. The palette entries are in the payload's pixel mode, so
+decoding expands the indices back to the same L/LA/RGB/RGBA image.
+
+Building indices needs NumPy. Expanding them does not: Pillow's raw
+"P;N" unpackers and palette conversion do it in C.
+"""
+import struct
+from dataclasses import dataclass
+
+from PIL import Image
+
+# ---------- CONFIG ----------
+MAX_COLORS = 256
+INDEX_BITS = (1, 2, 4, 8)
+PALETTE_OPTIONS = ("off", "auto", "quantize")  # "auto" indexes images that already have few colors
+
+PALETTE_RECORD = struct.Struct('<BH')  # bits per index, color count (entries in the pixel mode follow)
+
+
+@dataclass(frozen=True)
+class PaletteSpec:
+    """
+    Palette of a payload, stored in the versioned header
+    `colors` holds `count` entries of len(mode) bytes, sorted by value.
+    """
+    mode: str
+    colors: bytes
+    bits: int = 8
+
+    @property
+    def count(self):
+        return len(self.colors) // len(self.mode)
+
+    def row_bytes(self, width):
+        return (width * self.bits + 7) // 8
+
+    def pack(self):
+        return PALETTE_RECORD.pack(self.bits, self.count) + self.colors
+
+    @classmethod
+    def unpack(cls, data, mode):
+        bits, count = PALETTE_RECORD.unpack_from(data)
+        if bits not in INDEX_BITS or not 0 < count <= 1 << bits:
+            raise ValueError(f"Unsupported palette: {count} colors, {bits}-bit indices")
+        colors = bytes(data[PALETTE_RECORD.size:PALETTE_RECORD.size + count * len(mode)])
+        return cls(mode, colors, bits)
+
+
+def index_bits(count):
+    return next(bits for bits in INDEX_BITS if count <= 1 << bits)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _color_keys(np, pixels, channels):
+    # One uint32 per pixel, channel bytes big-endian, so keys sort like the color tuples
+    pixels = pixels.reshape(-1, channels) if channels > 1 else pixels
+    if channels == 1:
+        return pixels.astype(np.uint32)
+    keys = pixels[..., 0].astype(np.uint32)
+    for channel in range(1, channels):
+        keys = (keys << 8) | pixels[..., channel]
+    return keys
+
+
+# ---------- ENCODING ----------
+def count_colors(images, limit=MAX_COLORS):
+    """
+    Distinct pixel values across images (e.g. the strips of one image) of the same mode
+    Pillow counts each image in C and gives up as soon as it passes the limit.
+    Returns: sorted list of values (ints for L, tuples otherwise), or None if there are more than limit
+    """
+    colors = set()
+    for img in images:
+        found = img.getcolors(limit)
+        if found is None:
+            return None
+        colors.update(color for _, color in found)
+        if len(colors) > limit:
+            return None
+    return sorted(colors)
+
+
+def make_palette(images, mode, limit=MAX_COLORS):
+    """
+    Build the PaletteSpec for an image (or its strips) in one of the pixel modes
+    Returns None when the image has too many colors, when indices would not be
+    smaller than its pixels (L with more than 16 grays) or without NumPy.
+    """
+    if _numpy() is None:
+        return None
+    colors = count_colors(images, limit)
+    if not colors:
+        return None
+    bits = index_bits(len(colors))
+    if bits >= 8 * len(mode):
+        return None
+    if len(mode) == 1:
+        return PaletteSpec(mode, bytes(colors), bits)
+    return PaletteSpec(mode, b''.join(bytes(color) for color in colors), bits)
+
+
+def quantize(img, colors=MAX_COLORS):
+    """
+    Reduce img to at most `colors` distinct values (lossy), keeping its mode
+    L and RGB use median cut; modes with alpha go through RGBA octree quantization.
+    """
+    if img.mode in ("L", "RGB"):
+        reduced = img.quantize(colors)
+    else:
+        reduced = img.convert("RGBA").quantize(colors, method=Image.Quantize.FASTOCTREE)
+    return reduced.convert(img.mode)
+
+
+def pack_indices(img, spec):
+    """
+    Map every pixel of img to its palette index and pack the indices row by row
+    Every pixel value must be in the palette.
+    """
+    np = _numpy()
+    if np is None:
+        raise RuntimeError("Palette indexing needs NumPy (pip install numpy)")
+    channels = len(spec.mode)
+    palette_keys = _color_keys(np, np.frombuffer(spec.colors, dtype=np.uint8), channels)
+    keys = _color_keys(np, np.asarray(img), channels).reshape(img.height, img.width)
+    indices = np.searchsorted(palette_keys, keys).astype(np.uint8)
+
+    per_byte = 8 // spec.bits
+    if per_byte == 1:
+        return indices.tobytes()
+    pad = -img.width % per_byte
+    if pad:
+        indices = np.pad(indices, ((0, 0), (0, pad)))
+    groups = indices.reshape(img.height, -1, per_byte)
+    packed = np.zeros(groups.shape[:2], dtype=np.uint8)
+    for k in range(per_byte):
+        packed |= groups[:, :, k] << (8 - spec.bits * (k + 1))
+    return packed.tobytes()
+
+
+# ---------- DECODING ----------
+def expand_indices(data, width, height, spec):
+    """
+    Build an image in the palette's mode from packed index rows
+    """
+    rawmode = "P" if spec.bits == 8 else f"P;{spec.bits}"
+    img = Image.frombuffer("P", (width, height), data, 'raw', rawmode, 0, 1)
+
+    # Pillow palettes are RGB or RGBA; gray entries are repeated and converted back exactly
+    entries = [spec.colors[i:i + len(spec.mode)] for i in range(0, len(spec.colors), len(spec.mode))]
+    if spec.mode == "L":
+        img.putpalette(b''.join(entry * 3 for entry in entries), "RGB")
+    elif spec.mode == "LA":
+        img.putpalette(b''.join(entry[:1] * 3 + entry[1:] for entry in entries), "RGBA")
+    else:
+        img.putpalette(spec.colors, spec.mode)
+    return img.convert(spec.mode)
@@ -0,0 +1,143 @@
+"""
+Per-stage timing of the encode/decode pipeline
+
+Every encode/decode call fills a StageTimer and returns its totals in
+result.timings; RunStats aggregates those across a batch for the --profile
+summary, the GUI log and the JSON/CSV export.
+"""
+import cProfile
+import csv
+import json
+import pstats
+import time
+from contextlib import contextmanager
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class StageTimer:
+    """
+    Wall-clock seconds per named pipeline stage of one file
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def timed_iter(self, name, iterable):
+        """
+        Yield from iterable, charging the time spent producing each item to `name`
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+
+def percentile(values, fraction):
+    """
+    Linear-interpolated percentile of a non-empty list
+    """
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * fraction
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+class RunStats:
+    """
+    Stage timings of every file in a batch
+    """
+
+    def __init__(self):
+        self.files = []  # (source, {stage: seconds})
+
+    def add(self, source, timings):
+        self.files.append((source, dict(timings)))
+
+    def summary(self):
+        """
+        Returns: {stage: {"files", "total_s", "mean_s", "p50_s", "p90_s", "p99_s", "max_s", "share"}}
+        in pipeline order, with share = fraction of the total time of all stages
+        """
+        per_stage = {}
+        for _, timings in self.files:
+            for stage, seconds in timings.items():
+                per_stage.setdefault(stage, []).append(seconds)
+
+        grand_total = sum(sum(values) for values in per_stage.values()) or 1.0
+        summary = {}
+        for stage, values in per_stage.items():
+            total = sum(values)
+            row = {"files": len(values), "total_s": total, "mean_s": total / len(values)}
+            for fraction in PERCENTILES:
+                row[f"p{round(fraction * 100)}_s"] = percentile(values, fraction)
+            row["max_s"] = max(values)
+            row["share"] = total / grand_total
+            summary[stage] = row
+        return summary
+
+    def format_summary(self):
+        """
+        Human-readable table lines of summary()
+        """
+        summary = self.summary()
+        if not summary:
+            return ["No stage timings recorded"]
+        lines = [f"{'Stage':<12}{'Total':>10}{'Mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'Share':>8}"]
+        for stage, row in summary.items():
+            lines.append(f"{stage:<12}{row['total_s'] * 1000:>8.0f}ms{row['mean_s'] * 1000:>8.1f}ms"
+                         f"{row['p50_s'] * 1000:>8.1f}ms{row['p90_s'] * 1000:>8.1f}ms"
+                         f"{row['p99_s'] * 1000:>8.1f}ms{row['share'] * 100:>7.1f}%")
+        return lines
+
+    def export(self, path):
+        """
+        Write the per-file timings and the summary as JSON, or the per-file timings as CSV (by extension)
+        """
+        if path.lower().endswith(".csv"):
+            stages = list(self.summary())
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(["file"] + [f"{stage}_s" for stage in stages])
+                for source, timings in self.files:
+                    writer.writerow([source] + [f"{timings.get(stage, 0.0):.6f}" for stage in stages])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({"files": [{"file": source, "stages": timings} for source, timings in self.files],
+                           "summary": self.summary()}, f, indent=1)
+
+
+@contextmanager
+def cprofile_to(path, top=20):
+    """
+    Run the enclosed block under cProfile, save the stats to path and print the top entries
+    Only the current process is profiled (use a single job for batch runs).
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE)
+        print(f"cProfile stats saved: {path} (top {top} by cumulative time follow)")
+        stats.print_stats(top)
@@ -0,0 +1,437 @@
+"""
+Local HTTP service converting images to WAV files and back, in memory
+
+    python sonicraster.py serve --jobs 4
+    curl --data-binary @photo.jpg "http://127.0.0.1:8765/encode?quality=LOW&codec=auto" -o photo.wav
+    curl --data-binary @photo.wav "http://127.0.0.1:8765/decode?format=ppm" -o photo.ppm
+    curl http://127.0.0.1:8765/metrics
+
+POST /encode takes an image and returns the WAV; POST /decode takes a WAV
+and returns the image. Query parameters are the options of UniversalWAVNG.py
+and decode_to_image.py without their leading dashes ("flatten" or
+"no-compression" without a value for switches) and default to the CONFIG
+sections of those scripts. Options that only make sense for batches of files
+(CLI_ONLY_OPTIONS) are refused with 400, and "threads" is capped at each
+worker's share of the CPU cores. Bodies go to a pool of worker processes as bytes:
+nothing is written to disk and no Python process is started per request.
+
+Limits: request bodies over MAX_REQUEST_BYTES are refused with 413 before
+they are read, as are WAVs that would decode to more than MAX_OUTPUT_PIXELS.
+At most MAX_PENDING conversions are running or waiting for a worker; past
+that, requests are answered with 503 and Retry-After right away instead of
+queueing without bound. GET /metrics reports request and status counts,
+bytes in and out, pending conversions and latency percentiles (total, queue
+wait and conversion time) over the last METRICS_WINDOW requests.
+
+There is no authentication, so the service binds to localhost by default.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from PIL import Image
+
+import UniversalWAVNG
+import decode_to_image
+from batch import resolve_jobs
+from profiling import PERCENTILES, percentile
+from wav_codec import decode_wav_bytes, encode_image_bytes, read_payload_info, wav_payload
+
+# ---------- CONFIG ----------
+HOST = "127.0.0.1"  # Localhost only; there is no authentication
+PORT = 8765
+JOBS = 0  # Worker processes (0 = one per CPU core)
+MAX_PENDING = 0  # Conversions running or queued before 503 (0 = 4 per worker)
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+MAX_OUTPUT_PIXELS = 100_000_000  # Over all frames; bounds the memory one decode can take
+REQUEST_TIMEOUT = 120.0  # Seconds to wait for a conversion before answering 504
+SOCKET_TIMEOUT = 30.0  # Seconds a client may stall while sending or receiving
+METRICS_WINDOW = 1000  # Latest requests per endpoint the latency percentiles cover
+
+CONTENT_TYPES = {
+    "wav": "audio/wav",
+    "png": "image/png",
+    "bmp": "image/bmp",
+    "ppm": "image/x-portable-pixmap",
+    "npy": "application/octet-stream",
+}
+
+# Batch and file options of the scripts with no meaning for one in-memory conversion
+CLI_ONLY_OPTIONS = ("jobs", "archive", "force", "streaming", "no-streaming", "profile", "profile-out", "cprofile")
+
+# Bad input rather than a server fault
+CLIENT_ERRORS = (ValueError, OSError, EOFError, struct.error, wave.Error)
+
+
+class RequestError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+# ---------- WORKERS ----------
+# Run in the pool processes; the elapsed time separates conversion from queueing
+def _encode_job(data, options):
+    start = time.perf_counter()
+    wav, result = encode_image_bytes(data, options)
+    return wav, result, time.perf_counter() - start
+
+
+def _decode_job(data, options):
+    start = time.perf_counter()
+    image, result = decode_wav_bytes(data, **options)
+    return image, result, time.perf_counter() - start
+
+
+# ---------- QUERY OPTIONS ----------
+class QueryParser(argparse.ArgumentParser):
+    # Bad query parameters become errors instead of exiting the service
+    def error(self, message):
+        raise ValueError(message)
+
+
+def make_query_parser(add_arguments):
+    parser = QueryParser(add_help=False, allow_abbrev=False)
+    add_arguments(parser)
+    return parser
+
+
+def parse_query(parser, query):
+    """
+    Parse "quality=LOW&flatten" like the command line "--quality LOW --flatten"
+    """
+    argv = []
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key in CLI_ONLY_OPTIONS:
+            raise ValueError(f"{key} is a command-line option the service doesn't support")
+        argv.append("--" + key)
+        if value:
+            argv.append(value)
+    return parser.parse_args(argv)
+
+
+# ---------- METRICS ----------
+def latency_summary(values):
+    """
+    Milliseconds at PERCENTILES and the maximum, or None without samples
+    """
+    if not values:
+        return None
+    summary = {f"p{round(fraction * 100)}_ms": percentile(values, fraction) * 1000 for fraction in PERCENTILES}
+    summary["max_ms"] = max(values) * 1000
+    return summary
+
+
+class EndpointMetrics:
+    def __init__(self, window):
+        self.requests = 0
+        self.statuses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total = deque(maxlen=window)  # Seconds from request line to response
+        self.queue = deque(maxlen=window)  # Seconds waiting for a worker (converted requests only)
+        self.work = deque(maxlen=window)  # Seconds converting
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "status": dict(sorted(self.statuses.items())),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency": latency_summary(list(self.total)),
+            "queue": latency_summary(list(self.queue)),
+            "convert": latency_summary(list(self.work)),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe request counters and latency windows per endpoint
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.pending = 0
+        self.rejected = 0
+
+    def record(self, endpoint, status, seconds, bytes_in=0, bytes_out=0, queue=None, work=None):
+        with self.lock:
+            metrics = self.endpoints.setdefault(endpoint, EndpointMetrics(self.window))
+            metrics.requests += 1
+            metrics.statuses[str(status)] = metrics.statuses.get(str(status), 0) + 1
+            metrics.bytes_in += bytes_in
+            metrics.bytes_out += bytes_out
+            metrics.total.append(seconds)
+            if work is not None:
+                metrics.queue.append(queue)
+                metrics.work.append(work)
+            if status == 503:
+                self.rejected += 1
+
+    def add_pending(self, count):
+        with self.lock:
+            self.pending += count
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "pending": self.pending,
+                "rejected": self.rejected,
+                "endpoints": {name: metrics.snapshot() for name, metrics in sorted(self.endpoints.items())},
+            }
+
+
+# ---------- SERVICE ----------
+class Service:
+    """
+    Worker pool with a bounded number of pending conversions
+    """
+
+    def __init__(self, jobs=JOBS, max_pending=MAX_PENDING, max_request_bytes=MAX_REQUEST_BYTES,
+                 max_output_pixels=MAX_OUTPUT_PIXELS, timeout=REQUEST_TIMEOUT, window=METRICS_WINDOW):
+        self.workers = resolve_jobs(jobs)
+        self.max_pending = max_pending if max_pending > 0 else self.workers * 4
+        self.max_threads = max(1, (os.cpu_count() or 1) // self.workers)  # Per conversion
+        self.max_request_bytes = max_request_bytes
+        self.max_output_pixels = max_output_pixels
+        self.timeout = timeout
+        self.metrics = Metrics(window)
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.encode_parser = make_query_parser(UniversalWAVNG.add_encode_arguments)
+        self.decode_parser = make_query_parser(decode_to_image.add_decode_arguments)
+        self.pool_lock = threading.Lock()
+        self.pool = self._start_pool()
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Start the workers now rather than on the first request
+        pool.submit(int).result()
+        return pool
+
+    def _restart_pool(self, broken):
+        # A worker died outright (e.g. out of memory); later requests get a fresh pool
+        with self.pool_lock:
+            if self.pool is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._start_pool()
+
+    def _finished(self, future):
+        self.metrics.add_pending(-1)
+        self.slots.release()
+
+    def run(self, func, *args):
+        """
+        Run func(*args) in the pool and wait for its result
+        Raises RequestError 503 when max_pending conversions are already
+        running or queued, and 504 when the result takes longer than timeout
+        (the conversion keeps its slot until it actually finishes).
+        """
+        if not self.slots.acquire(blocking=False):
+            raise RequestError(503, "Too many pending conversions, retry later", [("Retry-After", "1")])
+        pool = self.pool
+        try:
+            future = pool.submit(func, *args)
+        except BrokenProcessPool:
+            self.slots.release()
+            self._restart_pool(pool)
+            raise RequestError(503, "Worker pool restarting, retry later", [("Retry-After", "1")])
+        self.metrics.add_pending(1)
+        future.add_done_callback(self._finished)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise RequestError(504, f"Conversion took longer than {self.timeout:g}s") from None
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            raise RequestError(500, "Worker process terminated abruptly") from None
+
+    def encode(self, body, query):
+        args = parse_query(self.encode_parser, query)
+        args.threads = min(max(args.threads, 1), self.max_threads)
+        options = UniversalWAVNG.make_options(args)
+        return self.run(_encode_job, body, options), "wav"
+
+    def decode(self, body, query):
+        args = parse_query(self.decode_parser, query)
+        args.threads = min(max(args.threads, 1), self.max_threads)
+        info = read_payload_info(wav_payload(body))
+        if args.preview is None:
+            pixels = max(info.width * info.height, info.original_width * info.original_height)
+            if args.frame is None:
+                pixels *= info.frame_count
+            if pixels > self.max_output_pixels:
+                raise RequestError(413, f"Decoded image would have {pixels:,} pixels "
+                                        f"(limit {self.max_output_pixels:,})")
+        profile = decode_to_image.make_output(args)
+        options = {"region": args.region, "threads": args.threads, "preview": args.preview,
+                   "profile": profile, "frame": args.frame}
+        return self.run(_decode_job, body, options), profile.format
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+# ---------- HTTP ----------
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "SonicRaster"
+    protocol_version = "HTTP/1.1"  # Keep-alive, so callers can reuse one connection
+    timeout = SOCKET_TIMEOUT
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, content_type="application/json", headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, data, headers=()):
+        self.send_body(status, json.dumps(data, indent=1).encode() + b'\n', headers=headers)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif path == "/metrics":
+            service = self.server.service
+            self.send_json(200, dict(service.metrics.snapshot(), workers=service.workers,
+                                     max_pending=service.max_pending, max_threads=service.max_threads))
+        else:
+            self.send_json(404, {"error": f"Unknown path {path}"})
+
+    def read_body(self):
+        """
+        The request body, refused before reading if it is missing or too large
+        """
+        if "chunked" in self.headers.get("Transfer-Encoding", ""):
+            self.close_connection = True
+            raise RequestError(411, "Send the body with a Content-Length")
+        try:
+            length = int(self.headers["Content-Length"])
+        except (TypeError, ValueError):
+            self.close_connection = True
+            raise RequestError(411, "Content-Length required") from None
+        limit = self.server.service.max_request_bytes
+        if length > limit:
+            # The body stays unread, so the connection can't be reused
+            self.close_connection = True
+            raise RequestError(413, f"Request body of {length:,} bytes exceeds the limit of {limit:,}")
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        service = self.server.service
+        url = urlsplit(self.path)
+        endpoint = url.path.strip("/")
+        body = b''
+        queue = work = None
+        try:
+            if endpoint not in ("encode", "decode"):
+                self.close_connection = True
+                raise RequestError(404, f"Unknown path {url.path}")
+            body = self.read_body()
+            convert = service.encode if endpoint == "encode" else service.decode
+            (data, result, work), kind = convert(body, url.query)
+            queue = max(0.0, time.perf_counter() - start - work)
+            headers = [
+                ("X-Original-Size", "{}x{}".format(*result.original_size)),
+                ("X-Encoded-Size", "{}x{}".format(*result.encoded_size)),
+                ("X-Codec", result.codec),
+                ("X-Frame-Count", str(result.frame_count)),
+                ("X-Queue-Ms", f"{queue * 1000:.1f}"),
+                ("X-Convert-Ms", f"{work * 1000:.1f}"),
+            ]
+            status = 200
+            self.send_body(status, data, CONTENT_TYPES[kind], headers)
+        except RequestError as e:
+            status, data = e.status, str(e)
+            self.send_json(status, {"error": data}, e.headers)
+        except Image.DecompressionBombError as e:
+            status, data = 413, str(e)
+            self.send_json(status, {"error": data})
+        except CLIENT_ERRORS as e:
+            status, data = 400, f"{type(e).__name__}: {e}"
+            self.send_json(status, {"error": data})
+        except Exception as e:
+            status, data = 500, f"{type(e).__name__}: {e}"
+            self.send_json(status, {"error": data})
+        service.metrics.record(endpoint if endpoint in ("encode", "decode") else "other", status,
+                               time.perf_counter() - start, len(body), len(data) if status == 200 else 0,
+                               queue, work)
+
+
+def serve(args):
+    """
+    Run the service until interrupted
+    """
+    service = Service(args.jobs, args.max_pending, int(args.max_request_mb * 1024 * 1024), args.max_output_pixels,
+                      args.timeout)
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.quiet = args.quiet
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} ({service.workers} worker(s), up to {service.max_pending} pending)")
+    print("POST /encode, POST /decode, GET /metrics, GET /health (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping")
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+# ---------- MAIN ----------
+def add_serve_arguments(parser):
+    """
+    Service options shared with sonicraster.py (defaults from the CONFIG section above)
+    """
+    parser.add_argument("--host", default=HOST, help="address to bind (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=PORT,
+                        help="port to listen on, 0 = any free port (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS,
+                        help="worker processes (0 = one per CPU core, default: %(default)s)")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING, metavar="N",
+                        help="conversions running or queued before answering 503 (0 = 4 per worker)")
+    parser.add_argument("--max-request-mb", type=float, default=MAX_REQUEST_BYTES / (1024 * 1024), metavar="MB",
+                        help="largest accepted request body (default: %(default)g)")
+    parser.add_argument("--max-output-pixels", type=int, default=MAX_OUTPUT_PIXELS, metavar="N",
+                        help="refuse WAVs decoding to more pixels, over all frames (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT,
+                        help="seconds to wait for a conversion before answering 504 (default: %(default)g)")
+    parser.add_argument("--quiet", action="store_true", help="don't log every request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP service for encoding and decoding in memory")
+    add_serve_arguments(parser)
+    return serve(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+One command-line entry point for encoding and decoding
+
+    python sonicraster.py encode photos/ extra.png -o wav_output
+    python sonicraster.py decode wav_output -o decoded --exclude "old/*"
+    python sonicraster.py encode - < photo.jpg | python sonicraster.py decode - --format ppm > photo.ppm
+    python sonicraster.py serve --port 8765
+
+
+Inputs are any mix of files and folders. Folders are searched recursively
+in a single os.scandir pass (extensions matched case-insensitively, see
+discovery.py) and the subfolder layout is mirrored in the output folder.
+Files are handed to the workers as they are found, so a large tree starts
+encoding before the scan has finished.
+
+Only the standard library is imported up front: --help and --dry-run
+return immediately, and Pillow, NumPy and the codecs are loaded when there
+is work to do. Every other option (quality, codec, filter, output profile,
+...) is passed through to UniversalWAVNG.py or decode_to_image.py and
+defaults to that script's CONFIG section.
+
+A path of "-" reads one file from stdin and writes the result to stdout;
+"-o -" does the same for a single input file. Reports go to stderr then.
+The serve command runs the local HTTP service of service.py.
+"""
+import argparse
+import os
+import sys
+
+from discovery import IMAGE_EXTENSIONS, WAV_EXTENSIONS, iter_files
+
+# ---------- CONFIG ----------
+DECODE_INCLUDE = ("*_encoded.wav",)  # WAVs picked up from folders when no --include is given
+
+COMMANDS = {
+    # command: (extensions, default includes, script providing the remaining options)
+    "encode": (IMAGE_EXTENSIONS, (), "UniversalWAVNG.py"),
+    "decode": (WAV_EXTENSIONS, DECODE_INCLUDE, "decode_to_image.py"),
+}
+
+PIPE = "-"  # Path or output meaning stdin/stdout
+
+# ---------- ARGUMENTS ----------
+def build_parser(script_arguments=None):
+    """
+    script_arguments: optional (command, add_arguments) adding that script's own options
+    """
+    parser = argparse.ArgumentParser(description="Encode images into WAV files and decode them back")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command, (extensions, include, script) in COMMANDS.items():
+        sub = commands.add_parser(
+            command, help=f"same as {script}, for any files and folders",
+            epilog=f"All other options of {script} are accepted too (see python {script} --help).")
+        sub.add_argument("paths", nargs="+", help=f"files and folders to process, or {PIPE} for stdin")
+        sub.add_argument("-o", "--output", metavar="FOLDER",
+                         help=f"output folder, or {PIPE} for stdout (default: the one set in {script})")
+        sub.add_argument("--include", action="append", metavar="PATTERN", default=[],
+                         help=f"only files whose name or relative path matches (repeatable{', default: ' + ' '.join(include) if include else ''})")
+        sub.add_argument("--exclude", action="append", metavar="PATTERN", default=[],
+                         help="skip files and folders whose name or relative path matches (repeatable)")
+        sub.add_argument("--no-recursive", dest="recursive", action="store_false",
+                         help="do not search subfolders")
+        sub.add_argument("--dry-run", action="store_true",
+                         help="list the files that would be processed and exit")
+        if script_arguments and script_arguments[0] == command:
+            script_arguments[1](sub)
+    sub = commands.add_parser("serve", help="run the local HTTP encode/decode service",
+                              epilog="See python service.py --help for its options.")
+    if script_arguments and script_arguments[0] == "serve":
+        script_arguments[1](sub)
+    return parser
+
+def load_script(command):
+    """
+    Import the script behind a command (and with it Pillow and the codecs)
+    Returns: (module, function adding its options to a parser)
+    """
+    if command == "encode":
+        import UniversalWAVNG
+        return UniversalWAVNG, UniversalWAVNG.add_encode_arguments
+    if command == "serve":
+        import service
+        return service, service.add_serve_arguments
+    import decode_to_image
+    return decode_to_image, decode_to_image.add_decode_arguments
+
+# ---------- MAIN ----------
+def dry_run(items):
+    count = 0
+    for path, _ in items:
+        print(path)
+        count += 1
+    print("-" * 50)
+    print(f"{count} file(s) found")
+
+def run_pipe(script, command, args, source, name):
+    """
+    Convert one file read from source and write the result to stdout
+    Returns: exit code
+    """
+    pipe = script.encode_pipe if command == "encode" else script.decode_pipe
+    try:
+        pipe(source, sys.stdout.buffer, args, name)
+    except Exception as e:
+        print(f"✗ Error: {name}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+def main():
+    # The light parser answers --help and plain dry runs; anything else needs the
+    # script's options, and parsing again with them keeps "--quality LOW" from
+    # being read as a path
+    parser = build_parser()
+    args, rest = parser.parse_known_args()
+    script = None
+    if rest or not getattr(args, "dry_run", False):
+        script, add_arguments = load_script(args.command)
+        parser = build_parser((args.command, add_arguments))
+        args = parser.parse_args()
+    if args.command == "serve":
+        return script.serve(args)
+
+    stdin = PIPE in args.paths
+    if stdin and (len(args.paths) > 1 or args.output not in (None, PIPE)):
+        parser.error(f"{PIPE} (stdin) must be the only path and is written to stdout")
+    missing = [path for path in args.paths if path != PIPE and not os.path.exists(path)]
+    if missing:
+        parser.error(f"no such file or folder: {', '.join(missing)}")
+
+    extensions, include, _ = COMMANDS[args.command]
+    items = [] if stdin else iter_files(args.paths, extensions, args.include or include, args.exclude,
+                                        args.recursive)
+
+    if args.output == PIPE and not stdin:
+        items = list(items)
+        if len(items) != 1:
+            parser.error(f"-o {PIPE} (stdout) needs exactly one input file, found {len(items)}")
+
+    if args.dry_run:
+        dry_run([("<stdin>", "")] if stdin else items)
+        return 0
+
+    if stdin:
+        return run_pipe(script, args.command, args, sys.stdin.buffer, "<stdin>")
+    if args.output == PIPE:
+        with open(items[0][0], 'rb') as source:
+            return run_pipe(script, args.command, args, source, items[0][0])
+
+    out_folder = args.output or script.OUT_FOLDER
+    if args.command == "encode":
+        _, _, failed = script.encode_files(items, out_folder, args)
+    else:
+        _, _, failed = script.decode_files(items, out_folder, args, script.make_output(args))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
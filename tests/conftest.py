@@ -0,0 +1,44 @@
+"""
+Shared helpers for the test suite (run with `python -m pytest` from the repository root)
+"""
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def gradient(size=(96, 64), mode="RGB"):
+    """
+    A smooth gradient with a few hard edges, in any of the native pixel modes
+    """
+    w, h = size
+    img = Image.new("RGBA", size)
+    img.putdata([((x * 255) // w, (y * 255) // h, ((x + y) * 7) % 256, (x * y) % 256)
+                 for y in range(h) for x in range(w)])
+    ImageDraw.Draw(img).rectangle((w // 4, h // 4, w // 2, h // 2), fill=(255, 0, 0, 128))
+    return img.convert(mode) if mode != "RGBA" else img
+
+
+def image_bytes(img, fmt="PNG", **params):
+    out = io.BytesIO()
+    img.save(out, fmt, **params)
+    out.seek(0)
+    return out
+
+
+@pytest.fixture
+def png_file(tmp_path):
+    """
+    Factory writing an image to a PNG in tmp_path
+    Returns: path
+    """
+    def write(img, name="image.png"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        img.save(path)
+        return str(path)
+    return write
@@ -0,0 +1,142 @@
+"""
+Archive WAVs: appending, reopening, recovery and entry removal
+"""
+import os
+import struct
+
+import pytest
+from PIL import Image
+
+import archive
+from conftest import gradient, image_bytes
+from wav_codec import EncodeOptions, encode_image_payload, find_data_chunk, read_wav, write_wav
+
+
+def add_images(archive_file, names, size=(32, 24)):
+    """
+    Encode one gradient per name (each a little different) into the archive
+    Returns: {name: source image}
+    """
+    images = {}
+    with archive.ArchiveWriter(archive_file) as writer:
+        for index, name in enumerate(names):
+            img = gradient(size).rotate(index * 40)
+            payload, result = encode_image_payload(image_bytes(img), EncodeOptions(max_size=None))
+            writer.add(name, payload, result)
+            images[name] = img
+    return images
+
+
+def extract(archive_file, name, out_dir):
+    result = archive.extract_entry(name, archive_file, str(out_dir))
+    with Image.open(result.out_file) as img:
+        return result.out_file, img.convert("RGB")
+
+
+def test_create_and_extract(tmp_path):
+    archive_file = str(tmp_path / "set.wav")
+    images = add_images(archive_file, ["a.png", "b.png"])
+    assert [entry.name for entry in archive.list_archive(archive_file)] == ["a.png", "b.png"]
+    for name, img in images.items():
+        out_file, decoded = extract(archive_file, name, tmp_path / "out")
+        assert decoded.tobytes() == img.tobytes()
+    # Still a plain WAV: the stdlib reader sees the whole data chunk
+    assert read_wav(archive_file)[:4] == archive.ARCHIVE_MAGIC
+
+
+def test_append_after_reopen(tmp_path):
+    archive_file = str(tmp_path / "set.wav")
+    first = add_images(archive_file, ["a.png"])
+    second = add_images(archive_file, ["b.png", "a.png"])
+    entries = archive.list_archive(archive_file)
+    assert [entry.name for entry in entries] == ["b.png", "a.png"]
+    # Appending again replaces the entry, it doesn't duplicate it
+    _, decoded = extract(archive_file, "a.png", tmp_path)
+    assert decoded.tobytes() == second["a.png"].tobytes() != first["a.png"].tobytes()
+
+
+def test_sizes_stay_consistent(tmp_path):
+    archive_file = str(tmp_path / "set.wav")
+    add_images(archive_file, ["a.png"])
+    add_images(archive_file, ["b.png"])
+    with open(archive_file, 'rb') as f:
+        buf = f.read()
+    offset, length = find_data_chunk(buf)
+    assert offset + length == len(buf)
+    assert struct.unpack_from('<I', buf, 4)[0] + 8 == len(buf)
+    assert length % 2 == 0
+
+
+def test_interrupted_append_is_recovered(tmp_path):
+    archive_file = str(tmp_path / "set.wav")
+    add_images(archive_file, ["a.png"])
+    committed = os.path.getsize(archive_file)
+
+    # An append that never reached close(): payload bytes but no new index or sizes
+    writer = archive.ArchiveWriter(archive_file)
+    img = gradient((32, 24))
+    payload, result = encode_image_payload(image_bytes(img), EncodeOptions(max_size=None))
+    writer.add("lost.png", payload, result)
+    writer._file.close()
+    writer._file = None
+    assert os.path.getsize(archive_file) > committed
+    assert [entry.name for entry in archive.list_archive(archive_file)] == ["a.png"]
+
+    with archive.ArchiveWriter(archive_file) as writer:
+        assert writer.discarded == len(payload)
+    add_images(archive_file, ["b.png"])
+    assert [entry.name for entry in archive.list_archive(archive_file)] == ["a.png", "b.png"]
+    extract(archive_file, "b.png", tmp_path)
+
+
+def test_foreign_trailing_chunk_is_refused(tmp_path):
+    archive_file = str(tmp_path / "set.wav")
+    add_images(archive_file, ["a.png"])
+    with open(archive_file, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        f.write(b'LIST' + struct.pack('<I', 4) + b'INFO')
+        size = f.tell()
+        f.seek(4)
+        f.write(struct.pack('<I', size - 8))
+    with pytest.raises(ValueError, match="last chunk"):
+        archive.ArchiveWriter(archive_file)
+
+
+def test_remove_entries(tmp_path):
+    archive_file = str(tmp_path / "set.wav")
+    add_images(archive_file, ["a.png", "b.png", "c.png"])
+    archive.remove_entries(archive_file, ["b.png", "missing.png"])
+    assert [entry.name for entry in archive.list_archive(archive_file)] == ["a.png", "c.png"]
+    with pytest.raises(KeyError):
+        extract(archive_file, "b.png", tmp_path)
+    extract(archive_file, "c.png", tmp_path)
+
+
+def test_not_an_archive(tmp_path, png_file):
+    wav_file = str(tmp_path / "plain.wav")
+    payload, _ = encode_image_payload(png_file(gradient((8, 8))), EncodeOptions())
+    write_wav(wav_file, payload)
+    with pytest.raises(ValueError, match="not a SonicRaster archive"):
+        archive.list_archive(wav_file)
+
+
+# ---------- OUTPUT NAMES ----------
+def test_output_names_keep_extension_and_folders():
+    assert archive.entry_output_name("photo.jpg") == "photo_jpg_decoded.png"
+    assert archive.entry_output_name("sub/dir/photo.jpg", ext="ppm") == os.path.join("sub", "dir",
+                                                                                      "photo_jpg_decoded.ppm")
+    assert archive.output_clashes(["a.png", "a.jpg", "b.png"]) == []
+
+
+@pytest.mark.parametrize("name", ["../evil.png", "sub/../../evil.png", "/abs.png", "sub/", "."])
+def test_output_names_stay_inside_the_folder(name):
+    with pytest.raises(ValueError, match="leave the output folder"):
+        archive.entry_output_name(name)
+
+
+def test_extract_creates_subfolders(tmp_path):
+    archive_file = str(tmp_path / "set.wav")
+    images = add_images(archive_file, ["nested/deeper/a.png"])
+    out_file, decoded = extract(archive_file, "nested/deeper/a.png", tmp_path / "out")
+    assert out_file == os.path.join(str(tmp_path / "out"), "nested", "deeper", "a_png_decoded.png")
+    assert decoded.tobytes() == images["nested/deeper/a.png"].tobytes()
@@ -0,0 +1,217 @@
+"""
+Round trips through the version 2 payload format
+"""
+import zlib
+
+import pytest
+from PIL import Image, ImageChops
+
+import animation
+import wav_codec
+from conftest import gradient, image_bytes
+from filters import FILTER_NAMES
+from wav_codec import EncodeOptions, encode_image_payload, read_payload_info
+
+
+def encode(img, fmt="PNG", **options):
+    options.setdefault("max_size", None)
+    payload, result = encode_image_payload(image_bytes(img, fmt), EncodeOptions(**options))
+    return payload, result
+
+
+def decode(payload):
+    info, images, _ = wav_codec.decode_frames(payload)
+    return info, images
+
+
+def assert_same(a, b):
+    assert a.mode == b.mode and a.size == b.size
+    assert a.tobytes() == b.tobytes()
+
+
+# ---------- HEADER ----------
+def test_header_records_are_last_checksum():
+    payload, _ = encode(gradient(), strip_rows=16, filter="paeth", pyramid=True)
+    info = read_payload_info(payload)
+    assert info.version == wav_codec.FORMAT_VERSION
+    assert payload[:4] == wav_codec.MAGIC
+
+    pos, tags = wav_codec.HEADER_V2.size, []
+    while pos < info.header_size:
+        tag, length = wav_codec.RECORD.unpack_from(payload, pos)
+        tags.append(tag)
+        pos += wav_codec.RECORD.size + length
+    assert pos == info.header_size
+    assert tags[-1] == wav_codec.TAG_CHECKSUM
+    assert {wav_codec.TAG_STRIPS, wav_codec.TAG_FILTER, wav_codec.TAG_PYRAMID} <= set(tags)
+
+
+def test_legacy_header_still_reads():
+    pixels = gradient((5, 3)).tobytes()
+    payload = wav_codec.encode_header(5, 3, 10, 6, 0, len(pixels)) + pixels
+    info = read_payload_info(payload)
+    assert (info.version, info.width, info.height) == (1, 5, 3)
+    assert (info.original_width, info.original_height) == (10, 6)
+    assert info.strip_offsets == [wav_codec.HEADER_SIZE]
+
+
+def test_unknown_version_is_rejected():
+    payload, _ = encode(gradient((8, 8)))
+    damaged = bytearray(payload)
+    damaged[4] = wav_codec.FORMAT_VERSION + 1
+    with pytest.raises(ValueError, match="version"):
+        read_payload_info(bytes(damaged))
+
+
+# ---------- PIXELS ----------
+@pytest.mark.parametrize("mode", wav_codec.PIXEL_MODES)
+def test_native_modes_round_trip(mode):
+    img = gradient(mode=mode)
+    payload, result = encode(img, palette="off")
+    info, (decoded,) = decode(payload)
+    assert result.mode == info.mode == mode
+    assert_same(decoded, img)
+
+
+def test_flatten_stores_rgb():
+    payload, _ = encode(gradient(mode="RGBA"), flatten=True)
+    info, (decoded,) = decode(payload)
+    assert info.mode == decoded.mode == "RGB"
+
+
+@pytest.mark.parametrize("planar", [False, True])
+@pytest.mark.parametrize("filter_name", FILTER_NAMES)
+def test_filters_round_trip(filter_name, planar):
+    img = gradient(mode="RGBA")
+    payload, _ = encode(img, filter=filter_name, planar=planar, palette="off", strip_rows=10)
+    info, (decoded,) = decode(payload)
+    assert info.filter.name == wav_codec.filters.make_spec(filter_name, planar).name
+    assert_same(decoded, img)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "none"])
+def test_strips_round_trip(codec):
+    img = gradient((40, 50))
+    payload, _ = encode(img, strip_rows=7, codec=codec, enable_compression=codec != "none", threads=3)
+    info = read_payload_info(payload)
+    assert info.strip_count == 8 and info.strip_rows == 7
+    assert info.strip_offsets[0] == info.header_size
+    assert info.strip_offsets[-1] + info.strip_lengths[-1] == len(payload)
+    assert_same(decode(payload)[1][0], img)
+
+
+def test_region_reads_only_its_strips():
+    img = gradient((40, 50))
+    payload, _ = encode(img, strip_rows=8)
+    region = (5, 17, 31, 30)
+    _, decoded = wav_codec.decode_region(payload, region)
+    assert_same(decoded, img.crop(region))
+
+
+def test_region_outside_image_is_rejected():
+    payload, _ = encode(gradient((40, 50)))
+    with pytest.raises(ValueError, match="outside"):
+        wav_codec.decode_region(payload, (0, 0, 41, 10))
+
+
+def test_palette_round_trip():
+    img = gradient((30, 20)).quantize(5).convert("RGB")
+    payload, result = encode(img, palette="auto")
+    info, (decoded,) = decode(payload)
+    assert info.palette is not None and result.palette_colors == 5
+    assert info.palette.bits < 8
+    assert_same(decoded, img)
+
+
+def test_resized_image_keeps_original_size():
+    img = gradient((120, 60))
+    payload, result = encode(img, max_size=30)
+    info, (decoded,) = decode(payload)
+    assert (info.width, info.height) == result.encoded_size == (30, 15)
+    assert (info.original_width, info.original_height) == (120, 60)
+    assert decoded.size == (120, 60)
+
+
+# ---------- PYRAMID ----------
+def test_pyramid_previews():
+    img = gradient((600, 300))
+    payload, _ = encode(img, pyramid=True)
+    info = read_payload_info(payload)
+    assert [(level.width, level.height) for level in info.pyramid] == [(64, 32), (256, 128)]
+    assert info.pyramid[0].offset == info.header_size
+    assert info.strip_offsets[0] == info.pyramid[-1].offset + info.pyramid[-1].length
+
+    _, preview = wav_codec.decode_preview(payload[:info.strip_offsets[0]], 200)
+    assert preview.size == (200, 100)
+    assert_same(decode(payload)[1][0], img)
+
+
+def test_small_images_skip_pyramid_levels():
+    payload, _ = encode(gradient((100, 50)), pyramid=True)
+    assert [level.width for level in read_payload_info(payload).pyramid] == [64]
+
+
+# ---------- CHECKSUMS ----------
+def test_block_checksums_match():
+    payload, _ = encode(gradient((600, 300)), pyramid=True, strip_rows=50)
+    info = read_payload_info(payload)
+    assert info.block_crcs == [zlib.crc32(payload[offset:offset + length]) for offset, length in info.blocks]
+
+
+def test_damaged_header_is_detected():
+    payload, _ = encode(gradient((8, 8)))
+    damaged = bytearray(payload)
+    damaged[6] ^= 1  # low byte of the width
+    with pytest.raises(ValueError, match="checksum"):
+        read_payload_info(bytes(damaged))
+
+
+# ---------- FRAMES ----------
+def animated_gif(count=5):
+    frames = [gradient((24, 16)).rotate(angle * 30).quantize(16) for angle in range(count)]
+    return frames, image_bytes(frames[0], "GIF", save_all=True, append_images=frames[1:], duration=40, loop=0)
+
+
+@pytest.mark.parametrize("delta", animation.FRAME_DELTAS)
+def test_animation_round_trip(delta):
+    frames, gif = animated_gif()
+    payload, result = encode_image_payload(gif, EncodeOptions(max_size=None, frame_delta=delta,
+                                                              keyframe_interval=2))
+    info, decoded = decode(payload)
+    assert info.frame_count == result.frame_count == len(frames)
+    assert result.keyframe_count == 3
+    reference = Image.open(gif)
+    for index, img in enumerate(decoded):
+        reference.seek(index)
+        assert not ImageChops.difference(img.convert("RGB"), reference.convert("RGB")).getbbox()
+
+
+def test_single_frame_decode_matches_sequence():
+    _, gif = animated_gif()
+    payload, _ = encode_image_payload(gif, EncodeOptions(max_size=None, keyframe_interval=3))
+    _, every = decode(payload)
+    for index in (0, 2, 4):
+        _, (frame,), _ = wav_codec.decode_frames(payload, frame=index)
+        assert_same(frame, every[index])
+    with pytest.raises(ValueError, match="outside"):
+        wav_codec.decode_frames(payload, frame=5)
+
+
+def test_animation_off_keeps_first_frame():
+    _, gif = animated_gif()
+    payload, result = encode_image_payload(gif, EncodeOptions(max_size=None, animation=False))
+    info, decoded = decode(payload)
+    assert result.frame_count == 1 and not info.is_animated and len(decoded) == 1
+
+
+@pytest.mark.parametrize("kind", animation.FRAME_DELTAS.values())
+def test_delta_inverts(kind):
+    data, previous = bytes(range(256)) * 4, bytes(reversed(range(256))) * 4
+    delta = animation.delta_encode(data, previous, kind, 256)
+    assert animation.delta_decode(delta, previous, kind, 256) == data
+
+
+# ---------- WAV ----------
+def test_wav_bytes_round_trip():
+    payload, _ = encode(gradient((9, 7)))
+    assert wav_codec.wav_payload(wav_codec.wav_bytes(payload)) == payload
@@ -0,0 +1,130 @@
+"""
+HTTP service: conversions and the 400/413/503/504 limits
+"""
+import http.client
+import json
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import service
+from conftest import gradient, image_bytes
+
+
+@pytest.fixture(scope="module")
+def server():
+    svc = service.Service(jobs=1, max_pending=2)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), service.RequestHandler)
+    httpd.daemon_threads = True
+    httpd.service = svc
+    httpd.quiet = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    svc.close()
+
+
+def request(server, method, path, body=None):
+    """
+    Returns: (status, headers, body)
+    """
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=30)
+    try:
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def error(body):
+    return json.loads(body)["error"]
+
+
+@pytest.fixture(scope="module")
+def wav(server):
+    status, _, body = request(server, "POST", "/encode?quality=ORIGINAL", image_bytes(gradient((40, 30))).read())
+    assert status == 200
+    return body
+
+
+def test_encode_decode_round_trip(server, wav):
+    assert wav[:4] == b'RIFF'
+    status, headers, body = request(server, "POST", "/decode?format=ppm", wav)
+    assert status == 200
+    assert headers["Content-Type"] == "image/x-portable-pixmap"
+    assert headers["X-Original-Size"] == "40x30"
+    assert body.startswith(b'P6')
+
+
+def test_health_and_unknown_path(server):
+    assert request(server, "GET", "/health")[0] == 200
+    assert request(server, "GET", "/nowhere")[0] == 404
+    assert request(server, "POST", "/nowhere", b'x')[0] == 404
+
+
+@pytest.mark.parametrize("query", ["jobs=2", "archive=all.wav", "quality=HUGE", "qual=LOW"])
+def test_bad_query_is_400(server, query):
+    status, _, body = request(server, "POST", f"/encode?{query}", image_bytes(gradient((8, 8))).read())
+    assert status == 400, error(body)
+
+
+def test_bad_image_is_400(server):
+    assert request(server, "POST", "/encode", b'not an image')[0] == 400
+    assert request(server, "POST", "/decode", b'not a wav')[0] == 400
+
+
+def test_oversized_body_is_413(server, monkeypatch):
+    monkeypatch.setattr(server.service, "max_request_bytes", 100)
+    status, _, body = request(server, "POST", "/encode", b'\x00' * 101)
+    assert status == 413 and "exceeds the limit" in error(body)
+
+
+def test_oversized_output_is_413(server, wav, monkeypatch):
+    monkeypatch.setattr(server.service, "max_output_pixels", 40 * 30 - 1)
+    status, _, body = request(server, "POST", "/decode", wav)
+    assert status == 413 and "pixels" in error(body)
+    # A preview stays small whatever the image size
+    assert request(server, "POST", "/decode?preview=16", wav)[0] == 200
+
+
+def test_full_queue_is_503(server, wav):
+    svc = server.service
+    for _ in range(svc.max_pending):
+        svc.slots.acquire()
+    try:
+        status, headers, body = request(server, "POST", "/decode", wav)
+    finally:
+        for _ in range(svc.max_pending):
+            svc.slots.release()
+    assert status == 503 and headers["Retry-After"] == "1"
+    assert request(server, "POST", "/decode", wav)[0] == 200
+    assert json.loads(request(server, "GET", "/metrics")[2])["rejected"] >= 1
+
+
+def test_slow_conversion_is_504(server, monkeypatch):
+    svc = server.service
+    monkeypatch.setattr(svc, "timeout", 0.1)
+    with pytest.raises(service.RequestError) as info:
+        svc.run(time.sleep, 1.0)
+    assert info.value.status == 504
+    # The conversion keeps its slot until it really finishes
+    deadline = time.monotonic() + 10
+    while svc.metrics.snapshot()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert svc.metrics.snapshot()["pending"] == 0
+
+
+def test_dead_worker_replaces_pool(server, wav):
+    svc = server.service
+    pool = svc.pool
+    with pytest.raises(service.RequestError) as info:
+        svc.run(os._exit, 1)
+    assert info.value.status == 500
+    assert svc.pool is not pool
+    assert request(server, "POST", "/decode", wav)[0] == 200
@@ -0,0 +1,109 @@
+"""
+Watch-folder service: scanning, atomic outputs and replacing a broken worker pool
+"""
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import watch
+
+
+def fake_encode(path, out_dir, options):
+    """
+    Stands in for encode_image_file in the pool; files named die* kill their worker
+    """
+    if os.path.basename(path).startswith("die"):
+        time.sleep(0.2)
+        os._exit(1)
+    time.sleep(options)
+    out_file = os.path.join(out_dir, os.path.basename(path) + ".wav")
+    with open(out_file, "wb") as f:
+        f.write(b"RIFF")
+    return SimpleNamespace(out_file=out_file, file_size=4)
+
+
+def touch(folder, name):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(name.encode())
+    return path
+
+
+def test_scan_skips_hidden_and_unsupported(tmp_path):
+    for name in ("a.png", "b.JPG", ".hidden.png", "notes.txt"):
+        touch(tmp_path, name)
+    os.mkdir(tmp_path / "sub.png")
+    assert sorted(os.path.basename(path) for path in watch.scan_folder(str(tmp_path))) == ["a.png", "b.JPG"]
+
+
+def test_encode_atomic_moves_the_output(tmp_path):
+    source = touch(tmp_path, "a.png")
+    out_dir = tmp_path / "out"
+    tmp_dir = out_dir / ".watch-test"
+    tmp_dir.mkdir(parents=True)
+    result = watch.encode_atomic(fake_encode, source, str(out_dir), 0, str(tmp_dir))
+    assert result.out_file == str(out_dir / "a.png.wav")
+    assert sorted(os.listdir(out_dir)) == [".watch-test", "a.png.wav"]
+    assert os.listdir(tmp_dir) == []
+
+
+def make_service(tmp_path, concurrency):
+    out_dir = tmp_path / "out"
+    out_dir.mkdir(exist_ok=True)
+    service = watch.WatchService(str(tmp_path), str(out_dir), 0.3, fake_encode, {}, concurrency)
+    service.queue = asyncio.Queue()
+    service.stopping = asyncio.Event()
+    service.restart_executor()
+    return service
+
+
+def test_restart_replaces_only_the_broken_pool(tmp_path):
+    service = make_service(tmp_path, 1)
+    broken = service.executor
+    service.restart_executor(broken)
+    fresh = service.executor
+    assert fresh is not broken
+    # A second report of the same broken pool must not shut down its successor
+    service.restart_executor(broken)
+    assert service.executor is fresh
+    assert fresh.submit(int, "7").result() == 7
+    fresh.shutdown()
+
+
+def test_dead_worker_fails_only_its_batch(tmp_path, monkeypatch):
+    started = []
+
+    class CountingExecutor(watch.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            started.append(self)
+
+    monkeypatch.setattr(watch, "ProcessPoolExecutor", CountingExecutor)
+
+    async def run():
+        service = make_service(tmp_path, 3)
+        workers = [asyncio.create_task(service.worker()) for _ in range(3)]
+        # Every task of the pool fails together; the pool is replaced once
+        for name in ("die.png", "a.png", "b.png"):
+            service.queue.put_nowait(touch(tmp_path, name))
+        await asyncio.wait_for(service.queue.join(), 30)
+        assert len(started) == 2
+        assert service.failed >= 1
+
+        failed = service.failed
+        for name in ("c.png", "d.png", "e.png", "f.png"):
+            service.queue.put_nowait(touch(tmp_path, name))
+        await asyncio.wait_for(service.queue.join(), 30)
+        for task in workers:
+            task.cancel()
+        service.executor.shutdown()
+        return service, failed
+
+    service, failed = asyncio.run(run())
+    assert service.failed == failed
+    assert service.successful == 7 - failed
+    assert not service.manifest.is_current(str(tmp_path / "die.png"), {})
+    assert service.manifest.is_current(str(tmp_path / "f.png"), {})
+    # No temporary folders are left behind by the workers that died
+    assert not [name for name in os.listdir(tmp_path / "out") if name.startswith(".watch-")]
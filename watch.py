@@ -0,0 +1,395 @@
+"""
+Watch-folder service: encode images as soon as they land in a folder
+
+Instead of re-running UniversalWAVNG.py from cron, this keeps running and
+watches WATCH_FOLDER (inotify on Linux, directory polling elsewhere). Each
+new or changed image is encoded once it has stopped changing for
+SETTLE_SECONDS. Settled files go through a bounded asyncio queue to a
+process pool, and each WAV is written in a temporary folder inside
+OUT_FOLDER and renamed into place, so readers never see a partial file.
+
+Ctrl+C (or SIGTERM) stops watching and drains the queue before exiting; a
+second one drops the queued files and only waits for those in progress.
+Images that had not settled yet are picked up by the manifest on the next
+start, as are images added while the service was not running.
+"""
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import shutil
+import signal
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import UniversalWAVNG
+from batch import resolve_jobs
+from discovery import has_extension
+from manifest import Manifest
+from wav_codec import encode_image_file
+from wav_stream import stream_encode_image_file
+
+# ---------- CONFIG ----------
+WATCH_FOLDER = UniversalWAVNG.SCRIPT_DIR
+OUT_FOLDER = UniversalWAVNG.OUT_FOLDER
+SETTLE_SECONDS = 2.0  # A file must stop changing for this long before it is encoded
+POLL_INTERVAL = 1.0  # Seconds between directory scans when inotify is unavailable
+CONCURRENCY = 0  # Images encoded at once (0 = one per CPU core)
+QUEUE_PER_WORKER = 4  # Settled files queued per worker before the watcher waits (backpressure)
+MANIFEST_SAVE_INTERVAL = 5.0  # Seconds between manifest writes while busy
+
+# Other encode settings (quality, codec, filter, ...) come from UniversalWAVNG.py's CONFIG
+
+# ---------- FILES ----------
+def is_supported(name):
+    name = os.path.basename(name)
+    return not name.startswith('.') and has_extension(name, UniversalWAVNG.SUPPORTED_EXTENSIONS)
+
+def file_signature(path):
+    """
+    Returns: (size, mtime_ns) of a regular file, or None if it is gone
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns) if os.path.isfile(path) else None
+
+def scan_folder(folder):
+    """
+    Returns: {path: (size, mtime_ns)} of every supported image in folder
+    """
+    found = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not is_supported(entry.name):
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                pass
+    return found
+
+def encode_atomic(encode, image_file, out_dir, options, tmp_dir):
+    """
+    Encode into tmp_dir (a folder inside out_dir), then rename the WAV into place
+    The caller creates and removes tmp_dir, so it is cleaned up even if the
+    worker process running this dies.
+    """
+    result = encode(image_file, tmp_dir, options)
+    out_file = os.path.join(out_dir, os.path.basename(result.out_file))
+    os.replace(result.out_file, out_file)
+    result.out_file = out_file
+    return result
+
+# ---------- WATCHERS ----------
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length (name follows)
+
+class InotifyWatcher:
+    """
+    Linux inotify on one folder through libc (no extra packages needed)
+    """
+    kind = "inotify"
+
+    def __init__(self, folder, service):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"cannot watch {folder}")
+        self.folder = folder
+        self.service = service
+        self.loop = None
+
+    def start(self, loop):
+        self.loop = loop
+        loop.add_reader(self.fd, self._read_events)
+
+    def _read_events(self):
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos + INOTIFY_EVENT.size <= len(buf):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(buf, pos)
+            name = buf[pos + INOTIFY_EVENT.size:pos + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            pos += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; fall back to a full scan
+                self.loop.create_task(self.service.rescan())
+            elif name:
+                self.service.notice(os.path.join(self.folder, os.fsdecode(name)))
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+class PollingWatcher:
+    """
+    Portable fallback: rescan the folder every POLL_INTERVAL seconds
+    Only files whose size or mtime changed since the last scan are reported.
+    """
+    kind = "polling"
+
+    def __init__(self, folder, service, interval=POLL_INTERVAL):
+        self.folder = folder
+        self.service = service
+        self.interval = interval
+        self.task = None
+
+    def start(self, loop):
+        self.task = loop.create_task(self._poll(loop))
+
+    async def _poll(self, loop):
+        previous = {}
+        while True:
+            # scandir + stat of a big folder blocks, so keep it off the event loop
+            current = await loop.run_in_executor(None, scan_folder, self.folder)
+            for path, signature in current.items():
+                if previous.get(path) != signature:
+                    self.service.notice(path, signature)
+            previous = current
+            await asyncio.sleep(self.interval)
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+
+def make_watcher(folder, service, poll=False, interval=POLL_INTERVAL):
+    if not poll:
+        try:
+            return InotifyWatcher(folder, service)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollingWatcher(folder, service, interval)
+
+# ---------- SERVICE ----------
+class WatchService:
+    """
+    Debounces watcher events and feeds settled images to a bounded worker pool
+    """
+
+    def __init__(self, folder, out_dir, options, encode, settings, concurrency,
+                 settle=SETTLE_SECONDS, poll=False, interval=POLL_INTERVAL):
+        self.folder = folder
+        self.out_dir = out_dir
+        self.options = options
+        self.encode = encode
+        self.settings = settings
+        self.concurrency = concurrency
+        self.settle = settle
+        self.poll = poll
+        self.interval = interval
+        self.manifest = Manifest(out_dir)
+        self.pending = {}  # path -> (monotonic time of the last change, signature)
+        self.first_seen = {}  # path -> monotonic time the current version was first noticed
+        self.active = set()  # Queued or being encoded
+        self.queue = None
+        self.executor = None
+        self.stopping = None
+        self.successful = 0
+        self.failed = 0
+
+    def notice(self, path, signature=None):
+        """
+        Called by the watchers for every created or changed file
+        """
+        if not is_supported(path):
+            return
+        signature = signature or file_signature(path)
+        if signature is None:
+            return
+        now = time.monotonic()
+        entry = self.pending.get(path)
+        if entry is None or entry[1] != signature:
+            self.pending[path] = (now, signature)
+            self.first_seen.setdefault(path, now)
+
+    async def rescan(self):
+        loop = asyncio.get_running_loop()
+        for path, signature in (await loop.run_in_executor(None, scan_folder, self.folder)).items():
+            self.notice(path, signature)
+
+    async def settle_loop(self):
+        """
+        Queue files that stopped changing; waits (backpressure) while the queue is full
+        """
+        last_save = time.monotonic()
+        tick = min(self.settle / 4, 0.5) or 0.05
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            for path, (changed_at, signature) in list(self.pending.items()):
+                if self.stopping.is_set():
+                    break
+                if now - changed_at < self.settle or path in self.active:
+                    continue
+                current = file_signature(path)
+                if current is None:
+                    del self.pending[path]
+                    self.first_seen.pop(path, None)
+                    continue
+                if current != signature:
+                    # Still being written (e.g. no events from a network share)
+                    self.pending[path] = (now, current)
+                    continue
+
+                del self.pending[path]
+                if self.manifest.is_current(path, self.settings):
+                    self.first_seen.pop(path, None)
+                    continue
+                self.active.add(path)
+                await self.queue.put(path)
+
+            if self.manifest.dirty and now - last_save >= MANIFEST_SAVE_INTERVAL:
+                self.manifest.save()
+                last_save = now
+            try:
+                await asyncio.wait_for(self.stopping.wait(), tick)
+            except asyncio.TimeoutError:
+                pass
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            path = await self.queue.get()
+            name = os.path.basename(path)
+            executor = self.executor
+            tmp_dir = tempfile.mkdtemp(prefix=".watch-", dir=self.out_dir)
+            try:
+                result = await loop.run_in_executor(executor, encode_atomic, self.encode, path,
+                                                    self.out_dir, self.options, tmp_dir)
+            except BrokenProcessPool:
+                print(f"  ✗ {name}: worker process terminated abruptly")
+                self.manifest.forget(path)
+                self.failed += 1
+                self.restart_executor(executor)
+            except Exception as e:
+                print(f"  ✗ {name}: {e}")
+                self.manifest.forget(path)
+                self.failed += 1
+            else:
+                self.manifest.record(path, [result.out_file], self.settings)
+                self.successful += 1
+                latency = time.monotonic() - self.first_seen.get(path, time.monotonic())
+                print(f"  ✓ {name} -> {os.path.basename(result.out_file)} "
+                      f"({result.file_size / 1024:.1f} KB, {latency:.1f}s after it landed)")
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                self.first_seen.pop(path, None)
+                self.active.discard(path)
+                self.queue.task_done()
+
+    def restart_executor(self, broken=None):
+        """
+        Start a fresh pool, replacing `broken` if given
+        Every task of a broken pool fails at once; only the first to report it
+        replaces the pool, so the others can't shut down its successor.
+        """
+        if broken is not None and self.executor is not broken:
+            return
+        old = self.executor
+        self.executor = ProcessPoolExecutor(max_workers=self.concurrency)
+        if old is not None:
+            old.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        if not self.stopping.is_set():
+            print("\nStopping: finishing queued images (press Ctrl+C again to drop them)...")
+            self.stopping.set()
+            return
+        dropped = 0
+        while not self.queue.empty():
+            path = self.queue.get_nowait()
+            self.active.discard(path)
+            self.queue.task_done()
+            dropped += 1
+        if dropped:
+            print(f"Dropped {dropped} queued image(s); waiting for the ones in progress...")
+
+    def install_signal_handlers(self, loop):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, AttributeError, ValueError):
+                # Windows: signal.signal runs the handler between bytecodes of the main thread
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(self.stop))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.concurrency * QUEUE_PER_WORKER)
+        self.stopping = asyncio.Event()
+        self.restart_executor()
+        self.install_signal_handlers(loop)
+
+        watcher = make_watcher(self.folder, self, self.poll, self.interval)
+        watcher.start(loop)
+        await self.rescan()  # Catch up on images added while the service was down
+
+        workers = [loop.create_task(self.worker()) for _ in range(self.concurrency)]
+        settler = loop.create_task(self.settle_loop())
+        print(f"Watching {self.folder} ({watcher.kind}, {self.concurrency} worker(s)) -> {self.out_dir}")
+        print("Press Ctrl+C to stop")
+
+        try:
+            await self.stopping.wait()
+        finally:
+            watcher.close()
+            await settler
+            await self.queue.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.executor.shutdown(wait=True)
+            self.manifest.save()
+
+        print("\n" + "=" * 50)
+        print(f"Watch stopped. Success: {self.successful} | Failed: {self.failed}")
+
+# ---------- MAIN ----------
+def main():
+    parser = argparse.ArgumentParser(description="Watch a folder and encode new images into WAV files")
+    parser.add_argument("--input", default=WATCH_FOLDER, help="folder to watch (default: %(default)s)")
+    parser.add_argument("--output", default=OUT_FOLDER, help="folder for the WAV files (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=CONCURRENCY,
+                        help="images encoded at once (0 = one per CPU core, default: %(default)s)")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="seconds a file must stay unchanged before encoding (default: %(default)s)")
+    parser.add_argument("--poll", action="store_true",
+                        help="poll the folder instead of using inotify")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                        help="seconds between polls (default: %(default)s)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+
+    defaults = UniversalWAVNG.default_args()
+    options = UniversalWAVNG.make_options(defaults)
+    streaming = defaults.streaming
+    encode = stream_encode_image_file if streaming else encode_image_file
+
+    service = WatchService(os.path.abspath(args.input), args.output, options, encode,
+                           UniversalWAVNG.encode_settings(options, streaming), resolve_jobs(args.jobs),
+                           args.settle, args.poll, args.interval)
+    asyncio.run(service.run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1216 @@
+import io
+import math
+import mmap
+import os
+import struct
+import wave
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+import animation
+import compression
+import filters
+import palette
+from animation import KEYFRAME_INTERVAL, FrameInfo, FrameSequence
+from palette import PaletteSpec
+from output import OutputProfile, save_animation, save_image
+from profiling import StageTimer
+
+# ---------- FORMAT CONSTANTS ----------
+SAMPLE_RATE = 44100
+CHANNELS = 1
+SAMPLE_WIDTH = 2
+
+HEADER_SIZE = 13
+
+# Versioned (v2) container: fixed header followed by tagged records
+MAGIC = b'SRWV'
+FORMAT_VERSION = 2
+HEADER_V2 = struct.Struct('<4sBBHHHHQI')  # magic, version, codec, 4 x dimensions, uncompressed size, header size
+RECORD = struct.Struct('<BI')  # tag, length
+STRIP_TABLE = struct.Struct('<HI')  # rows per strip, strip count (followed by one uint32 length per strip)
+
+TAG_STRIPS = 1
+TAG_FILTER = 2  # filters.FilterSpec; absent means unfiltered interleaved RGB
+TAG_PYRAMID = 3  # level count, then (width, height, stored length) per level, smallest first
+TAG_MODE = 4  # pixel mode ID (index into PIXEL_MODES); absent means RGB
+TAG_PALETTE = 5  # palette.PaletteSpec; present means rows hold packed palette indices
+TAG_CHECKSUM = 6  # CRC32 of the header up to this record, then one CRC32 per stored block; always last
+TAG_FRAMES = 7  # animation.FRAME_TABLE; present means an animation whose later frames follow the strips
+CHECKSUM_TABLE = struct.Struct('<II')  # header CRC, block count (one uint32 per block follows)
+
+PIXEL_MODES = ("RGB", "L", "LA", "RGBA")  # Stored natively, one byte per channel
+
+PYRAMID_LEVEL = struct.Struct('<HHI')
+PYRAMID_SIZES = (64, 256)  # Longest side of each embedded preview level
+
+# "exact" resamples the fully decoded image; "fast" lets JPEG decode at 1/2-1/8
+# scale (draft) and averages whole factors away with reduce() before the final Lanczos
+RESIZE_MODES = ("exact", "fast")
+FAST_RESIZE_MODES = ("L", "LA", "RGB", "RGBA", "CMYK", "YCbCr", "I", "F")  # Safe to resample before converting
+
+QUALITY_SETTINGS = {
+    "LOW": 256,
+    "MEDIUM": 512,
+    "HIGH": 1024,
+    "MAX": 2048,
+    "ORIGINAL": None  # No resizing
+}
+
+
+# ---------- HEADER ----------
+def encode_header(width, height, original_width, original_height, codec, uncompressed_size):
+    """
+    Encode header with metadata
+    Format: 4 uint16 (dimensions) + 1 byte (codec ID, 0/1 = old compression flag) + 1 uint32 (uncompressed size) = 13 bytes
+    """
+    header = struct.pack('<HHHH', width, height, original_width, original_height)
+    header += struct.pack('B', int(codec))
+    header += struct.pack('<I', uncompressed_size)
+    return header
+
+
+def decode_header(data):
+    """
+    Decode header from first 13 bytes
+    Returns: (width, height, original_width, original_height, codec, uncompressed_size)
+    """
+    width, height, original_w, original_h = struct.unpack('<HHHH', data[:8])
+    codec = struct.unpack('B', data[8:9])[0]
+    uncompressed_size = struct.unpack('<I', data[9:13])[0]
+
+    return width, height, original_w, original_h, codec, uncompressed_size
+
+
+def encode_header_v2(width, height, original_width, original_height, codec, uncompressed_size, records=(),
+                     block_crcs=None):
+    """
+    Encode a versioned header
+    Format: fixed 26-byte header + (tag, length, body) records; pixel data starts at the header size
+    With block_crcs (CRC32 of each pyramid level, then each strip, as stored)
+    a checksum record closes the header and also covers the header itself.
+    """
+    body = b''.join(RECORD.pack(tag, len(data)) + data for tag, data in records)
+    checksum_size = 0 if block_crcs is None else RECORD.size + CHECKSUM_TABLE.size + 4 * len(block_crcs)
+    header_size = HEADER_V2.size + len(body) + checksum_size
+    header = HEADER_V2.pack(MAGIC, FORMAT_VERSION, codec, width, height, original_width, original_height,
+                            uncompressed_size, header_size) + body
+    if block_crcs is not None:
+        header += RECORD.pack(TAG_CHECKSUM, checksum_size - RECORD.size)
+        header += CHECKSUM_TABLE.pack(zlib.crc32(header), len(block_crcs))
+        header += struct.pack(f'<{len(block_crcs)}I', *block_crcs)
+    return header
+
+
+def encode_strip_table(strip_rows, strip_lengths):
+    return STRIP_TABLE.pack(strip_rows, len(strip_lengths)) + struct.pack(f'<{len(strip_lengths)}I', *strip_lengths)
+
+
+def encode_pyramid_table(levels):
+    """
+    Encode the pyramid record from (width, height, stored length) tuples, smallest first
+    """
+    return struct.pack('B', len(levels)) + b''.join(PYRAMID_LEVEL.pack(*level) for level in levels)
+
+
+def encode_mode(mode):
+    return struct.pack('B', PIXEL_MODES.index(mode))
+
+
+def is_versioned(data):
+    return len(data) >= HEADER_V2.size and bytes(data[:4]) == MAGIC
+
+
+@dataclass
+class PyramidLevel:
+    width: int
+    height: int
+    offset: int
+    length: int
+
+
+@dataclass
+class PayloadInfo:
+    """
+    Parsed header of either payload format
+    Strip i holds rows [i * strip_rows, (i + 1) * strip_rows) and starts at strip_offsets[i].
+    Preview pyramid levels, if any, sit between the header and the first strip.
+    The strips hold the first frame; later frames of an animation follow them.
+    """
+    version: int
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    codec: int
+    uncompressed_size: int
+    header_size: int
+    strip_rows: int
+    strip_offsets: List[int] = field(default_factory=list)
+    strip_lengths: List[int] = field(default_factory=list)
+    filter: filters.FilterSpec = field(default_factory=filters.FilterSpec)
+    pyramid: List[PyramidLevel] = field(default_factory=list)
+    mode: str = "RGB"
+    palette: Optional[PaletteSpec] = None
+    frames: List[FrameInfo] = field(default_factory=list)  # Empty for still images
+    loop: int = 0
+    block_crcs: Optional[List[int]] = None  # One per entry of blocks, when the header has a checksum record
+
+    @property
+    def is_compressed(self):
+        return self.codec != compression.NONE
+
+    @property
+    def codec_name(self):
+        return compression.get_codec(self.codec).name
+
+    @property
+    def strip_count(self):
+        return len(self.strip_lengths)
+
+    @property
+    def stored_size(self):
+        return sum(self.strip_lengths)
+
+    @property
+    def channels(self):
+        return len(self.mode)
+
+    @property
+    def frame_count(self):
+        return max(len(self.frames), 1)
+
+    @property
+    def is_animated(self):
+        return len(self.frames) > 1
+
+    @property
+    def frames_size(self):
+        return sum(frame.length for frame in self.frames)
+
+    @property
+    def row_bytes(self):
+        if self.palette is not None:
+            return self.palette.row_bytes(self.width)
+        return self.width * self.channels
+
+    @property
+    def blocks(self):
+        """
+        (offset, length) of every stored block: pyramid levels, strips, then later animation frames
+        """
+        return ([(level.offset, level.length) for level in self.pyramid]
+                + list(zip(self.strip_offsets, self.strip_lengths))
+                + [(frame.offset, frame.length) for frame in self.frames[1:]])
+
+    @property
+    def filter_layout(self):
+        """
+        Row width and channel count the row filters see (packed palette indices are plain bytes)
+        """
+        if self.palette is not None:
+            return self.row_bytes, 1
+        return self.width, self.channels
+
+
+def read_payload_info(data, payload_size=None):
+    """
+    Parse the header of a legacy (13-byte) or versioned payload
+    `data` may be just the start of the payload if payload_size gives its full length.
+    Raises ValueError if the header fails its checksum.
+    """
+    payload_size = len(data) if payload_size is None else payload_size
+    if not is_versioned(data):
+        w, h, original_w, original_h, codec, uncompressed_size = decode_header(data)
+        return PayloadInfo(1, w, h, original_w, original_h, codec, uncompressed_size, HEADER_SIZE,
+                           max(h, 1), [HEADER_SIZE], [payload_size - HEADER_SIZE])
+
+    _, version, codec, w, h, original_w, original_h, uncompressed_size, header_size = HEADER_V2.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version: {version}")
+
+    records = {}
+    pos = HEADER_V2.size
+    while pos < header_size:
+        tag, length = RECORD.unpack_from(data, pos)
+        if pos + RECORD.size + length > header_size:
+            raise ValueError("header record overruns the header")
+        if tag == TAG_CHECKSUM:
+            header_crc, _ = CHECKSUM_TABLE.unpack_from(data, pos + RECORD.size)
+            if zlib.crc32(data[:pos + RECORD.size]) != header_crc:
+                raise ValueError("header checksum mismatch")
+        pos += RECORD.size
+        records[tag] = data[pos:pos + length]
+        pos += length
+
+    pyramid = []
+    offset = header_size
+    if TAG_PYRAMID in records:
+        table = records[TAG_PYRAMID]
+        for i in range(table[0]):
+            level_w, level_h, length = PYRAMID_LEVEL.unpack_from(table, 1 + i * PYRAMID_LEVEL.size)
+            pyramid.append(PyramidLevel(level_w, level_h, offset, length))
+            offset += length
+
+    if TAG_STRIPS in records:
+        table = records[TAG_STRIPS]
+        strip_rows, count = STRIP_TABLE.unpack_from(table)
+        lengths = list(struct.unpack_from(f'<{count}I', table, STRIP_TABLE.size))
+    else:
+        strip_rows, lengths = max(h, 1), [payload_size - offset]
+
+    spec = filters.FilterSpec.unpack(records[TAG_FILTER]) if TAG_FILTER in records else filters.FilterSpec()
+    mode = "RGB"
+    if TAG_MODE in records:
+        mode_id = records[TAG_MODE][0]
+        if mode_id >= len(PIXEL_MODES):
+            raise ValueError(f"Unsupported pixel mode: {mode_id}")
+        mode = PIXEL_MODES[mode_id]
+    palette_spec = PaletteSpec.unpack(records[TAG_PALETTE], mode) if TAG_PALETTE in records else None
+    block_crcs = None
+    if TAG_CHECKSUM in records:
+        _, count = CHECKSUM_TABLE.unpack_from(records[TAG_CHECKSUM])
+        block_crcs = list(struct.unpack_from(f'<{count}I', records[TAG_CHECKSUM], CHECKSUM_TABLE.size))
+
+    offsets = []
+    for length in lengths:
+        offsets.append(offset)
+        offset += length
+    loop, frames = animation.decode_frame_table(records[TAG_FRAMES], offset) if TAG_FRAMES in records else (0, [])
+
+    return PayloadInfo(version, w, h, original_w, original_h, codec, uncompressed_size, header_size,
+                       strip_rows, offsets, lengths, spec, pyramid, mode, palette_spec, frames, loop, block_crcs)
+
+
+# ---------- PIXELS ----------
+def flatten_to_rgb(img):
+    """
+    Convert any PIL image to RGB, compositing transparent images onto white
+    """
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    return img.convert("RGB")
+
+
+def native_mode(img):
+    """
+    The PIXEL_MODES entry an image is stored in without losing channels
+    1-bit and high bit depth grayscale become L, palette images RGB (or
+    RGBA if they have transparency), other color spaces RGB.
+    """
+    if img.mode in PIXEL_MODES:
+        return img.mode
+    if img.mode in ('1', 'I', 'I;16', 'I;16L', 'I;16B', 'I;16N', 'F'):
+        return 'L'
+    if img.mode == 'PA' or (img.mode == 'P' and 'transparency' in img.info):
+        return 'RGBA'
+    return 'RGB'
+
+
+def common_mode(modes):
+    """
+    The smallest PIXEL_MODES entry that holds every one of the given modes
+    """
+    color = any(mode.startswith("RGB") for mode in modes)
+    alpha = any(mode.endswith("A") for mode in modes)
+    return ("RGB" if color else "L") + ("A" if alpha else "")
+
+
+def to_pixel_mode(img, flatten=False, mode=None):
+    """
+    Convert img to its native storage mode, or to RGB on white if flatten is set
+    `mode` forces a mode chosen from the whole image (e.g. when converting strips).
+    """
+    if flatten:
+        return flatten_to_rgb(img)
+    mode = mode or native_mode(img)
+    return img if img.mode == mode else img.convert(mode)
+
+
+def resize_image(img, max_size):
+    """
+    Shrink img in place to fit max_size x max_size (None keeps the original size)
+    """
+    if max_size is not None:
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    return img
+
+
+def fit_size(size, max_size):
+    """
+    Size of `size` shrunk to fit max_size x max_size, rounded exactly like Image.thumbnail
+    """
+    w, h = size
+    if max_size is None or (w <= max_size and h <= max_size):
+        return size
+    aspect = w / h
+    x = y = max_size
+    if x / y >= aspect:
+        x = max(min(math.floor(y * aspect), math.ceil(y * aspect), key=lambda n: abs(aspect - n / y)), 1)
+    else:
+        y = max(min(math.floor(x / aspect), math.ceil(x / aspect),
+                    key=lambda n: 0 if n == 0 else abs(aspect - x / n)), 1)
+    return x, y
+
+
+def draft_image(img, max_size):
+    """
+    Ask a not yet loaded JPEG to decode at the smallest 1/2, 1/4 or 1/8 scale still covering the target
+    Other formats ignore it.
+    """
+    if max_size is not None and img.format == "JPEG":
+        img.draft(None, fit_size(img.size, max_size))
+    return img
+
+
+def fast_resize(img, max_size):
+    """
+    Shrink img to the same size as resize_image, doing the bulk of the work cheaply
+    reduce() averages whole-number factors away in one pass; Lanczos only
+    runs on the final step of less than 2x.
+    """
+    target = fit_size(img.size, max_size)
+    if target == img.size:
+        return img
+    factor = min(img.width // target[0], img.height // target[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img.resize(target, Image.Resampling.LANCZOS)
+
+
+def pack_pixels(img, palette_spec=None):
+    """
+    Return the interleaved channel bytes of an image in row-major order
+    (or its packed palette index rows with a palette)
+    """
+    if palette_spec is not None:
+        return palette.pack_indices(img, palette_spec)
+    return img.tobytes()
+
+
+def build_pyramid(img, sizes=PYRAMID_SIZES):
+    """
+    Downscaled copies of img (same mode) for preview decoding, smallest first
+    Sizes that would not be smaller than img are skipped.
+    """
+    levels = []
+    source = img
+    for size in sorted(sizes, reverse=True):
+        if max(img.size) <= size:
+            continue
+        source = source.copy()
+        source.thumbnail((size, size), Image.Resampling.LANCZOS)
+        levels.append(source)
+    return levels[::-1]
+
+
+def unpack_pixels(pixel_data, width, height, mode="RGB", palette_spec=None):
+    """
+    Build an image of the given mode from interleaved channel bytes (or packed palette indices)
+    Trailing bytes are ignored; missing pixels are left black (and transparent),
+    or the first palette color with a palette.
+    Returns: (image, pixel_count)
+    """
+    if palette_spec is not None:
+        expected = palette_spec.row_bytes(width) * height
+        usable = min(len(pixel_data), expected)
+        pixel_count = usable * width // max(palette_spec.row_bytes(width), 1)
+    else:
+        channels = len(mode)
+        expected = width * height * channels
+        usable = min(len(pixel_data), expected)
+        usable -= usable % channels
+        pixel_count = usable // channels
+
+    if usable == expected:
+        buf = pixel_data[:expected]
+    else:
+        buf = bytes(pixel_data[:usable]) + bytes(expected - usable)
+
+    if palette_spec is not None:
+        return palette.expand_indices(buf, width, height, palette_spec), pixel_count
+    img = Image.frombuffer(mode, (width, height), buf, 'raw', mode, 0, 1)
+    return img, pixel_count
+
+
+# ---------- PAYLOAD ----------
+def map_threads(func, items, threads=1):
+    """
+    list(map(func, items)) on up to `threads` threads (the compressors release the GIL)
+    """
+    if threads <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(threads, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+def compress_blocks(codec, blocks, level, threads=1):
+    """
+    Compress every block, one per thread, or with fewer blocks than threads
+    each one split over all of them (see compression.compress_parallel)
+    """
+    if len(blocks) >= threads:
+        return map_threads(lambda block: codec.compress(block, level), blocks, threads)
+    return [compression.compress_parallel(codec, block, level, threads) for block in blocks]
+
+
+def select_codec(options, total_size, sampler):
+    """
+    Resolve options to a compression codec and level, running the auto selections if asked
+    sampler() returns sample slices of the data and is only called when needed.
+    Returns: (codec, level)
+    """
+    if not options.enable_compression:
+        return compression.get_codec(compression.NONE), 0
+
+    level = options.compression_level
+    auto_level = level == compression.AUTO
+    samples = None
+    if options.codec == compression.AUTO:
+        samples = sampler()
+        codec, _ = compression.choose_codec(samples, total_size,
+                                            compression.AUTO_CODEC_LEVEL if auto_level else level,
+                                            options.time_budget)
+    else:
+        codec = compression.get_codec(options.codec)
+
+    if auto_level:
+        level, _ = compression.choose_level(codec, samples or sampler(), total_size, options.level_target)
+    return codec, codec.clamp(level)
+
+
+def build_payload(img, original_size, options, timer=None, sequence=None):
+    """
+    Build the WAV payload (header + pixel data) for an already resized image in one of PIXEL_MODES
+    The versioned format is written, with a CRC32 of the header and of every
+    stored block. With options.strip_rows set, every strip of rows is filtered
+    and compressed independently. Images with few enough colors are stored as
+    palette indices unless options.palette is "off". With a FrameSequence
+    (whose first image is img) the later frames are stored after the strips
+    as keyframes or deltas against the previous frame.
+    Returns: (payload, uncompressed_size, stored_size, codec, level, palette_spec), sizes over all frames
+    """
+    timer = timer or StageTimer()
+    w, h = img.size
+    original_w, original_h = original_size
+    images = sequence.images if sequence is not None else [img]
+
+    palette_spec = None
+    if options.palette != "off":
+        with timer.stage("palette"):
+            palette_spec = palette.make_palette(images, img.mode)
+    with timer.stage("pack"):
+        pixel_data = pack_pixels(img, palette_spec)
+    uncompressed_size = len(pixel_data)
+    if palette_spec is not None:
+        # Packed indices are filtered as one-byte samples
+        filter_width, channels = palette_spec.row_bytes(w), 1
+    else:
+        filter_width, channels = w, len(img.mode)
+    row_bytes = filter_width * channels
+    spec = filters.make_spec(options.filter, options.planar)
+    pyramid = []
+    if options.pyramid:
+        with timer.stage("pyramid"):
+            pyramid = build_pyramid(img)
+
+    strip_rows = options.strip_rows or max(h, 1)
+    step = row_bytes * strip_rows
+    view = memoryview(pixel_data)
+    strips = [view[i:i + step] for i in range(0, uncompressed_size, step)] or [view]
+    if spec.active:
+        with timer.stage("filter"):
+            strips = map_threads(lambda strip: filters.filter_strip(strip, filter_width, spec, options.filter, channels),
+                                 strips, options.threads)
+    with timer.stage("select"):
+        codec, level = select_codec(
+            options, sum(len(strip) for strip in strips),
+            lambda: compression.sample_data(strips[0] if len(strips) == 1 else b''.join(strips)))
+
+    # Later frames: keyframes are filtered like the first frame, the others become deltas
+    kinds = animation.frame_kinds(len(images), options.keyframe_interval, options.frame_delta)
+    frames = []
+    if len(images) > 1:
+        with timer.stage("frames"):
+            previous = pixel_data
+            for frame, kind in zip(images[1:], kinds[1:]):
+                data = pack_pixels(frame, palette_spec)
+                if kind != animation.KEY:
+                    frames.append(animation.delta_encode(data, previous, kind, row_bytes))
+                elif spec.active:
+                    frames.append(filters.filter_strip(data, filter_width, spec, options.filter, channels))
+                else:
+                    frames.append(data)
+                previous = data
+
+    # Preview levels keep full pixels: resampling creates colors outside the palette
+    previews = [pack_pixels(preview) for preview in pyramid]
+    if codec.codec_id != compression.NONE:
+        with timer.stage("compress"):
+            strips = compress_blocks(codec, strips, level, options.threads)
+            frames = compress_blocks(codec, frames, level, options.threads)
+            previews = [codec.compress(data, level) for data in previews]
+    with timer.stage("checksum"):
+        block_crcs = [zlib.crc32(data) for data in previews + strips + frames]
+
+    records = [(TAG_STRIPS, encode_strip_table(strip_rows, [len(strip) for strip in strips]))]
+    if spec.active:
+        records.append((TAG_FILTER, spec.pack()))
+    if pyramid:
+        records.append((TAG_PYRAMID, encode_pyramid_table(
+            [(preview.width, preview.height, len(data)) for preview, data in zip(pyramid, previews)])))
+    if img.mode != "RGB":
+        records.append((TAG_MODE, encode_mode(img.mode)))
+    if palette_spec is not None:
+        records.append((TAG_PALETTE, palette_spec.pack()))
+    if sequence is not None:
+        records.append((TAG_FRAMES, animation.encode_frame_table(sequence.loop, [
+            (duration, kind, len(frames[i - 1]) if i else 0)
+            for i, (duration, kind) in enumerate(zip(sequence.durations, kinds))])))
+    payload = bytearray(encode_header_v2(w, h, original_w, original_h, codec.codec_id,
+                                         uncompressed_size, records, block_crcs))
+    for data in previews:
+        payload += data
+    for strip in strips:
+        payload += strip
+    for frame in frames:
+        payload += frame
+    stored_size = sum(len(strip) for strip in strips) + sum(len(frame) for frame in frames)
+
+    # Pad to even length (16-bit samples)
+    if len(payload) % 2 != 0:
+        payload.append(0)
+
+    return payload, uncompressed_size * len(images), stored_size, codec, level, palette_spec
+
+
+def decode_rows(data, info, top=0, bottom=None, threads=1, timer=None):
+    """
+    Return the pixel bytes of rows [top, bottom) of a payload
+    Only the strips covering those rows are read and decompressed; a single
+    compressed stream is decompressed no further than the last requested row
+    (rounded up to a whole filter block).
+    """
+    timer = timer or StageTimer()
+    bottom = info.height if bottom is None else bottom
+    row_bytes = info.row_bytes
+    filter_width, channels = info.filter_layout
+    spec = info.filter
+    data = memoryview(data)
+
+    if bottom <= top:
+        return b''
+
+    first = top // info.strip_rows
+    last = (bottom - 1) // info.strip_rows
+    indices = range(first, min(last + 1, len(info.strip_offsets)))
+    strips = [data[info.strip_offsets[i]:info.strip_offsets[i] + info.strip_lengths[i]] for i in indices]
+
+    # Rows to reconstruct per strip; filtered strips only unfilter whole blocks
+    counts = []
+    for i in indices:
+        start = i * info.strip_rows
+        count = min(info.strip_rows, info.height - start)
+        if spec.active:
+            count = min(count, -(-(bottom - start) // spec.block_rows) * spec.block_rows)
+        counts.append(count)
+
+    if info.is_compressed:
+        codec = compression.get_codec(info.codec)
+        with timer.stage("decompress"):
+            if len(info.strip_offsets) == 1 and bottom < info.height:
+                size = spec.stored_size(filter_width, counts[0], channels) if spec.active else bottom * row_bytes
+                strips = [compression.decompress_prefix(codec, strips[0], size)]
+            else:
+                strips = map_threads(codec.decompress, strips, threads)
+
+    if spec.active:
+        with timer.stage("unfilter"):
+            strips = map_threads(lambda item: filters.unfilter_strip(item[0], filter_width, item[1], spec, channels),
+                                 list(zip(strips, counts)), threads)
+
+    rows = strips[0] if len(strips) == 1 else b''.join(strips)
+    skip = (top - first * info.strip_rows) * row_bytes
+    wanted = (bottom - top) * row_bytes
+    if skip == 0 and len(rows) <= wanted:
+        return rows
+    return rows[skip:skip + wanted]
+
+
+def parse_payload(audio_data, threads=1, timer=None):
+    """
+    Split a WAV payload into its header info and (decompressed) pixel data
+    Returns: (info, pixel_data)
+    """
+    info = read_payload_info(audio_data)
+    return info, decode_rows(audio_data, info, threads=threads, timer=timer)
+
+
+def iter_frame_rows(data, info, start=0, stop=None, threads=1, timer=None):
+    """
+    Yield the pixel bytes of frames [start, stop) of a payload (frame 0 of a still image)
+    Decoding begins at the last keyframe at or before start: earlier frames
+    are never read, and at most one keyframe interval of deltas is applied.
+    """
+    timer = timer or StageTimer()
+    stop = info.frame_count if stop is None else stop
+    first = animation.keyframe_before(info.frames, start) if info.frames else 0
+    filter_width, channels = info.filter_layout
+    frame_size = info.row_bytes * info.height
+    data = memoryview(data)
+
+    rows = None
+    for index in range(first, stop):
+        if index == 0:
+            rows = decode_rows(data, info, threads=threads, timer=timer)
+            if len(rows) < frame_size:
+                rows = bytes(rows) + bytes(frame_size - len(rows))
+        else:
+            frame = info.frames[index]
+            block = data[frame.offset:frame.offset + frame.length]
+            if info.is_compressed:
+                with timer.stage("decompress"):
+                    block = compression.get_codec(info.codec).decompress(block)
+            if not frame.is_key:
+                with timer.stage("delta"):
+                    rows = animation.delta_decode(block, rows, frame.kind, info.row_bytes)
+            elif info.filter.active:
+                with timer.stage("unfilter"):
+                    rows = filters.unfilter_strip(block, filter_width, info.height, info.filter, channels)
+            else:
+                rows = bytes(block)
+        if index >= start:
+            yield rows
+
+
+def decode_frames(audio_data, frame=None, threads=1, timer=None, profile=OutputProfile()):
+    """
+    Decode every frame of a payload, or only frame number `frame`
+    Frames are scaled to original-image pixels unless profile.resize is off.
+    Returns: (info, list of images, decompressed bytes)
+    """
+    timer = timer or StageTimer()
+    info = read_payload_info(audio_data)
+    if frame is not None and not 0 <= frame < info.frame_count:
+        if not info.is_animated:
+            raise ValueError(f"Frame {frame} requested from a still image")
+        raise ValueError(f"Frame {frame} is outside the {info.frame_count}-frame animation")
+
+    start, stop = (0, None) if frame is None else (frame, frame + 1)
+    images = []
+    decompressed_size = 0
+    for rows in iter_frame_rows(audio_data, info, start, stop, threads, timer):
+        with timer.stage("unpack"):
+            img, _ = unpack_pixels(rows, info.width, info.height, info.mode, info.palette)
+        if profile.resize and img.size != (info.original_width, info.original_height):
+            with timer.stage("resize"):
+                img = img.resize((info.original_width, info.original_height), profile.resampler)
+        images.append(img)
+        decompressed_size += len(rows)
+    return info, images, decompressed_size
+
+
+def scale_region(region, info):
+    """
+    Map a (left, top, right, bottom) box in original-image pixels onto the stored image
+    """
+    left, top, right, bottom = region
+    sx = info.width / info.original_width
+    sy = info.height / info.original_height
+    return (max(0, math.floor(left * sx)), max(0, math.floor(top * sy)),
+            min(info.width, math.ceil(right * sx)), min(info.height, math.ceil(bottom * sy)))
+
+
+def decode_region(audio_data, region, threads=1, timer=None, profile=OutputProfile()):
+    """
+    Decode only the (left, top, right, bottom) box of the original image
+    The box is scaled to original-image pixels unless profile.resize is off.
+    Returns: (info, image)
+    """
+    info = read_payload_info(audio_data)
+    left, top, right, bottom = region
+    if not (0 <= left < right <= info.original_width and 0 <= top < bottom <= info.original_height):
+        raise ValueError(f"Region {region} is outside the {info.original_width}x{info.original_height} image")
+
+    timer = timer or StageTimer()
+    box = scale_region(region, info)
+    rows = decode_rows(audio_data, info, box[1], box[3], threads, timer)
+    with timer.stage("unpack"):
+        img, _ = unpack_pixels(rows, info.width, box[3] - box[1], info.mode, info.palette)
+        img = img.crop((box[0], 0, box[2], box[3] - box[1]))
+
+    size = (right - left, bottom - top)
+    if profile.resize and img.size != size:
+        with timer.stage("resize"):
+            img = img.resize(size, profile.resampler)
+    return info, img
+
+
+def decode_preview(audio_data, max_size, timer=None):
+    """
+    Decode a preview fitting max_size x max_size
+    Uses the smallest embedded pyramid level at least that big, so only the
+    first few KB of the payload are read; without one the full image is
+    decoded and shrunk.
+    Returns: (info, image)
+    """
+    timer = timer or StageTimer()
+    info = read_payload_info(audio_data)
+    level = next((level for level in info.pyramid if max(level.width, level.height) >= max_size), None)
+
+    if level is None:
+        rows = decode_rows(audio_data, info, timer=timer)
+        with timer.stage("unpack"):
+            img, _ = unpack_pixels(rows, info.width, info.height, info.mode, info.palette)
+    else:
+        data = memoryview(audio_data)[level.offset:level.offset + level.length]
+        if info.is_compressed:
+            with timer.stage("decompress"):
+                data = compression.get_codec(info.codec).decompress(data)
+        with timer.stage("unpack"):
+            img, _ = unpack_pixels(bytes(data), level.width, level.height, info.mode)
+
+    with timer.stage("resize"):
+        return info, resize_image(img.copy(), max_size)
+
+
+# ---------- WAV I/O ----------
+def write_wav(out_file, payload):
+    with wave.open(out_file, 'wb') as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(payload)
+
+
+def read_wav(wav_file):
+    with wave.open(wav_file, 'rb') as wav:
+        return wav.readframes(wav.getnframes())
+
+
+def wav_bytes(payload):
+    """
+    A complete WAV file holding payload, in memory
+    """
+    buffer = io.BytesIO()
+    write_wav(buffer, payload)
+    return buffer.getvalue()
+
+
+def wav_payload(data):
+    """
+    Frames of a WAV file held in memory, as a view into data where its layout allows
+    """
+    view = memoryview(data)
+    try:
+        offset, length = find_data_chunk(view)
+    except (ValueError, struct.error):
+        return memoryview(read_wav(io.BytesIO(data)))
+    return view[offset:offset + length]
+
+
+def find_data_chunk(buf, file_size=None):
+    """
+    Locate the PCM data chunk of a canonical RIFF/WAVE buffer
+    `buf` may be just the start of the file if file_size gives its full size.
+    Returns: (offset, length) of the sample data, clamped to the file size
+    Raises ValueError for anything the wave module should handle instead.
+    """
+    file_size = len(buf) if file_size is None else file_size
+    if len(buf) < 12 or buf[:4] != b'RIFF' or buf[8:12] != b'WAVE':
+        raise ValueError("not a RIFF/WAVE file")
+
+    pos = 12
+    fmt_ok = False
+    while pos + 8 <= len(buf):
+        chunk_id = bytes(buf[pos:pos + 4])
+        chunk_size = struct.unpack('<I', buf[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            format_tag, channels, _, _, block_align, bits = struct.unpack('<HHIIHH', buf[body:body + 16])
+            if format_tag != 1 or block_align != channels * bits // 8:
+                raise ValueError("unsupported WAV encoding")
+            fmt_ok = True
+        elif chunk_id == b'data':
+            if not fmt_ok:
+                raise ValueError("data chunk before fmt chunk")
+            return body, min(chunk_size, file_size - body)
+        pos = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("no data chunk")
+
+
+class WavPayload:
+    """
+    Read-only view of the frames of an encoded WAV file
+    `data` is a zero-copy memoryview over an mmap of the file; files that
+    can't be mapped or parsed directly fall back to the wave module.
+    Use as a context manager and drop any views of `data` before it exits.
+    """
+
+    def __init__(self, wav_file):
+        self.wav_file = wav_file
+        self._file = None
+        self._map = None
+        try:
+            self._file = open(wav_file, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            offset, length = find_data_chunk(self._map)
+            self.data = memoryview(self._map)[offset:offset + length]
+        except (OSError, ValueError, struct.error):
+            self.close()
+            self.data = memoryview(read_wav(wav_file))
+
+    def close(self):
+        data = getattr(self, 'data', None)
+        if data is not None:
+            try:
+                data.release()
+            except BufferError:
+                pass
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Still exported somewhere; the mapping closes when collected
+                pass
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def encoded_wav_name(image_file):
+    base_name = os.path.splitext(os.path.basename(image_file))[0]
+    return f"{base_name}_encoded.wav"
+
+
+def decoded_image_name(wav_file, region=None, preview=False, ext="png", frame=None):
+    base_name = os.path.splitext(os.path.basename(wav_file))[0].replace("_encoded", "")
+    return decoded_output_name(base_name, region, preview, ext, frame)
+
+
+def decoded_output_name(base_name, region=None, preview=False, ext="png", frame=None):
+    if frame is not None:
+        return f"{base_name}_frame{frame}.{ext}"
+    if preview:
+        return f"{base_name}_preview.{ext}"
+    if region is not None:
+        return f"{base_name}_decoded_{'_'.join(str(v) for v in region)}.{ext}"
+    return f"{base_name}_decoded.{ext}"
+
+
+# ---------- FILE LEVEL ----------
+@dataclass
+class EncodeOptions:
+    max_size: Optional[int] = QUALITY_SETTINGS["HIGH"]
+    enable_compression: bool = True
+    compression_level: Union[int, str] = 9  # Or "auto" to tune it per image towards level_target
+    level_target: compression.LevelTarget = compression.LevelTarget()
+    codec: str = "zlib"  # Any registered codec name, or "auto"
+    time_budget: float = compression.AUTO_TIME_BUDGET  # Auto codec selection only
+    strip_rows: Optional[int] = None
+    threads: int = 1
+    filter: str = "none"  # Any of filters.FILTER_NAMES
+    planar: bool = False
+    pyramid: bool = False  # Embed PYRAMID_SIZES preview levels ahead of the full image
+    flatten: bool = False  # Composite onto white and store RGB instead of the native L/LA/RGB/RGBA mode
+    palette: str = "auto"  # Any of palette.PALETTE_OPTIONS; "quantize" reduces every image to 256 colors (lossy)
+    animation: bool = True  # Store every frame of animated GIF/WebP/PNG and multi-page TIFF (False = first frame only)
+    frame_delta: str = "xor"  # Any of animation.FRAME_DELTAS
+    keyframe_interval: int = KEYFRAME_INTERVAL
+    resize: str = "exact"  # Any of RESIZE_MODES
+
+
+@dataclass
+class EncodeResult:
+    source: str
+    out_file: str
+    original_size: Tuple[int, int]
+    encoded_size: Tuple[int, int]
+    uncompressed_size: int
+    compressed_size: Optional[int]
+    file_size: int
+    codec: str = "zlib"
+    codec_auto: bool = False
+    filter: str = "none"
+    mode: str = "RGB"
+    palette_colors: Optional[int] = None  # Set when stored as palette indices
+    index_bits: Optional[int] = None
+    frame_count: int = 1
+    keyframe_count: int = 1
+    level: Optional[int] = None
+    level_auto: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)  # Seconds per pipeline stage
+
+    @property
+    def pixel_count(self):
+        return self.encoded_size[0] * self.encoded_size[1]
+
+
+@dataclass
+class DecodeResult:
+    source: str
+    out_file: str
+    original_size: Tuple[int, int]
+    encoded_size: Tuple[int, int]
+    is_compressed: bool
+    codec: str
+    stored_size: int
+    decompressed_size: int
+    pixel_count: int
+    strip_count: int = 1
+    region: Optional[Tuple[int, int, int, int]] = None
+    filter: str = "none"
+    mode: str = "RGB"
+    palette_colors: Optional[int] = None
+    frame_count: int = 1
+    frame: Optional[int] = None  # Set when a single frame of an animation was extracted
+    preview: Optional[int] = None
+    output_size: Optional[Tuple[int, int]] = None  # Dimensions actually written
+    timings: Dict[str, float] = field(default_factory=dict)  # Seconds per pipeline stage
+
+
+def read_frames(img):
+    """
+    Every frame of an opened multi-frame image, with its duration in ms
+    Frames are returned at the size of the first one.
+    Returns: (frames, durations, loop)
+    """
+    frames = []
+    durations = []
+    for index in range(img.n_frames):
+        img.seek(index)
+        frame = img.copy()
+        if frames and frame.size != frames[0].size:
+            frame = frame.resize(frames[0].size)
+        frames.append(frame)
+        durations.append(int(img.info.get("duration") or animation.DEFAULT_DURATION))
+    return frames, durations, int(img.info.get("loop", 0))
+
+
+def load_image(image_file, options, timer):
+    """
+    Open, convert and resize an image file for encoding (and quantize it if asked)
+    Animated sources give a FrameSequence of every converted frame (unless
+    options.animation is off); img is then its first frame. With
+    options.resize "fast", JPEGs are decoded at reduced scale and still
+    images are shrunk before they are converted.
+    Returns: (img, original_size, sequence or None)
+    """
+    fast = options.resize == "fast"
+    resize = fast_resize if fast else resize_image
+    with timer.stage("open"):
+        img = Image.open(image_file)
+        original_size = img.size
+        if fast:
+            draft_image(img, options.max_size)
+        img.load()
+    if not options.animation or getattr(img, "n_frames", 1) < 2:
+        if fast and img.mode in FAST_RESIZE_MODES:
+            with timer.stage("resize"):
+                img = resize(img, options.max_size)
+        with timer.stage("convert"):
+            images = [to_pixel_mode(img, options.flatten)]
+        sequence = None
+    else:
+        with timer.stage("frames"):
+            frames, durations, loop = read_frames(img)
+        with timer.stage("convert"):
+            mode = common_mode([native_mode(frame) for frame in frames])
+            images = [to_pixel_mode(frame, options.flatten, mode) for frame in frames]
+        sequence = FrameSequence(images, durations, loop)
+
+    with timer.stage("resize"):
+        images = [resize(frame, options.max_size) for frame in images]
+    if options.palette == "quantize":
+        with timer.stage("quantize"):
+            images = [palette.quantize(frame) for frame in images]
+    if sequence is not None:
+        sequence.images = images
+    return images[0], original_size, sequence
+
+
+def encode_image_payload(image_file, options, timer=None):
+    """
+    Encode one image file into a payload without writing it anywhere
+    Returns: (payload, EncodeResult with out_file and file_size left for the caller)
+    """
+    timer = timer or StageTimer()
+    img, original_size, sequence = load_image(image_file, options, timer)
+    payload, uncompressed_size, stored_size, codec, level, palette_spec = build_payload(
+        img, original_size, options, timer, sequence)
+    kinds = animation.frame_kinds(len(sequence.images) if sequence else 1, options.keyframe_interval,
+                                  options.frame_delta)
+
+    result = EncodeResult(
+        source=image_file,
+        out_file="",
+        original_size=original_size,
+        encoded_size=img.size,
+        uncompressed_size=uncompressed_size,
+        compressed_size=stored_size if codec.codec_id != compression.NONE else None,
+        file_size=len(payload),
+        codec=codec.name,
+        codec_auto=options.enable_compression and options.codec == compression.AUTO,
+        filter=filters.make_spec(options.filter, options.planar).name,
+        mode=img.mode,
+        palette_colors=palette_spec.count if palette_spec else None,
+        index_bits=palette_spec.bits if palette_spec else None,
+        frame_count=len(kinds),
+        keyframe_count=kinds.count(animation.KEY),
+        level=level if codec.codec_id != compression.NONE else None,
+        level_auto=options.enable_compression and options.compression_level == compression.AUTO,
+        timings=timer.stages,
+    )
+    return payload, result
+
+
+def encode_image_file(image_file, out_dir, options):
+    """
+    Encode one image file into <out_dir>/<name>_encoded.wav
+    """
+    timer = StageTimer()
+    payload, result = encode_image_payload(image_file, options, timer)
+
+    result.out_file = os.path.join(out_dir, encoded_wav_name(image_file))
+    with timer.stage("write"):
+        write_wav(result.out_file, payload)
+    result.file_size = os.path.getsize(result.out_file)
+    return result
+
+
+def decode_wav_file(wav_file, out_dir, region=None, threads=1, preview=None, profile=OutputProfile(), frame=None):
+    """
+    Decode one *_encoded.wav file into <out_dir>/<name>_decoded.png
+    With region=(left, top, right, bottom) only that box of the original
+    image is decoded, reading just the strips that cover it. With preview=N
+    a thumbnail of at most N x N is written to <name>_preview.png instead.
+    Animations are written whole (APNG, multi-image PPM or a 4-D .npy);
+    frame=N writes only that frame to <name>_frameN.png, decoding from the
+    keyframe before it. Region and preview apply to the first frame.
+    The output profile picks the resize step and the file format.
+    """
+    out_file = os.path.join(out_dir, decoded_image_name(wav_file, region, preview is not None, profile.extension,
+                                                        frame))
+    timer = StageTimer()
+
+    with timer.stage("read"):
+        payload = WavPayload(wav_file)
+    with payload:
+        return _decode_payload_to_file(payload.data, wav_file, out_file, region, threads, preview, timer, profile,
+                                       frame)
+
+
+def _decode_payload_to_file(audio_data, wav_file, out_file, region, threads, preview=None, timer=None,
+                            profile=OutputProfile(), frame=None):
+    # Kept separate so every view into the mapped file is gone on return
+    timer = timer or StageTimer()
+    if frame is not None and (region is not None or preview is not None):
+        raise ValueError("A single frame can't be combined with a region or preview")
+    images = None
+    if frame is not None or (region is None and preview is None and read_payload_info(audio_data).is_animated):
+        info, images, decompressed_size = decode_frames(audio_data, frame, threads, timer, profile)
+        img = images[0]
+        pixel_count = decompressed_size * info.width // max(info.row_bytes, 1)
+    elif preview is not None:
+        info, img = decode_preview(audio_data, preview, timer)
+        pixel_count = img.width * img.height
+        decompressed_size = pixel_count * info.channels
+    elif region is not None:
+        info, img = decode_region(audio_data, region, threads, timer, profile)
+        pixel_count = img.width * img.height
+        decompressed_size = pixel_count * info.channels
+    else:
+        info, pixel_data = parse_payload(audio_data, threads, timer)
+        with timer.stage("unpack"):
+            img, pixel_count = unpack_pixels(pixel_data, info.width, info.height, info.mode, info.palette)
+        decompressed_size = len(pixel_data)
+
+        # Resize to original dimensions
+        if profile.resize and img.size != (info.original_width, info.original_height):
+            with timer.stage("resize"):
+                img = img.resize((info.original_width, info.original_height), profile.resampler)
+
+    with timer.stage("save"):
+        if images is not None and len(images) > 1:
+            save_animation(images, [f.duration for f in info.frames], info.loop, out_file, profile)
+        else:
+            save_image(img, out_file, profile)
+
+    return DecodeResult(
+        source=wav_file,
+        out_file=out_file,
+        original_size=(info.original_width, info.original_height),
+        encoded_size=(info.width, info.height),
+        is_compressed=info.is_compressed,
+        codec=info.codec_name,
+        stored_size=info.stored_size + info.frames_size,
+        decompressed_size=decompressed_size,
+        pixel_count=pixel_count,
+        strip_count=info.strip_count,
+        region=region,
+        filter=info.filter.name,
+        mode=info.mode,
+        palette_colors=info.palette.count if info.palette else None,
+        frame_count=info.frame_count,
+        frame=frame,
+        preview=preview,
+        output_size=img.size,
+        timings=timer.stages,
+    )
+
+
+# ---------- IN MEMORY ----------
+def read_source(source):
+    """
+    Contents of bytes-like data or of a binary file object (read to the end)
+    """
+    if hasattr(source, "read"):
+        return source.read()
+    return source
+
+
+def encode_image_bytes(source, options=None, name="<memory>"):
+    """
+    Encode an image given as bytes or a binary file object into the bytes of a WAV file
+    Nothing touches the filesystem; name only labels the result.
+    Returns: (WAV file bytes, EncodeResult with source=name and out_file="")
+    """
+    options = options or EncodeOptions()
+    image_file = io.BytesIO(read_source(source))
+    payload, result = encode_image_payload(image_file, options)
+    data = wav_bytes(payload)
+    result.source = name
+    result.file_size = len(data)
+    return data, result
+
+
+def decode_wav_bytes(source, region=None, threads=1, preview=None, profile=OutputProfile(), frame=None,
+                     name="<memory>"):
+    """
+    Decode a WAV file given as bytes or a binary file object into the bytes of an image file
+    Same options as decode_wav_file; the image is written in the profile's format.
+    Returns: (image file bytes, DecodeResult with source=name and out_file="")
+    """
+    timer = StageTimer()
+    out = io.BytesIO()
+    with timer.stage("read"):
+        audio_data = wav_payload(read_source(source))
+    result = _decode_payload_to_file(audio_data, name, out, region, threads, preview, timer, profile, frame)
+    result.out_file = ""
+    return out.getvalue(), result
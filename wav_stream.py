@@ -0,0 +1,453 @@
+"""
+Bounded-memory strip streaming for very large (ORIGINAL quality) images
+
+Produces and reads exactly the same WAV format as wav_codec, but never holds
+more than one strip of pixel data plus the zlib state at a time.
+"""
+import os
+import struct
+import wave
+import zlib
+
+from PIL import Image
+
+import compression
+import filters
+import palette
+from output import OutputProfile, STREAMABLE_FORMATS, RawRowWriter, save_image
+from profiling import StageTimer
+
+from wav_codec import (
+    SAMPLE_RATE, CHANNELS, SAMPLE_WIDTH, TAG_STRIPS, TAG_FILTER, TAG_PYRAMID, TAG_MODE, TAG_PALETTE,
+    EncodeResult, DecodeResult, WavPayload, select_codec, encode_image_file, decode_wav_file,
+    encode_header_v2, encode_strip_table, encode_pyramid_table, encode_mode, read_payload_info,
+    pack_pixels,
+    find_data_chunk, native_mode, to_pixel_mode, resize_image, build_pyramid, encoded_wav_name, decoded_image_name,
+    FAST_RESIZE_MODES, draft_image, fast_resize,
+)
+
+STRIP_ROWS = 64
+READ_CHUNK = 1 << 20
+
+
+# ---------- WAV WRITER ----------
+class StreamingWavWriter:
+    """
+    Incremental WAV frame writer
+    Keeps chunks 16-bit aligned and pads the total payload to an even length.
+    """
+
+    def __init__(self, out_file):
+        self.wav = wave.open(out_file, 'wb')
+        self.wav.setnchannels(CHANNELS)
+        self.wav.setsampwidth(SAMPLE_WIDTH)
+        self.wav.setframerate(SAMPLE_RATE)
+        self.carry = b''
+
+    def write(self, data):
+        if not data:
+            return
+        if self.carry:
+            data = self.carry + data
+        cut = len(data) - (len(data) % SAMPLE_WIDTH)
+        self.carry = bytes(data[cut:])
+        if cut:
+            self.wav.writeframesraw(data[:cut])
+
+    def close(self):
+        if self.carry:
+            self.wav.writeframesraw(self.carry + b'\x00')
+            self.carry = b''
+        self.wav.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------- STRIPS ----------
+def iter_mode_images(img, mode, flatten=False, strip_rows=STRIP_ROWS, top=0, bottom=None):
+    """
+    Yield rows [top, bottom) of img converted to `mode`, strip_rows rows at a time
+    Each strip is converted on its own, so no full-size converted copy is made.
+    """
+    w, h = img.size
+    bottom = h if bottom is None else bottom
+    for y in range(top, bottom, strip_rows):
+        strip = img.crop((0, y, w, min(y + strip_rows, bottom)))
+        yield to_pixel_mode(strip, flatten, mode)
+
+
+def iter_mode_strips(img, mode, flatten=False, strip_rows=STRIP_ROWS, top=0, bottom=None, palette_spec=None):
+    """
+    Yield the interleaved bytes (or packed palette indices) of rows [top, bottom) of img in `mode`
+    """
+    for strip in iter_mode_images(img, mode, flatten, strip_rows, top, bottom):
+        yield pack_pixels(strip, palette_spec)
+
+
+def sample_mode_strips(img, mode, flatten=False, count=compression.AUTO_SAMPLE_COUNT,
+                       sample_bytes=compression.AUTO_SAMPLE_BYTES, palette_spec=None):
+    """
+    Convert `count` evenly spaced row bands of img for automatic codec selection
+    """
+    w, h = img.size
+    rows = max(1, sample_bytes // count // max(1, w * len(mode)))
+    if rows * count >= h:
+        return list(iter_mode_strips(img, mode, flatten, max(1, h), palette_spec=palette_spec))
+    step = (h - rows) // max(1, count - 1)
+    return [pack_pixels(to_pixel_mode(img.crop((0, i * step, w, i * step + rows)), flatten, mode), palette_spec)
+            for i in range(count)]
+
+
+def stream_encode_image_file(image_file, out_dir, options):
+    """
+    Strip-streaming equivalent of wav_codec.encode_image_file
+    Every stored strip (the whole image without options.strip_rows) is
+    filtered, compressed and checksummed independently; the strip table and
+    checksums are patched into the header once they are known. Palette detection takes one extra pass over the strips
+    (cut short at the first strip with too many colors); palette="quantize"
+    converts the whole image in memory. Animations are handed to the
+    in-memory encoder, which needs every frame at once for the deltas.
+    """
+    timer = StageTimer()
+    with timer.stage("open"):
+        img = Image.open(image_file)
+    if options.animation and getattr(img, "n_frames", 1) > 1:
+        img.close()
+        return encode_image_file(image_file, out_dir, options)
+    original_w, original_h = img.size
+    max_size = options.max_size
+
+    mode = "RGB" if options.flatten else native_mode(img)
+    channels = len(mode)
+
+    # Only images that actually shrink need the full convert + thumbnail pass
+    if max_size is not None and (original_w > max_size or original_h > max_size):
+        if options.resize == "fast":
+            # Decode JPEGs at reduced scale and shrink before converting
+            draft_image(img, max_size)
+            if img.mode in FAST_RESIZE_MODES:
+                with timer.stage("resize"):
+                    img = fast_resize(img, max_size)
+        with timer.stage("convert"):
+            img = to_pixel_mode(img, options.flatten, mode)
+        with timer.stage("resize"):
+            img = fast_resize(img, max_size) if options.resize == "fast" else resize_image(img, max_size)
+
+    if options.palette == "quantize":
+        with timer.stage("quantize"):
+            img = palette.quantize(to_pixel_mode(img, options.flatten, mode))
+
+    w, h = img.size
+    palette_spec = None
+    if options.palette != "off":
+        with timer.stage("palette"):
+            palette_spec = palette.make_palette(iter_mode_images(img, mode, options.flatten), mode)
+    if palette_spec is not None:
+        # Packed indices are filtered as one-byte samples
+        filter_width, channels = palette_spec.row_bytes(w), 1
+    else:
+        filter_width = w
+    uncompressed_size = filter_width * channels * h
+    spec = filters.make_spec(options.filter, options.planar)
+    pyramid = []
+    if options.pyramid:
+        with timer.stage("pyramid"):
+            # Converts the whole image only if its mode is not stored natively
+            pyramid = build_pyramid(to_pixel_mode(img, options.flatten, mode))
+    strip_rows = options.strip_rows or max(h, 1)
+    strip_count = -(-h // strip_rows)
+
+    def sampler():
+        samples = sample_mode_strips(img, mode, options.flatten, palette_spec=palette_spec)
+        if spec.active:
+            samples = [filters.filter_strip(sample, filter_width, spec, options.filter, channels)
+                       for sample in samples]
+        return samples
+
+    with timer.stage("select"):
+        codec, level = select_codec(options, uncompressed_size, sampler)
+    strip_lengths = []
+    strip_crcs = []
+
+    previews = [preview.tobytes() for preview in pyramid]
+    if previews and codec.codec_id != compression.NONE:
+        with timer.stage("pyramid"):
+            previews = [codec.compress(data, level) for data in previews]
+
+    def header():
+        # Placeholders keep the header size fixed until the strips are written
+        lengths = strip_lengths or [0] * strip_count
+        crcs = [zlib.crc32(data) for data in previews] + (strip_crcs or [0] * strip_count)
+        records = [(TAG_STRIPS, encode_strip_table(strip_rows, lengths))]
+        if spec.active:
+            records.append((TAG_FILTER, spec.pack()))
+        if pyramid:
+            records.append((TAG_PYRAMID, encode_pyramid_table(
+                [(preview.width, preview.height, len(data)) for preview, data in zip(pyramid, previews)])))
+        if mode != "RGB":
+            records.append((TAG_MODE, encode_mode(mode)))
+        if palette_spec is not None:
+            records.append((TAG_PALETTE, palette_spec.pack()))
+        return encode_header_v2(w, h, original_w, original_h, codec.codec_id, uncompressed_size, records, crcs)
+
+    out_file = os.path.join(out_dir, encoded_wav_name(image_file))
+    with StreamingWavWriter(out_file) as writer:
+        writer.write(header())
+        for data in previews:
+            writer.write(data)
+
+        # One compressor per stored strip
+        for top in range(0, h, strip_rows):
+            compressor = codec.compressor(level)
+            strip_filter = filters.StripFilter(spec, filter_width, options.filter, channels) if spec.active else None
+            length = 0
+            crc = 0
+            chunk_rows = spec.block_rows if spec.active else STRIP_ROWS
+            strips = iter_mode_strips(img, mode, options.flatten, chunk_rows, top, min(top + strip_rows, h),
+                                      palette_spec)
+            for rows in timer.timed_iter("convert", strips):
+                if strip_filter is not None:
+                    with timer.stage("filter"):
+                        rows = strip_filter.filter(rows)
+                with timer.stage("compress"):
+                    data = compressor.compress(rows)
+                with timer.stage("write"):
+                    writer.write(data)
+                with timer.stage("checksum"):
+                    crc = zlib.crc32(data, crc)
+                length += len(data)
+            with timer.stage("compress"):
+                data = compressor.flush()
+            with timer.stage("write"):
+                writer.write(data)
+            with timer.stage("checksum"):
+                strip_crcs.append(zlib.crc32(data, crc))
+            strip_lengths.append(length + len(data))
+
+    with timer.stage("write"), open(out_file, 'r+b') as f:
+        data_offset, _ = find_data_chunk(f.read(64))
+        f.seek(data_offset)
+        f.write(header())
+
+    stored_size = sum(strip_lengths)
+    return EncodeResult(
+        source=image_file,
+        out_file=out_file,
+        original_size=(original_w, original_h),
+        encoded_size=(w, h),
+        uncompressed_size=uncompressed_size,
+        compressed_size=stored_size if codec.codec_id != compression.NONE else None,
+        file_size=os.path.getsize(out_file),
+        codec=codec.name,
+        codec_auto=options.enable_compression and options.codec == compression.AUTO,
+        filter=spec.name,
+        mode=mode,
+        palette_colors=palette_spec.count if palette_spec else None,
+        index_bits=palette_spec.bits if palette_spec else None,
+        level=level if codec.codec_id != compression.NONE else None,
+        level_auto=options.enable_compression and options.compression_level == compression.AUTO,
+        timings=timer.stages,
+    )
+
+
+# ---------- PNG WRITER ----------
+class StreamingPngWriter:
+    """
+    Minimal 8-bit L/LA/RGB/RGBA PNG writer fed one row strip at a time
+    Rows are stored with filter type 0 and deflated incrementally.
+    """
+
+    def __init__(self, out_file, width, height, compress_level=6, channels=3):
+        self.file = open(out_file, 'wb')
+        self.row_bytes = width * channels
+        self.compressor = zlib.compressobj(compress_level)
+        color_type = filters.CHANNEL_MODES[channels][1]
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self.file.write(filters.png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)))
+
+    def write_rows(self, data):
+        raw = bytearray()
+        for offset in range(0, len(data), self.row_bytes):
+            raw.append(0)
+            raw += data[offset:offset + self.row_bytes]
+        self._write_idat(self.compressor.compress(raw))
+
+    def _write_idat(self, data):
+        if data:
+            self.file.write(filters.png_chunk(b'IDAT', data))
+
+    def close(self):
+        self._write_idat(self.compressor.flush())
+        self.file.write(filters.png_chunk(b'IEND', b''))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------- DECODING ----------
+def iter_pixel_strips(wav_file, strip_rows=STRIP_ROWS):
+    """
+    Yield the payload info, then (strip, valid_bytes) pairs of whole pixel rows
+    Missing trailing pixels are returned as black, trailing padding is dropped.
+    """
+    with WavPayload(wav_file) as payload:
+        data = payload.data
+        info = read_payload_info(data)
+        yield info
+
+        if info.strip_count > 1:
+            strips = _iter_stored_strips(data, info)
+        else:
+            strips = _iter_stream_strips(data, info, strip_rows)
+        try:
+            yield from strips
+        finally:
+            strips.close()
+            del data
+
+
+def _iter_stored_strips(data, info):
+    # Versioned payloads: every stored strip decompresses on its own
+    codec = compression.get_codec(info.codec)
+    spec = info.filter
+    filter_width, channels = info.filter_layout
+    for index, (offset, length) in enumerate(zip(info.strip_offsets, info.strip_lengths)):
+        strip = codec.decompress(data[offset:offset + length])
+        rows = min(info.strip_rows, info.height - index * info.strip_rows)
+        size = rows * info.row_bytes
+        if spec.active:
+            stored = spec.stored_size(filter_width, rows, channels)
+            valid = min(len(strip), stored) * size // max(stored, 1)
+            yield filters.unfilter_strip(strip, filter_width, rows, spec, channels), valid
+        else:
+            yield strip[:size] + bytes(size - len(strip)), min(len(strip), size)
+
+
+def _iter_stream_strips(data, info, strip_rows):
+    # Single stream: decompress in capped steps so a highly compressible image cannot balloon
+    decompressor = compression.get_codec(info.codec).decompressor()
+    spec = info.filter
+    filter_width, channels = info.filter_layout
+    unfilter = filters.StripUnfilter(spec, filter_width, channels) if spec.active else None
+    rows_per_piece = spec.block_rows if spec.active else strip_rows
+    remaining = info.height
+    start = info.strip_offsets[0]
+    pending = bytearray()
+
+    def piece_size():
+        rows = min(rows_per_piece, remaining)
+        return rows, spec.stored_size(filter_width, rows, channels) if spec.active else rows * info.row_bytes
+
+    def finish(piece, rows, size):
+        # Stored bytes of `rows` rows -> (pixel bytes, valid pixel bytes)
+        pixel_size = rows * info.row_bytes
+        valid = len(piece) * pixel_size // max(size, 1)
+        piece += bytes(size - len(piece))
+        if unfilter is not None:
+            piece = unfilter.unfilter(piece, rows)
+        return piece, valid
+
+    for offset in range(start, len(data), READ_CHUNK):
+        for piece in decompressor.feed(data[offset:offset + READ_CHUNK], info.row_bytes * strip_rows):
+            pending += piece
+            rows, size = piece_size()
+            while remaining > 0 and len(pending) >= size:
+                yield finish(bytes(pending[:size]), rows, size)
+                del pending[:size]
+                remaining -= rows
+                rows, size = piece_size()
+        if remaining == 0:
+            return
+
+    pending += decompressor.flush()
+    while remaining > 0:
+        rows, size = piece_size()
+        piece = bytes(pending[:size])
+        del pending[:size]
+        yield finish(piece, rows, size)
+        remaining -= rows
+
+
+def stream_decode_wav_file(wav_file, out_dir, strip_rows=STRIP_ROWS, profile=OutputProfile()):
+    """
+    Strip-streaming equivalent of wav_codec.decode_wav_file
+    Images that need no resize are written straight to PNG, PPM or .npy
+    without ever being assembled in memory. Palette indices are expanded
+    strip by strip. Animations are decoded by wav_codec.decode_wav_file.
+    """
+    timer = StageTimer()
+    strips = iter_pixel_strips(wav_file, strip_rows)
+    with timer.stage("read"):
+        info = next(strips)
+    if info.is_animated:
+        strips.close()
+        return decode_wav_file(wav_file, out_dir, profile=profile)
+    w, h = info.width, info.height
+    original_w, original_h = info.original_width, info.original_height
+
+    out_file = os.path.join(out_dir, decoded_image_name(wav_file, ext=profile.extension))
+    decompressed_size = 0
+    resize = profile.resize and (w, h) != (original_w, original_h)
+
+    def strip_image(strip):
+        rows = len(strip) // info.row_bytes
+        if info.palette is not None:
+            return palette.expand_indices(strip, w, rows, info.palette)
+        return Image.frombuffer(info.mode, (w, rows), strip, 'raw', info.mode, 0, 1)
+
+    # Unfiltering happens inside the strip iterator and is counted as decompression
+    if not resize and profile.format in STREAMABLE_FORMATS:
+        if profile.format == "png":
+            writer = StreamingPngWriter(out_file, w, h, profile.png_level, info.channels)
+        else:
+            writer = RawRowWriter(out_file, profile, w, h, info.mode)
+        with writer:
+            for strip, valid in timer.timed_iter("decompress", strips):
+                if info.palette is not None:
+                    with timer.stage("unpack"):
+                        strip = strip_image(strip).tobytes()
+                with timer.stage("save"):
+                    writer.write_rows(strip)
+                decompressed_size += valid
+        output_size = (w, h)
+    else:
+        img = Image.new(info.mode, (w, h))
+        top = 0
+        for strip, valid in timer.timed_iter("decompress", strips):
+            with timer.stage("unpack"):
+                strip = strip_image(strip)
+                img.paste(strip, (0, top))
+            top += strip.height
+            decompressed_size += valid
+        if resize:
+            with timer.stage("resize"):
+                img = img.resize((original_w, original_h), profile.resampler)
+        with timer.stage("save"):
+            save_image(img, out_file, profile)
+        output_size = img.size
+
+    return DecodeResult(
+        source=wav_file,
+        out_file=out_file,
+        original_size=(original_w, original_h),
+        encoded_size=(w, h),
+        is_compressed=info.is_compressed,
+        codec=info.codec_name,
+        stored_size=info.stored_size,
+        decompressed_size=decompressed_size,
+        pixel_count=decompressed_size * w // max(info.row_bytes, 1),
+        strip_count=info.strip_count,
+        filter=info.filter.name,
+        mode=info.mode,
+        palette_colors=info.palette.count if info.palette else None,
+        output_size=output_size,
+        timings=timer.stages,
+    )